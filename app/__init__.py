@@ -44,6 +44,9 @@ def create_app(config_name):
     from .admin import admin as admin_blueprint
     app.register_blueprint(admin_blueprint, url_prefix='/admin')
     
+    # 注册订单变更事件（维护每日汇总表、使导出缓存失效、提交后清理已删除的文件、登记待刷新的微信用户手机号）
+    from . import rollup, export_jobs, file_cleanup, wechat_users
+    
     # 注册上下文处理器
     from .context_processors import inject_permissions
     app.context_processor(inject_permissions)
@@ -84,17 +87,31 @@ def create_app(config_name):
         from flask import g
         import time
         g.start_time = time.time()
+        g.sql_count = 0
+    
+    # 统计每个请求执行的SQL语句数
+    def count_sql_statement(conn, cursor, statement, parameters, context, executemany):
+        from flask import g, has_request_context
+        if has_request_context():
+            g.sql_count = g.get('sql_count', 0) + 1
+    
+    from sqlalchemy import event
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_sql_statement)
     
     @app.after_request
     def after_request(response):
         """请求后处理"""
         from flask import g
+        sql_count = g.get('sql_count', 0)
+        response.headers['X-SQL-Count'] = str(sql_count)
         if hasattr(g, 'start_time'):
             import time
             duration = time.time() - g.start_time
             # 记录慢请求
             if duration > 1.0:  # 超过1秒的请求
-                app.logger.warning(f"慢请求: {request.endpoint} 耗时 {duration:.2f}秒")
+                app.logger.warning(f"慢请求: {request.endpoint} 耗时 {duration:.2f}秒，SQL语句 {sql_count} 条")
+        app.logger.debug(f"{request.endpoint}: SQL语句 {sql_count} 条")
         return response
     
     return app
\ No newline at end of file
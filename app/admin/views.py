@@ -5,69 +5,25 @@ from datetime import datetime, timedelta
 import json
 from . import admin
 from .. import db, csrf
-from ..models import User, Role, OrderField, Order, Permission, OrderType, WechatUser
+from ..models import User, Role, OrderField, Order, Permission, OrderType, WechatUser, DailyOrderRollup
 from ..forms import UserForm, OrderFieldForm, DateRangeForm, WechatUserForm
 from ..decorators import admin_required, permission_required
+from ..search import search_condition
+from ..rollup import daily_user_rollup
+from ..order_batch import delete_orders
+from ..blob_store import release_files
+from ..export_jobs import mark_orders_changed
+from ..wechat_users import collect_from_orders, refresh_from_orders
 
 @admin.route('/collect-wechat-users', methods=['POST'])
 @admin_required
 def collect_wechat_users():
     """从订单中收集微信用户信息（基于手机号管理）"""
     try:
-        # 获取所有有手机号的订单
-        orders = Order.query.filter(Order.phone.isnot(None), Order.phone != '').all()
-        
-        # 按手机号分组
-        phone_orders = {}
-        for order in orders:
-            if order.phone.strip():  # 确保手机号不为空字符串
-                if order.phone not in phone_orders:
-                    phone_orders[order.phone] = []
-                phone_orders[order.phone].append(order)
-        
-        created_count = 0
-        updated_count = 0
-        
-        for phone, orders_list in phone_orders.items():
-            # 检查是否已存在该手机号的微信用户
-            existing_user = WechatUser.query.filter_by(phone=phone).first()
-            
-            # 从订单中获取最佳的微信名和微信号
-            best_wechat_name = None
-            best_wechat_id = None
-            
-            for order in orders_list:
-                if order.wechat_name and order.wechat_name.strip() and not best_wechat_name:
-                    best_wechat_name = order.wechat_name.strip()
-                if order.wechat_id and order.wechat_id.strip() and not best_wechat_id:
-                    best_wechat_id = order.wechat_id.strip()
-            
-            if existing_user:
-                # 更新现有用户信息
-                updated = False
-                if best_wechat_name and (not existing_user.wechat_name or not existing_user.wechat_name.strip()):
-                    existing_user.wechat_name = best_wechat_name
-                    updated = True
-                if best_wechat_id and (not existing_user.wechat_id or not existing_user.wechat_id.strip()):
-                    existing_user.wechat_id = best_wechat_id
-                    updated = True
-                
-                if updated:
-                    existing_user.update_time = datetime.utcnow()
-                    updated_count += 1
-            else:
-                # 只有当至少有微信名或微信号时才创建新用户
-                if best_wechat_name or best_wechat_id:
-                    new_user = WechatUser(
-                        wechat_name=best_wechat_name,
-                        wechat_id=best_wechat_id,
-                        phone=phone
-                    )
-                    db.session.add(new_user)
-                    created_count += 1
-        
+        # 一条分组查询 + 一条 upsert：新手机号新增用户，已有用户只补全空的微信名、微信号
+        result = collect_from_orders()
         db.session.commit()
-        flash(f'成功收集微信用户信息：新增 {created_count} 个，更新 {updated_count} 个', 'success')
+        flash(f'成功收集微信用户信息：新增 {result.created} 个，更新 {result.updated} 个', 'success')
         
     except Exception as e:
         db.session.rollback()
@@ -78,52 +34,19 @@ def collect_wechat_users():
 @admin.route('/refresh-wechat-users', methods=['POST'])
 @admin_required
 def refresh_wechat_users():
-    """刷新所有微信用户信息（基于手机号管理）"""
+    """刷新微信用户信息（基于手机号管理），mode=incremental 时只刷新订单有变更的手机号"""
     try:
-        # 获取所有微信用户
-        wechat_users = WechatUser.query.all()
-        updated_count = 0
-        cleaned_count = 0
-        
-        for wechat_user in wechat_users:
-            # 检查是否为无效用户（手机号和微信号都为空）
-            if (not wechat_user.phone or not wechat_user.phone.strip()) and \
-               (not wechat_user.wechat_id or not wechat_user.wechat_id.strip()):
-                # 删除无效用户
-                db.session.delete(wechat_user)
-                cleaned_count += 1
-                continue
-            
-            # 根据手机号查找最新的订单信息
-            latest_order = None
-            if wechat_user.phone and wechat_user.phone.strip():
-                latest_order = Order.query.filter_by(phone=wechat_user.phone).order_by(Order.create_time.desc()).first()
-            
-            if latest_order:
-                updated = False
-                # 更新微信名（如果订单中有更新的信息）
-                if latest_order.wechat_name and latest_order.wechat_name != wechat_user.wechat_name:
-                    wechat_user.wechat_name = latest_order.wechat_name
-                    updated = True
-                # 更新微信号（如果用户没有微信号但订单中有）
-                if latest_order.wechat_id and (not wechat_user.wechat_id or not wechat_user.wechat_id.strip()):
-                    wechat_user.wechat_id = latest_order.wechat_id
-                    updated = True
-                # 更新手机号（如果用户没有手机号但订单中有）
-                if latest_order.phone and (not wechat_user.phone or not wechat_user.phone.strip()):
-                    wechat_user.phone = latest_order.phone
-                    updated = True
-                
-                if updated:
-                    wechat_user.update_time = datetime.utcnow()
-                    updated_count += 1
-        
+        # 窗口函数取每个手机号的最新订单，集合式 UPDATE / DELETE 写回
+        incremental = request.form.get('mode') == 'incremental'
+        result = refresh_from_orders(incremental=incremental)
         db.session.commit()
         
-        if cleaned_count > 0:
-            flash(f'成功刷新了 {updated_count} 个微信用户的信息，清理了 {cleaned_count} 个无效用户', 'success')
-        else:
-            flash(f'成功刷新了 {updated_count} 个微信用户的信息', 'success')
+        message = f'成功刷新了 {result.updated} 个微信用户的信息'
+        if incremental:
+            message = f'检查了 {result.phones} 个有变更的手机号，' + message
+        if result.cleaned > 0:
+            message += f'，清理了 {result.cleaned} 个无效用户'
+        flash(message, 'success')
         
     except Exception as e:
         db.session.rollback()
@@ -272,46 +195,46 @@ def statistics():
         form.start_date.data = start_date
         form.end_date.data = end_date
     
-    # 查询日期范围内的订单
-    orders = Order.query.filter(
-        func.date(Order.completion_time) >= start_date,
-        func.date(Order.completion_time) <= end_date
-    ).all()
+    # 从每日汇总表读取（按 日期 × 用户 聚合），不再逐条加载订单
+    rows = daily_user_rollup(start_date, end_date)
     
-    # 按日期分组统计
+    # 按日期、用户分组统计
     daily_stats = {}
-    for order in orders:
-        date_str = order.completion_time.strftime('%Y-%m-%d')
+    user_stats = {}
+    total_stats = {
+        'total_orders': 0,
+        'total_amount': 0,
+        'total_quantity': 0,
+        'avg_amount': 0
+    }
+    for day, user_id, username, count, amount, quantity in rows:
+        date_str = day.strftime('%Y-%m-%d')
         if date_str not in daily_stats:
             daily_stats[date_str] = {
                 'count': 0,
                 'total_amount': 0,
                 'total_quantity': 0
             }
-        daily_stats[date_str]['count'] += 1
-        daily_stats[date_str]['total_amount'] += (order.amount or 0)
-        daily_stats[date_str]['total_quantity'] += order.quantity
-    
-    # 计算总计
-    total_stats = {
-        'total_orders': len(orders),
-        'total_amount': sum((order.amount or 0) for order in orders),
-        'total_quantity': sum(order.quantity for order in orders),
-        'avg_amount': sum((order.amount or 0) for order in orders) / len(orders) if orders else 0
-    }
-    
-    # 按用户分组统计
-    user_stats = {}
-    for order in orders:
-        user_id = order.user_id
-        username = order.creator.username if order.creator else f"用户ID: {user_id}"
+        daily_stats[date_str]['count'] += count
+        daily_stats[date_str]['total_amount'] += amount
+        daily_stats[date_str]['total_quantity'] += quantity
+        
+        username = username or f"用户ID: {user_id or None}"
         if username not in user_stats:
             user_stats[username] = {
                 'count': 0,
                 'total_amount': 0
             }
-        user_stats[username]['count'] += 1
-        user_stats[username]['total_amount'] += (order.amount or 0)
+        user_stats[username]['count'] += count
+        user_stats[username]['total_amount'] += amount
+        
+        total_stats['total_orders'] += count
+        total_stats['total_amount'] += amount
+        total_stats['total_quantity'] += quantity
+    
+    # 计算总计
+    if total_stats['total_orders']:
+        total_stats['avg_amount'] = total_stats['total_amount'] / total_stats['total_orders']
     
     # 准备图表数据
     dates = []
@@ -360,23 +283,22 @@ def api_daily_statistics():
             end_date = datetime.now().date()
             start_date = end_date - timedelta(days=29)
         
-        # 查询日期范围内的订单
-        orders = Order.query.filter(
-            func.date(Order.completion_time) >= start_date,
-            func.date(Order.completion_time) <= end_date
-        ).all()
+        # 从每日汇总表按日期聚合
+        rows = db.session.query(
+            DailyOrderRollup.day,
+            func.sum(DailyOrderRollup.order_count),
+            func.sum(DailyOrderRollup.total_amount)
+        ).filter(
+            DailyOrderRollup.day >= start_date,
+            DailyOrderRollup.day <= end_date
+        ).group_by(DailyOrderRollup.day).all()
         
-        # 按日期分组统计
         daily_stats = {}
-        for order in orders:
-            date_str = order.completion_time.strftime('%Y-%m-%d')
-            if date_str not in daily_stats:
-                daily_stats[date_str] = {
-                    'count': 0,
-                    'total_amount': 0
-                }
-            daily_stats[date_str]['count'] += 1
-            daily_stats[date_str]['total_amount'] += (order.amount or 0)
+        for day, count, amount in rows:
+            daily_stats[day.strftime('%Y-%m-%d')] = {
+                'count': count,
+                'total_amount': amount
+            }
         
         # 确保日期范围内的每一天都有数据
         result = []
@@ -492,39 +414,50 @@ def delete_order_type(id):
     flash('订单类型已删除')
     return redirect(url_for('admin.order_type_list'))
 
+# 微信用户列表排序：参数 -> (名称, 降序排列的列)
+WECHAT_USER_SORTS = {
+    'recent': ('最近添加', WechatUser.create_time),
+    'spend': ('消费金额', WechatUser.total_amount),
+    'orders': ('订单数量', WechatUser.total_orders),
+    'active': ('最近下单', WechatUser.last_order_time),
+    'unsettled': ('未结算金额', WechatUser.unsettled_amount),
+}
+
 @admin.route('/wechat-users')
 @admin_required
 def wechat_user_list():
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
+    sort = request.args.get('sort', 'recent')
+    if sort not in WECHAT_USER_SORTS:
+        sort = 'recent'
+    min_amount = request.args.get('min_amount', type=float)
+    active_days = request.args.get('active_days', type=int)
     
     query = WechatUser.query
     if search:
         query = query.filter(
-            db.or_(
-                WechatUser.wechat_name.contains(search),
-                WechatUser.wechat_id.contains(search),
-                WechatUser.phone.contains(search)
-            )
+            search_condition(WechatUser, search, ['wechat_name', 'wechat_id', 'phone'])
         )
-    
-    wechat_users = query.order_by(WechatUser.create_time.desc()).paginate(
+    # 按冗余的订单统计筛选和排序（total_amount、last_order_time 有索引）
+    if min_amount is not None:
+        query = query.filter(WechatUser.total_amount >= min_amount)
+    if active_days:
+        query = query.filter(WechatUser.last_order_time >= datetime.utcnow() - timedelta(days=active_days))
+    
+    column = WECHAT_USER_SORTS[sort][1]
+    wechat_users = query.order_by(column.desc(), WechatUser.id.desc()).paginate(
         page=page, per_page=20, error_out=False
     )
     
-    # 检查是否有可收集的微信用户（基于手机号）
-    uncollected_count = Order.query.filter(
-        Order.phone.isnot(None),
-        Order.phone != '',
-        ~Order.phone.in_(
-            db.session.query(WechatUser.phone).filter(WechatUser.phone.isnot(None))
-        )
-    ).count()
-    
+    # 订单写入时已同步微信用户，不再每次统计未收集的订单
     return render_template('admin/wechat_user_list.html', 
                          wechat_users=wechat_users, 
                          search=search,
-                         uncollected_count=uncollected_count)
+                         sort=sort,
+                         sorts=WECHAT_USER_SORTS,
+                         min_amount=min_amount,
+                         active_days=active_days)
 
 @admin.route('/wechat-user/<int:id>')
 @admin_required
@@ -588,18 +521,20 @@ def edit_wechat_user(id):
             wechat_user.address = form.address.data if form.address.data else None
             wechat_user.notes = form.notes.data if form.notes.data else None
             
-            # 处理头像上传
+            # 处理头像上传（替换时释放原文件的引用）
             if form.avatar.data:
                 from ..main.views import save_image
-                avatar_path = save_image(form.avatar.data, 'avatars')
+                avatar_path = save_image(form.avatar.data)
                 if avatar_path:
+                    release_files([wechat_user.avatar])
                     wechat_user.avatar = avatar_path
             
             # 处理付款码上传
             if form.payment_qr_code.data:
                 from ..main.views import save_image
-                qr_path = save_image(form.payment_qr_code.data, 'qr_codes')
+                qr_path = save_image(form.payment_qr_code.data)
                 if qr_path:
+                    release_files([wechat_user.payment_qr_code])
                     wechat_user.payment_qr_code = qr_path
             
             wechat_user.update_time = datetime.utcnow()
@@ -628,17 +563,11 @@ def edit_wechat_user(id):
 def delete_wechat_user(id):
     wechat_user = WechatUser.query.get_or_404(id)
     
-    # 获取关联的订单（优先根据手机号，其次根据微信号）
-    related_orders = []
-    if wechat_user.phone and wechat_user.phone.strip():
-        related_orders.extend(Order.query.filter_by(phone=wechat_user.phone).all())
-    if wechat_user.wechat_id and wechat_user.wechat_id.strip():
-        # 避免重复添加同一订单
-        wechat_orders = Order.query.filter_by(wechat_id=wechat_user.wechat_id).all()
-        for order in wechat_orders:
-            if order not in related_orders:
-                related_orders.append(order)
-    orders_count = len(related_orders)
+    # 获取关联的订单ID（按 wechat_user_id 索引查询，不加载订单对象）
+    related_ids = [order_id for (order_id,) in db.session.query(Order.id).filter(
+        Order.wechat_user_id == wechat_user.id
+    )]
+    orders_count = len(related_ids)
     
     # 检查是否确认删除关联订单
     force_delete = request.form.get('force_delete') == 'true'
@@ -653,18 +582,15 @@ def delete_wechat_user(id):
         })
     
     try:
-        # 删除关联的订单图片
-        for order in related_orders:
-            for image in order.images:
-                db.session.delete(image)
-        
-        # 删除关联的订单
-        for order in related_orders:
-            db.session.delete(order)
+        # 分块删除关联的订单及图片记录，图片文件在提交后由后台清理
+        deleted = delete_orders(related_ids)
         
-        # 删除微信用户
+        # 删除微信用户（释放头像和付款码文件的引用）
+        release_files([wechat_user.avatar, wechat_user.payment_qr_code])
         db.session.delete(wechat_user)
         db.session.commit()
+        if deleted.deleted:
+            mark_orders_changed()
         
         if orders_count > 0:
             flash(f'微信用户及其 {orders_count} 个关联订单已删除', 'success')
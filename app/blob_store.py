@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+"""
+内容寻址存储模块
+上传文件边写入边计算SHA-256，相同内容只保存一份，按哈希前缀分目录存放（blobs/ab/cd/<哈希>.<扩展名>）；
+upload_blobs 表记录每个文件被引用的次数，最后一个引用释放后才删除文件
+"""
+
+import hashlib
+import os
+import uuid
+from collections import Counter
+from sqlalchemy import select, update, delete, bindparam, func, union, union_all
+from . import db
+from .models import UploadBlob
+from .file_cleanup import queue_file_deletions
+from .thumbnails import ensure_thumbnail, remove_thumbnail
+from .upload_gc import REFERENCE_COLUMNS, normalize_upload_path, reference_values, referenced_paths
+from .image_processing import iter_transcoded, TRANSCODE_BATCH_SIZE
+
+
+BLOB_DIR = 'blobs'
+
+# 写入中的临时文件目录（相对上传目录）
+BLOB_TMP_DIR = f'{BLOB_DIR}/tmp'
+
+# 计算哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 64 * 1024
+
+# 去重迁移每批处理的路径数
+DEDUPE_BATCH_SIZE = 200
+
+
+def blob_relative_path(digest, ext):
+    """按哈希前两级分目录的相对路径"""
+    name = f'{digest}.{ext}' if ext else digest
+    return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{name}'
+
+
+def is_blob_path(path):
+    return bool(path) and path.startswith(f'{BLOB_DIR}/')
+
+
+def _write_temp(app, stream):
+    """将文件流写入临时文件并计算哈希，返回 (临时路径, 哈希, 字节数)"""
+    tmp_dir = os.path.join(app.config['UPLOAD_FOLDER'], BLOB_TMP_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            while True:
+                chunk = stream.read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def file_digest(path):
+    """流式计算已有文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _place(app, tmp_path, relative_path):
+    """将临时文件移动到哈希路径；已存在相同内容的文件时丢弃临时文件"""
+    dest = os.path.join(app.config['UPLOAD_FOLDER'], relative_path)
+    if os.path.exists(dest):
+        os.remove(tmp_path)
+        return
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.replace(tmp_path, dest)
+
+
+def acquire_blob(digest, relative_path, size, count=1, processed=False):
+    """
+    在当前事务中登记文件的引用（不存在时新建记录）
+
+    Args:
+        processed: 文件是否为压缩后的图片（已压缩的不再重复压缩）
+
+    Returns:
+        str: 该内容已登记的相对路径（相同内容以首次保存的路径为准）
+    """
+    table = UploadBlob.__table__
+    row = {'digest': digest, 'path': relative_path, 'size': size, 'ref_count': count, 'processed': processed}
+    increments = {'ref_count': table.c.ref_count + count}
+    if processed:
+        increments['processed'] = True
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table).values(**row)
+        db.session.execute(stmt.on_conflict_do_update(index_elements=['digest'], set_=increments))
+    elif dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(table).values(**row)
+        db.session.execute(stmt.on_duplicate_key_update(**increments))
+    else:
+        result = db.session.execute(table.update().where(table.c.digest == digest).values(**increments))
+        if result.rowcount == 0:
+            db.session.execute(table.insert().values(**row))
+    return db.session.execute(select(table.c.path).where(table.c.digest == digest)).scalar()
+
+
+def store_upload(app, stream, ext, processed=False):
+    """
+    保存上传文件并登记一次引用（调用方提交事务）
+
+    Args:
+        app: Flask 应用对象
+        stream: 已校验的文件流
+        ext: 文件扩展名
+        processed: 是否为已压缩的图片
+
+    Returns:
+        str: 相对上传目录的路径，用于存储到数据库
+    """
+    tmp_path, digest, size = _write_temp(app, stream)
+    try:
+        relative_path = acquire_blob(digest, blob_relative_path(digest, ext), size, processed=processed)
+        _place(app, tmp_path, relative_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    ensure_thumbnail(app, relative_path)
+    return relative_path
+
+
+def release_files(paths):
+    """
+    在当前事务中释放文件引用，提交后删除不再被引用的文件
+
+    内容寻址的文件引用计数减一，归零时删除记录并登记删除文件；
+    未登记的旧文件（去重迁移前上传的）直接登记删除。
+
+    Args:
+        paths: 数据库中存储的路径（可重复，每个元素代表一次引用）
+
+    Returns:
+        int: 登记删除的文件数
+    """
+    counts = Counter(normalize_upload_path(path) for path in paths if path)
+    counts.pop(None, None)
+    if not counts:
+        return 0
+
+    blob_paths = [path for path in counts if is_blob_path(path)]
+    legacy = [path for path in counts if not is_blob_path(path)]
+    released = []
+    if blob_paths:
+        table = UploadBlob.__table__
+        db.session.execute(
+            table.update().where(table.c.path == bindparam('blob_path')).values(
+                ref_count=table.c.ref_count - bindparam('released')
+            ),
+            [{'blob_path': path, 'released': counts[path]} for path in blob_paths]
+        )
+        released = [path for (path,) in db.session.execute(select(table.c.path).where(
+            table.c.path.in_(blob_paths), table.c.ref_count <= 0
+        ))]
+        if released:
+            db.session.execute(delete(table).where(table.c.path.in_(released)))
+        # 引用计数表中没有记录的内容寻址路径按旧文件处理
+        known = set(db.session.execute(select(table.c.path).where(table.c.path.in_(blob_paths))).scalars())
+        legacy.extend(path for path in blob_paths if path not in known and path not in released)
+    return queue_file_deletions(released + legacy)
+
+
+def _reference_counts():
+    """按路径统计三个引用字段中的引用次数"""
+    selects = [
+        select(column.label('path')).where(column.isnot(None), column != '')
+        for column in REFERENCE_COLUMNS
+    ]
+    refs = union_all(*selects).subquery()
+    return select(refs.c.path, func.count().label('refs')).group_by(refs.c.path)
+
+
+def recount_blobs():
+    """
+    按实际引用重算引用计数，不再被引用的记录连同文件一并删除（调用方提交事务）
+
+    Returns:
+        int: 计数被修正的记录数
+    """
+    counts = {}
+    for path, refs in db.session.execute(_reference_counts()):
+        path = normalize_upload_path(path)
+        if is_blob_path(path):
+            counts[path] = counts.get(path, 0) + refs
+
+    fixed = 0
+    table = UploadBlob.__table__
+    stale = []
+    blobs = db.session.execute(select(table.c.id, table.c.path, table.c.ref_count)).all()
+    for blob_id, path, ref_count in blobs:
+        actual = counts.get(path, 0)
+        if actual == ref_count and actual:
+            continue
+        fixed += 1
+        if actual:
+            db.session.execute(table.update().where(table.c.id == blob_id).values(ref_count=actual))
+        else:
+            stale.append((blob_id, path))
+    if stale:
+        db.session.execute(delete(table).where(table.c.id.in_([blob_id for blob_id, _ in stale])))
+        queue_file_deletions([path for _, path in stale])
+    return fixed
+
+
+def _legacy_batch(after, batch_size):
+    """
+    按路径顺序取一批尚未迁移到内容寻址存储的引用路径（存储的原值，去重）
+
+    迁移后的引用改为 blobs/ 路径，不再出现在结果中；文件缺失而未迁移的路径由 after 跳过。
+    """
+    selects = [
+        select(column.label('path')).where(
+            column.isnot(None), column != '',
+            ~column.startswith(f'{BLOB_DIR}/'), ~column.startswith(f'uploads/{BLOB_DIR}/')
+        )
+        for column in REFERENCE_COLUMNS
+    ]
+    refs = union(*selects).subquery()
+    query = select(refs.c.path)
+    if after is not None:
+        query = query.where(refs.c.path > after)
+    return db.session.execute(query.order_by(refs.c.path).limit(batch_size)).scalars().all()
+
+
+def repoint_references(old_path, new_path):
+    """
+    将引用旧路径的记录改为新路径（所有规范化后等于旧路径的写法：反斜杠、uploads/ 前缀等）
+
+    Returns:
+        int: 改动的引用数
+    """
+    refs = 0
+    for column in REFERENCE_COLUMNS:
+        values = list(reference_values(column, [old_path]))
+        if not values:
+            continue
+        refs += db.session.execute(
+            update(column.class_).where(column.in_(values)).values({column.key: new_path})
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    return refs
+
+
+class DedupeReport:
+    """去重迁移的结果"""
+
+    def __init__(self):
+        self.scanned = 0
+        self.migrated = 0
+        self.duplicates = 0
+        self.missing = 0
+        self.bytes_saved = 0
+        self.recounted = 0
+        self.cursor = None
+        self.finished = False
+
+
+def _link_or_copy(source, dest, tmp_dir):
+    """将文件硬链接（跨文件系统时复制）到 dest，先写入临时文件再替换"""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        with open(source, 'rb') as src, open(tmp_path, 'wb') as dst:
+            while True:
+                chunk = src.read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                dst.write(chunk)
+    os.replace(tmp_path, dest)
+
+
+def _migrate_path(app, path, report):
+    """将一个旧路径的文件迁移到哈希路径并改写引用（调用方提交事务）"""
+    root = app.config['UPLOAD_FOLDER']
+    source = os.path.join(root, path)
+    if not os.path.isfile(source):
+        report.missing += 1
+        return
+    digest = file_digest(source)
+    ext = path.rsplit('.', 1)[-1].lower() if '.' in os.path.basename(path) else ''
+    size = os.path.getsize(source)
+
+    existing = db.session.execute(
+        select(UploadBlob.path).where(UploadBlob.digest == digest)
+    ).scalar()
+    new_path = existing or blob_relative_path(digest, ext)
+    if existing and os.path.exists(os.path.join(root, existing)):
+        report.duplicates += 1
+        report.bytes_saved += size
+    else:
+        _link_or_copy(source, os.path.join(root, new_path), os.path.join(root, BLOB_TMP_DIR))
+        report.migrated += 1
+
+    # 引用计数随改动的引用数增加，迁移期间删除订单也能正确释放
+    refs = repoint_references(path, new_path)
+    if refs:
+        acquire_blob(digest, new_path, size, count=refs)
+    elif not existing:
+        # 引用在迁移期间已被删除：新复制的文件同样登记删除（已被重新上传的由清理线程跳过）
+        queue_file_deletions([new_path])
+    # 确认没有任何写法的引用仍指向旧路径后才删除旧文件
+    if referenced_paths([path]):
+        app.logger.warning(f"迁移后仍有引用指向 {path}，保留旧文件")
+        return
+    queue_file_deletions([path])
+    remove_thumbnail(app, path)
+
+
+def dedupe_uploads(app, batch_size=DEDUPE_BATCH_SIZE, limit=None, start_after=None):
+    """
+    将旧的平铺目录（orders/、avatars/、qr_codes/）中的文件迁移到按哈希分目录的内容寻址存储并去重
+
+    可在服务运行时执行：按路径顺序分批，逐个计算哈希，硬链接（跨文件系统时复制）到哈希路径并改写引用，
+    每批单独提交；提交前页面仍按旧路径读取，旧文件在提交后由后台清理线程删除。
+    中途中断或指定 limit 时可重复执行，已迁移的路径不再出现在待迁移列表中；
+    文件缺失的路径会保留，可传入上次的 cursor 从其后继续。完整执行到末尾后按实际引用重算引用计数。
+
+    Args:
+        batch_size: 每批（每次提交）处理的路径数
+        limit: 本次最多处理的路径数，不指定时处理全部
+        start_after: 从该路径（存储的原值）之后继续
+
+    Returns:
+        DedupeReport
+    """
+    report = DedupeReport()
+    after = start_after
+    while limit is None or report.scanned < limit:
+        size = batch_size if limit is None else min(batch_size, limit - report.scanned)
+        batch = _legacy_batch(after, size)
+        if not batch:
+            report.finished = True
+            break
+        after = report.cursor = batch[-1]
+        report.scanned += len(batch)
+
+        # 同一文件可能以多种写法出现（uploads/ 前缀、反斜杠），改写引用时一并匹配
+        seen = set()
+        for value in batch:
+            path = normalize_upload_path(value)
+            if path and path not in seen:
+                seen.add(path)
+                _migrate_path(app, path, report)
+        db.session.commit()
+
+    if report.finished:
+        report.recounted = recount_blobs()
+        db.session.commit()
+    return report
+
+
+class TranscodeReport:
+    """批量压缩已有图片的结果"""
+
+    def __init__(self):
+        self.scanned = 0
+        self.converted = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_before - self.bytes_after
+
+
+def _replace_blob(app, blob, tmp_path, ext, report):
+    """以压缩后的文件替换原文件：引用改为新路径，原文件提交后删除"""
+    digest = file_digest(tmp_path)
+    size = os.path.getsize(tmp_path)
+    if digest == blob.digest:
+        os.remove(tmp_path)
+        blob.processed = True
+        report.unchanged += 1
+        return
+    new_path = db.session.execute(
+        select(UploadBlob.path).where(UploadBlob.digest == digest)
+    ).scalar() or blob_relative_path(digest, ext)
+    _place(app, tmp_path, new_path)
+
+    acquire_blob(digest, new_path, size, count=repoint_references(blob.path, new_path), processed=True)
+    db.session.delete(blob)
+    queue_file_deletions([blob.path])
+    remove_thumbnail(app, blob.path)
+    report.converted += 1
+    report.bytes_before += blob.size or 0
+    report.bytes_after += size
+
+
+def transcode_uploads(app, batch_size=TRANSCODE_BATCH_SIZE, limit=None):
+    """
+    在进程池中压缩内容寻址存储中尚未压缩的图片
+
+    每批并行转换后逐个替换文件并提交，原文件由后台清理线程删除；中断后可重复执行。
+
+    Args:
+        limit: 最多处理的文件数
+
+    Returns:
+        TranscodeReport
+    """
+    report = TranscodeReport()
+    root = app.config['UPLOAD_FOLDER']
+    tmp_dir = os.path.join(root, BLOB_TMP_DIR)
+    last_id = 0
+    while limit is None or report.scanned < limit:
+        size = batch_size if limit is None else min(batch_size, limit - report.scanned)
+        blobs = UploadBlob.query.filter(
+            UploadBlob.id > last_id,
+            UploadBlob.processed == False  # noqa: E712
+        ).order_by(UploadBlob.id).limit(size).all()
+        if not blobs:
+            break
+        last_id = blobs[-1].id
+        report.scanned += len(blobs)
+
+        by_id = {blob.id: blob for blob in blobs}
+        sources = {blob.id: os.path.join(root, blob.path) for blob in blobs}
+        for blob_id, result, error in iter_transcoded(app, sources, tmp_dir):
+            blob = by_id[blob_id]
+            if error is not None:
+                app.logger.warning(f"压缩图片失败 {blob.path}: {error}")
+                report.failed += 1
+            elif result is None:
+                blob.processed = True
+                report.unchanged += 1
+            else:
+                _replace_blob(app, blob, result[0], result[1], report)
+        db.session.commit()
+    return report
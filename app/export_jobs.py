@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+后台导出任务模块
+导出提交到工作线程池执行，客户端轮询进度后下载文件；
+相同筛选条件的导出结果按条件哈希缓存，订单相关数据提交变更后失效；
+任务记录和数据版本保存在数据库中，多个工作进程之间共享
+"""
+
+import csv
+import hashlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import chain
+from sqlalchemy import event, select
+from . import db
+from .models import Order, OrderType, OrderField, User, ExportJob, DataVersion
+from .order_stats import OrderAggregator
+from .exports import (custom_field_names, iter_export_rows, write_orders_xlsx,
+                      iter_raw_records, raw_field_names, ndjson_line)
+
+
+EXPORT_FORMATS = ('xlsx', 'csv', 'ndjson')
+
+EXPORT_MIMETYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# 变更后会影响导出内容的模型
+_TRACKED_MODELS = (Order, OrderType, OrderField, User)
+
+# 导出缓存对应的数据版本名（data_versions 表）
+DATA_VERSION_NAME = 'orders'
+
+_executor = None
+# 本进程正在执行的任务已写入的行数（完成后写入任务记录）
+_written = {}
+
+
+def job_progress(job):
+    """任务进度百分比；执行中的任务在执行它的进程内才能得到逐行进度"""
+    if job.status == 'done':
+        return 100
+    written = _written.get(job.id, job.written or 0)
+    if not job.total:
+        return 0
+    return min(99, int(written * 100 / job.total))
+
+
+def job_dict(job):
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'format': job.fmt,
+        'written': _written.get(job.id, job.written or 0),
+        'total': job.total,
+        'progress': job_progress(job),
+        'cached': bool(job.cached),
+        'error': job.error
+    }
+
+
+def data_version():
+    """当前的订单数据版本（所有工作进程共享）"""
+    return db.session.execute(
+        select(DataVersion.version).where(DataVersion.name == DATA_VERSION_NAME)
+    ).scalar() or 0
+
+
+def mark_orders_changed():
+    """
+    使已缓存的导出结果失效（在独立事务中递增共享的数据版本）
+
+    ORM flush 的变更由会话事件在提交后自动处理；绕过会话的批量SQL写入需在提交后调用。
+    """
+    table = DataVersion.__table__
+    with db.engine.begin() as connection:
+        bumped = connection.execute(
+            table.update().where(table.c.name == DATA_VERSION_NAME).values(version=table.c.version + 1)
+        ).rowcount
+        if not bumped:
+            connection.execute(table.insert().values(name=DATA_VERSION_NAME, version=1))
+
+
+def filter_key(order_filter, fmt):
+    """筛选条件（含权限限定后的用户）、格式及自定义字段定义的哈希"""
+    payload = {
+        'format': fmt,
+        'user_id': order_filter.user_id,
+        'start': order_filter.start_dt,
+        'end': order_filter.end_dt,
+        'search_type': order_filter.search_type,
+        'search_value': order_filter.search_value,
+        'custom_fields': custom_field_names(),
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def export_folder(app):
+    folder = app.config['EXPORT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config.get('EXPORT_WORKERS', 2),
+            thread_name_prefix='order-export'
+        )
+    return _executor
+
+
+def submit_export(app, owner_id, order_filter, fmt):
+    """
+    提交导出任务；已有相同条件且数据未变化的导出结果时直接返回已完成的任务
+
+    Args:
+        app: Flask 应用对象（工作线程中建立应用上下文）
+        owner_id: 提交任务的用户ID
+        order_filter: 已按权限限定的 OrderFilter
+        fmt: 导出格式（xlsx/csv/ndjson）
+
+    Returns:
+        ExportJob
+    """
+    key = filter_key(order_filter, fmt)
+    _prune(app)
+    version = data_version()
+    job = ExportJob(id=uuid.uuid4().hex, user_id=owner_id, key=key, fmt=fmt, version=version, status='pending')
+
+    # 任一进程生成的、当前数据版本的同条件导出文件
+    cached = ExportJob.query.filter_by(key=key, version=version, status='done') \
+        .order_by(ExportJob.finish_time.desc()).first()
+    if cached and cached.path and os.path.exists(cached.path):
+        job.path = cached.path
+        job.total = job.written = cached.written
+        job.status = 'done'
+        job.cached = True
+        job.finish_time = datetime.utcnow()
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    # 同一用户重复提交相同导出时复用进行中的任务
+    running = ExportJob.query.filter(
+        ExportJob.user_id == owner_id, ExportJob.key == key, ExportJob.version == version,
+        ExportJob.status.in_(['pending', 'running'])
+    ).first()
+    if running:
+        return running
+
+    db.session.add(job)
+    db.session.commit()
+    _get_executor(app).submit(_run_export, app, job.id, order_filter)
+    return job
+
+
+def get_job(job_id, owner_id):
+    """按ID获取任务，仅返回该用户提交的任务"""
+    job = db.session.get(ExportJob, job_id)
+    if job is None or job.user_id != owner_id:
+        return None
+    return job
+
+
+def _counted(rows, job):
+    for row in rows:
+        _written[job.id] += 1
+        yield row
+
+
+def _write_artifact(path, job, query, stats):
+    custom_fields = custom_field_names()
+    if job.fmt == 'xlsx':
+        write_orders_xlsx(path, _counted(iter_export_rows(query, custom_fields), job), custom_fields, stats)
+        return
+
+    names = raw_field_names(custom_fields)
+    records = _counted(iter_raw_records(query, custom_fields), job)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        if job.fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(names)
+            writer.writerows(records)
+        else:
+            for values in records:
+                f.write(ndjson_line(names, values))
+
+
+def _run_export(app, job_id, order_filter):
+    """在工作线程中生成导出文件，先写入临时文件，完成后再重命名为该数据版本的缓存文件"""
+    with app.app_context():
+        partial = None
+        _written[job_id] = 0
+        try:
+            job = db.session.get(ExportJob, job_id)
+            job.status = 'running'
+            stats = OrderAggregator(order_filter).headline()
+            job.total = stats['total_orders']
+            db.session.commit()
+
+            # 文件名带数据版本：先开始、后完成的旧任务不会覆盖新数据的文件，
+            # 旧版本的任务也不会被当作缓存（缓存按当前版本查找）
+            final = os.path.join(export_folder(app), f'{job.key}.{job.version}.{job.fmt}')
+            partial = f'{final}.{job.id}.part'
+            _write_artifact(partial, job, order_filter.apply(Order.query), stats)
+            os.replace(partial, final)
+
+            job.path = final
+            job.written = _written[job_id]
+            job.status = 'done'
+            job.finish_time = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            app.logger.exception(f"导出任务 {job_id} 失败")
+            db.session.rollback()
+            if partial and os.path.exists(partial):
+                os.remove(partial)
+            job = db.session.get(ExportJob, job_id)
+            if job is not None:
+                job.status = 'failed'
+                job.error = str(e)
+                job.finish_time = datetime.utcnow()
+                db.session.commit()
+        finally:
+            _written.pop(job_id, None)
+            db.session.remove()
+
+
+def _prune(app):
+    """
+    清理过期的任务记录和不再使用的导出文件
+
+    任务完成超过 EXPORT_JOB_TTL 后删除记录；导出文件在没有任何任务记录（任一进程提交的）指向、
+    且生成时间超过 EXPORT_JOB_TTL 时删除。
+    """
+    ttl = app.config.get('EXPORT_JOB_TTL', 3600)
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    ExportJob.query.filter(ExportJob.finish_time < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+
+    folder = app.config['EXPORT_FOLDER']
+    if not os.path.isdir(folder):
+        return
+    in_use = {path for (path,) in db.session.query(ExportJob.path).filter(ExportJob.path.isnot(None)).distinct()}
+    now = time.time()
+    for entry in os.scandir(folder):
+        if (entry.is_file() and entry.path not in in_use and not entry.name.endswith('.part')
+                and now - entry.stat().st_mtime > ttl):
+            os.remove(entry.path)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _flag_export_changes(session, flush_context):
+    if any(isinstance(obj, _TRACKED_MODELS) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['export_stale'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _expire_cached_exports(session):
+    if session.info.pop('export_stale', False):
+        mark_orders_changed()
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_export_changes(session, previous_transaction):
+    session.info.pop('export_stale', None)
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+订单导出模块
+以 openpyxl 只写模式 + 命名样式逐行写出工作簿，或以 CSV/NDJSON 逐行输出原始数据；
+分批读取订单，内存占用与导出行数无关
+"""
+
+import csv
+import io
+import json
+import os
+import tempfile
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
+from . import db
+from .models import Order, OrderType, OrderField, User
+
+
+# 每批从数据库读取的行数
+EXPORT_BATCH_SIZE = 1000
+
+# 读取文件并输出响应时的块大小
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# (列标题, 列宽, 对齐类型)
+EXPORT_COLUMNS = [
+    ('订单编号', 18, 'text'),
+    ('微信名', 12, 'text'),
+    ('微信号', 15, 'text'),
+    ('手机号', 15, 'text'),
+    ('订单信息', 25, 'text'),
+    ('完成时间', 12, 'date'),
+    ('数量', 8, 'number'),
+    ('金额', 12, 'number'),
+    ('备注', 20, 'text'),
+    ('订单类型', 12, 'text'),
+    ('状态', 10, 'text'),
+    ('创建时间', 18, 'date'),
+    ('创建用户', 12, 'text'),
+]
+
+
+def custom_field_names():
+    """按字段定义的顺序返回自定义字段名（导出列以字段定义为准，而非各行实际包含的键）"""
+    return [name for (name,) in db.session.query(OrderField.name).filter(
+        OrderField.is_default == False  # noqa: E712
+    ).order_by(OrderField.order, OrderField.id)]
+
+
+def _export_rows(query, batch_size=EXPORT_BATCH_SIZE):
+    """
+    只取导出需要的列（不构造ORM对象），按批次使用服务端游标流式读取
+
+    Returns:
+        Query: 每行依次为 RAW_COLUMNS 对应的值及 custom_fields JSON
+    """
+    return query.order_by(None).with_entities(
+        Order.id, Order.order_code, Order.wechat_name, Order.wechat_id, Order.phone, Order.order_info,
+        Order.completion_time, Order.quantity, Order.amount, Order.notes,
+        OrderType.name, Order.status, Order.create_time, User.username, Order.custom_fields
+    ).outerjoin(OrderType, OrderType.id == Order.order_type_id).outerjoin(
+        User, User.id == Order.user_id
+    ).order_by(Order.create_time.desc()).execution_options(
+        stream_results=True, yield_per=batch_size
+    )
+
+
+def iter_export_rows(query, custom_fields, batch_size=EXPORT_BATCH_SIZE):
+    """
+    分批读取订单并生成Excel导出行
+
+    Args:
+        query: 已应用筛选条件的 Order 查询
+        custom_fields: 自定义字段名列表
+
+    Yields:
+        list: 与 EXPORT_COLUMNS + 自定义字段对应的单元格值
+    """
+    for (_, order_code, wechat_name, wechat_id, phone, order_info, completion_time, quantity, amount,
+         notes, type_name, status, create_time, username, custom_json) in _export_rows(query, batch_size):
+        values = [
+            order_code,
+            wechat_name,
+            wechat_id,
+            phone,
+            order_info,
+            completion_time.strftime('%Y-%m-%d') if completion_time else '',
+            quantity,
+            amount,
+            notes,
+            type_name or '',
+            status,
+            create_time.strftime('%Y-%m-%d %H:%M:%S') if create_time else '',
+            username or ''
+        ]
+        if custom_fields:
+            values.extend(flatten_custom_fields(custom_json, custom_fields))
+        yield values
+
+
+# 原始数据导出（CSV/NDJSON）的字段名
+RAW_COLUMNS = [
+    'id', 'order_code', 'wechat_name', 'wechat_id', 'phone', 'order_info',
+    'completion_time', 'quantity', 'amount', 'notes',
+    'order_type', 'status', 'create_time', 'creator'
+]
+
+
+def raw_field_names(custom_fields):
+    """原始数据导出的完整字段名（自定义字段以 custom_ 前缀展开）"""
+    return RAW_COLUMNS + [f'custom_{name}' for name in custom_fields]
+
+
+def iter_raw_records(query, custom_fields, batch_size=EXPORT_BATCH_SIZE):
+    """
+    分批读取订单并生成原始数据记录（时间为ISO格式，自定义字段按字段定义展开）
+
+    Yields:
+        list: 与 raw_field_names(custom_fields) 对应的值
+    """
+    for row in _export_rows(query, batch_size):
+        values = list(row[:-1])
+        for index in (6, 12):
+            if values[index] is not None:
+                values[index] = values[index].isoformat()
+        values.extend(flatten_custom_fields(row[-1], custom_fields))
+        yield values
+
+
+def stream_orders_csv(query):
+    """逐行生成CSV文本，首行为字段名"""
+    custom_fields = custom_field_names()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(raw_field_names(custom_fields))
+    yield flush()
+    for values in iter_raw_records(query, custom_fields):
+        writer.writerow(values)
+        yield flush()
+
+
+def ndjson_line(names, values):
+    """单条记录的NDJSON文本（含换行符）"""
+    return json.dumps(dict(zip(names, values)), ensure_ascii=False) + '\n'
+
+
+def stream_orders_ndjson(query):
+    """逐行生成换行分隔的JSON记录"""
+    custom_fields = custom_field_names()
+    names = raw_field_names(custom_fields)
+    for values in iter_raw_records(query, custom_fields):
+        yield ndjson_line(names, values)
+
+
+def flatten_custom_fields(custom_json, custom_fields):
+    """将自定义字段JSON展开为与 custom_fields 顺序一致的值列表，缺失的字段为空"""
+    try:
+        fields = json.loads(custom_json) if custom_json else {}
+    except (json.JSONDecodeError, TypeError):
+        fields = {}
+    if not isinstance(fields, dict):
+        fields = {}
+    return [fields.get(name) for name in custom_fields]
+
+
+def _thin_border():
+    side = Side(style='thin', color='CCCCCC')
+    return Border(left=side, right=side, top=side, bottom=side)
+
+
+def _register_styles(wb):
+    """注册命名样式，所有单元格共享同一组样式对象"""
+    header_side = Side(style='medium', color='2F5597')
+    wb.add_named_style(NamedStyle(
+        name='export_header',
+        font=Font(bold=True, color="FFFFFF", size=12, name="微软雅黑"),
+        fill=PatternFill(start_color="2F5597", end_color="2F5597", fill_type="solid"),
+        alignment=Alignment(horizontal="center", vertical="center"),
+        border=Border(left=header_side, right=header_side, top=header_side, bottom=header_side)
+    ))
+    horizontal = {'text': 'left', 'number': 'right', 'date': 'center'}
+    fills = {
+        'light': PatternFill(start_color="F8F9FA", end_color="F8F9FA", fill_type="solid"),
+        'white': PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid"),
+    }
+    for kind, align in horizontal.items():
+        for shade, fill in fills.items():
+            wb.add_named_style(NamedStyle(
+                name=f'export_{kind}_{shade}',
+                font=Font(size=10, name="微软雅黑"),
+                fill=fill,
+                alignment=Alignment(horizontal=align, vertical="center"),
+                border=_thin_border()
+            ))
+
+
+def _styled_row(ws, values, kinds, row_number):
+    # 交替行颜色：偶数行浅灰，奇数行白色
+    shade = 'light' if row_number % 2 == 0 else 'white'
+    cells = []
+    for value, kind in zip(values, kinds):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = f'export_{kind}_{shade}'
+        cells.append(cell)
+    return cells
+
+
+def _header_row(ws, titles):
+    cells = []
+    for title in titles:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.style = 'export_header'
+        cells.append(cell)
+    return cells
+
+
+def write_orders_xlsx(fileobj, rows, custom_fields, stats):
+    """
+    以只写模式逐行写出订单工作簿
+
+    Args:
+        fileobj: 目标文件路径或文件对象
+        rows: 导出行迭代器（见 iter_export_rows）
+        custom_fields: 自定义字段名列表
+        stats: 汇总指标（total_orders, total_amount, total_quantity）
+    """
+    wb = Workbook(write_only=True)
+    _register_styles(wb)
+
+    # 订单数据sheet
+    ws1 = wb.create_sheet(title="订单数据")
+    titles = [title for title, _, _ in EXPORT_COLUMNS] + [f'自定义_{name}' for name in custom_fields]
+    kinds = [kind for _, _, kind in EXPORT_COLUMNS] + ['text'] * len(custom_fields)
+    for index, (_, width, _) in enumerate(EXPORT_COLUMNS):
+        ws1.column_dimensions[chr(65 + index)].width = width
+    ws1.append(_header_row(ws1, titles))
+    for row_number, values in enumerate(rows, 2):
+        ws1.append(_styled_row(ws1, values, kinds, row_number))
+
+    # 统计信息sheet
+    ws2 = wb.create_sheet(title="统计信息")
+    ws2.column_dimensions['A'].width = 15
+    ws2.column_dimensions['B'].width = 15
+    ws2.append(_header_row(ws2, ['统计项', '数值']))
+    total_orders = stats['total_orders']
+    total_amount = stats['total_amount'] or 0
+    stats_rows = [
+        ('总订单数', total_orders),
+        ('总金额', total_amount),
+        ('平均金额', round(total_amount / total_orders, 2) if total_orders else 0),
+        ('总数量', stats['total_quantity'] or 0),
+    ]
+    for row_number, values in enumerate(stats_rows, 2):
+        ws2.append(_styled_row(ws2, values, ['text', 'number'], row_number))
+
+    wb.save(fileobj)
+
+
+def stream_file(path, chunk_size=STREAM_CHUNK_SIZE, remove=True):
+    """分块读取文件用于流式响应，结束后删除临时文件"""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if remove and os.path.exists(path):
+            os.remove(path)
+
+
+def stream_orders_xlsx(query, stats):
+    """
+    生成订单导出工作簿后分块输出（并非边写边发送）
+
+    xlsx 为zip格式，必须写完全部行后才能封装：工作簿完整写入磁盘临时文件后才输出第一个字节，
+    耗时和临时磁盘占用随行数增长，只是内存占用固定。行数较多的导出由调用方转为后台任务（见 export_jobs）。
+    """
+    custom_fields = custom_field_names()
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        write_orders_xlsx(path, iter_export_rows(query, custom_fields), custom_fields, stats)
+    except Exception:
+        os.remove(path)
+        raise
+    yield from stream_file(path)
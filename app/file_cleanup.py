@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+上传文件清理模块
+删除记录时只在同一事务中登记待删除的文件路径，提交成功后由后台清理线程删除文件；
+事务回滚时登记随之撤销，文件不会被误删，请求耗时也不再依赖磁盘IO
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import event, select, insert, delete, update
+from . import db
+from .models import PendingFileDeletion, UploadBlob
+from .thumbnails import remove_thumbnail
+
+
+# 清理线程每批处理的文件数
+CLEANUP_BATCH_SIZE = 500
+
+# 删除失败达到该次数后不再重试（保留登记记录以便排查）
+MAX_DELETE_ATTEMPTS = 5
+
+_lock = threading.Lock()
+_executor = None
+_scheduled = False
+_rerun = False
+_drained = False
+
+
+def upload_path(app, relative_path):
+    """上传文件的相对路径转换为磁盘路径，路径不安全时返回 None"""
+    relative_path = (relative_path or '').replace('uploads/', '', 1)
+    if not relative_path or '..' in relative_path or relative_path.startswith('/'):
+        return None
+    return os.path.join(app.config['UPLOAD_FOLDER'], relative_path)
+
+
+def queue_file_deletions(paths):
+    """
+    在当前事务中登记待删除的上传文件，提交后唤醒清理线程
+
+    Args:
+        paths: 相对上传目录的文件路径（同 OrderImage.image_path）
+    """
+    rows = [{'path': path} for path in paths if path]
+    if not rows:
+        return 0
+    db.session.execute(insert(PendingFileDeletion), rows)
+    db.session.info['files_queued'] = True
+    return len(rows)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='file-cleanup')
+    return _executor
+
+
+def wake_janitor(app):
+    """唤醒清理线程；正在执行时标记为完成后再执行一轮"""
+    global _scheduled, _rerun
+    with _lock:
+        if _scheduled:
+            _rerun = True
+            return
+        _scheduled = True
+    _get_executor().submit(_run_janitor, app)
+
+
+def drain_on_start(app):
+    """进程启动后首次请求时清理之前遗留的登记（每个进程执行一次）"""
+    global _drained
+    if _drained:
+        return
+    _drained = True
+    wake_janitor(app)
+
+
+def purge_pending_files(app, batch_size=CLEANUP_BATCH_SIZE):
+    """
+    删除已登记的文件并移除登记记录（按ID分批，失败的记录累加重试次数）
+
+    Returns:
+        tuple: (已删除的文件数, 删除失败的文件数)
+    """
+    removed = failed = 0
+    last_id = 0
+    while True:
+        batch = db.session.query(PendingFileDeletion.id, PendingFileDeletion.path).filter(
+            PendingFileDeletion.id > last_id,
+            PendingFileDeletion.attempts < MAX_DELETE_ATTEMPTS
+        ).order_by(PendingFileDeletion.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1][0]
+
+        # 登记删除后又被重新上传（引用计数记录已重建）的内容寻址文件不删除
+        live = set(db.session.execute(select(UploadBlob.path).where(
+            UploadBlob.path.in_({path for _, path in batch})
+        )).scalars())
+
+        done, errors = [], []
+        for deletion_id, path in batch:
+            if path in live:
+                done.append(deletion_id)
+                continue
+            file_path = upload_path(app, path)
+            try:
+                if file_path and os.path.exists(file_path):
+                    os.remove(file_path)
+                    removed += 1
+                if file_path:
+                    remove_thumbnail(app, os.path.relpath(file_path, app.config['UPLOAD_FOLDER']))
+                done.append(deletion_id)
+            except OSError as e:
+                app.logger.warning(f"删除文件失败 {path}: {e}")
+                errors.append(deletion_id)
+
+        if done:
+            db.session.execute(delete(PendingFileDeletion).where(PendingFileDeletion.id.in_(done)))
+        if errors:
+            db.session.execute(update(PendingFileDeletion).where(
+                PendingFileDeletion.id.in_(errors)
+            ).values(attempts=PendingFileDeletion.attempts + 1))
+            failed += len(errors)
+        db.session.commit()
+    return removed, failed
+
+
+def _run_janitor(app):
+    global _scheduled, _rerun
+    with app.app_context():
+        try:
+            while True:
+                with _lock:
+                    _rerun = False
+                purge_pending_files(app)
+                with _lock:
+                    if not _rerun:
+                        _scheduled = False
+                        return
+        except Exception:
+            app.logger.exception("清理已删除的上传文件失败")
+            db.session.rollback()
+            with _lock:
+                _scheduled = False
+        finally:
+            db.session.remove()
+
+
+@event.listens_for(db.session, 'after_commit')
+def _wake_after_commit(session):
+    if session.info.pop('files_queued', False):
+        wake_janitor(current_app._get_current_object())
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_queued_files(session, previous_transaction):
+    session.info.pop('files_queued', None)
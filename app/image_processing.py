@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+图片压缩模块
+上传图片在保存前去除EXIF、限制最长边并按质量参数重新编码；
+Pillow 的解码和编码在独立的进程池中执行，不占用请求线程的GIL
+"""
+
+import io
+import multiprocessing
+import os
+import uuid
+import warnings
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, as_completed
+from PIL import Image, ImageOps
+
+
+# 目标格式 -> 扩展名
+IMAGE_FORMATS = {'JPEG': 'jpg', 'WEBP': 'webp', 'PNG': 'png'}
+
+# 等待单张图片处理的最长时间（秒），超时则保存原图（默认值，可由配置 IMAGE_TRANSCODE_TIMEOUT 覆盖）
+IMAGE_TRANSCODE_TIMEOUT = 30
+
+# 允许上传的最大像素数（默认值，可由配置 IMAGE_MAX_PIXELS 覆盖），超过时拒绝上传
+IMAGE_MAX_PIXELS = 80000000
+
+# 批量转换时每批提交到进程池的文件数
+TRANSCODE_BATCH_SIZE = 50
+
+_pool = None
+
+
+def _has_alpha(img):
+    if img.mode in ('RGBA', 'LA'):
+        return img.getchannel('A').getextrema()[0] < 255
+    return img.mode == 'P' and 'transparency' in img.info
+
+
+def transcode(data, max_edge, quality, fmt):
+    """
+    重新编码图片（在工作进程中执行）
+
+    按EXIF方向旋转后丢弃EXIF，最长边超过 max_edge 时等比缩小；
+    目标格式为JPEG而图片含透明像素时改存PNG；保留ICC色彩配置。
+
+    Args:
+        data: 原图字节
+        max_edge: 最长边像素数
+        quality: JPEG/WEBP 质量
+        fmt: 目标格式（IMAGE_FORMATS 的键）
+
+    Returns:
+        tuple: (新图字节, 扩展名)；动图或重新编码后没有收益时返回 None
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        if getattr(original, 'is_animated', False):
+            return None
+        has_exif = bool(original.info.get('exif')) or bool(original.getexif())
+        icc_profile = original.info.get('icc_profile')
+        img = ImageOps.exif_transpose(original)
+        resized = max(img.size) > max_edge
+        if resized:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        target = 'PNG' if fmt == 'JPEG' and _has_alpha(img) else fmt
+        options = {'icc_profile': icc_profile} if icc_profile else {}
+        if target == 'JPEG':
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            options.update(quality=quality, optimize=True, progressive=True)
+        elif target == 'WEBP':
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if _has_alpha(img) else 'RGB')
+            options.update(quality=quality, method=4)
+        else:
+            options.update(optimize=True)
+        output = io.BytesIO()
+        img.save(output, target, **options)
+
+    result = output.getvalue()
+    # 未缩小、无EXIF且体积没有减小时保留原图
+    if len(result) >= len(data) and not resized and not has_exif:
+        return None
+    return result, IMAGE_FORMATS[target]
+
+
+def transcode_file(source, dest_dir, max_edge, quality, fmt):
+    """
+    重新编码磁盘上的图片并写入临时文件（在工作进程中执行）
+
+    Returns:
+        tuple: (临时文件路径, 扩展名)；无需转换时返回 None
+    """
+    with open(source, 'rb') as f:
+        result = transcode(f.read(), max_edge, quality, fmt)
+    if result is None:
+        return None
+    data, ext = result
+    os.makedirs(dest_dir, exist_ok=True)
+    tmp_path = os.path.join(dest_dir, uuid.uuid4().hex)
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    return tmp_path, ext
+
+
+def transcode_options(app):
+    """从配置读取 (最长边, 质量, 目标格式)"""
+    fmt = app.config.get('IMAGE_FORMAT', 'JPEG').upper()
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f'不支持的图片格式：{fmt}')
+    return app.config.get('IMAGE_MAX_EDGE', 2048), app.config.get('IMAGE_QUALITY', 82), fmt
+
+
+def limit_pixels(max_pixels):
+    """
+    设置 Pillow 的像素数上限，超过时打开图片即抛出异常（不只是警告）
+
+    Args:
+        max_pixels: 最大像素数，0 或 None 表示不限制
+    """
+    Image.MAX_IMAGE_PIXELS = max_pixels or None
+    warnings.simplefilter('error', Image.DecompressionBombWarning)
+
+
+def get_pool(app):
+    """图片处理进程池（spawn 方式启动，不复制请求进程中的线程和数据库连接）"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=app.config.get('IMAGE_WORKERS', 2),
+            mp_context=multiprocessing.get_context('spawn'),
+            # 工作进程使用与请求进程相同的像素数上限
+            initializer=limit_pixels,
+            initargs=(app.config.get('IMAGE_MAX_PIXELS', IMAGE_MAX_PIXELS),)
+        )
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+
+def check_pixels(app, data):
+    """只读取图片头部检查像素数，超过 IMAGE_MAX_PIXELS 时抛出 ValueError；无法识别的图片交由后续处理"""
+    max_pixels = app.config.get('IMAGE_MAX_PIXELS', IMAGE_MAX_PIXELS)
+    limit_pixels(max_pixels)
+    try:
+        with Image.open(io.BytesIO(data)):
+            pass
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise ValueError(f"图片尺寸过大（超过{max_pixels}像素），请缩小后再上传")
+    except OSError:
+        # 含 UnidentifiedImageError
+        return
+
+
+def process_upload(app, stream, ext):
+    """
+    在进程池中压缩上传的图片；未启用、无需处理或处理失败时返回原图
+
+    Args:
+        app: Flask 应用对象
+        stream: 已校验的图片文件流
+        ext: 原扩展名
+
+    Returns:
+        tuple: (文件流, 扩展名, 是否已重新编码)
+
+    Raises:
+        ValueError: 图片像素数超过限制
+    """
+    data = stream.read()
+    # 缩略图同样需要解码，未启用压缩时也检查
+    check_pixels(app, data)
+    if not app.config.get('IMAGE_TRANSCODE', True):
+        return io.BytesIO(data), ext, False
+    future = None
+    try:
+        future = get_pool(app).submit(transcode, data, *transcode_options(app))
+        result = future.result(timeout=app.config.get('IMAGE_TRANSCODE_TIMEOUT', IMAGE_TRANSCODE_TIMEOUT))
+    except TimeoutError:
+        app.logger.warning("图片压缩超时，保存原图")
+        # 已在执行的任务无法取消，换用新的进程池，后续上传不必排在它后面
+        if not future.cancel():
+            _reset_pool()
+        result = None
+    except Exception as e:
+        app.logger.warning(f"图片压缩失败，保存原图: {e}")
+        if e.__class__.__name__ == 'BrokenProcessPool':
+            _reset_pool()
+        result = None
+    if result is None:
+        return io.BytesIO(data), ext, False
+    data, ext = result
+    return io.BytesIO(data), ext, True
+
+
+def iter_transcoded(app, sources, dest_dir):
+    """
+    在进程池中并行转换一批文件
+
+    Args:
+        sources: {键: 原图路径}
+        dest_dir: 临时文件目录
+
+    Yields:
+        tuple: (键, 结果或 None, 异常或 None)
+    """
+    options = transcode_options(app)
+    pool = get_pool(app)
+    futures = {pool.submit(transcode_file, path, dest_dir, *options): key for key, path in sources.items()}
+    for future in as_completed(futures):
+        try:
+            yield futures[future], future.result(), None
+        except Exception as e:
+            yield futures[future], None, e
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+后台导入任务模块
+上传文件保存后提交到工作线程执行，任务状态和逐行错误持久化到 import_jobs 表；
+每块的进度与该块订单在同一事务中提交，进程重启后从最后提交的块继续
+"""
+
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from . import db
+from .models import ImportJob, ImportJobError, OrderType, User, Permission
+from .imports import read_import_chunks, scan_duplicates, run_import, ImportResult
+
+
+# 随每块提交持久化的计数
+PROGRESS_FIELDS = ('rows_processed', 'success_count', 'error_count', 'skipped_count',
+                   'chunks_committed', 'chunks_failed')
+
+# 执行中的任务超过该时间未更新心跳，视为所在进程已退出，可由其它进程接管
+# （默认值，可由配置 IMPORT_STALE_SECONDS 覆盖）
+IMPORT_STALE_SECONDS = 60
+
+_lock = threading.Lock()
+_executor = None
+# 本进程正在执行的任务ID
+_running = set()
+_resumed = False
+
+
+class ImportJobLost(Exception):
+    """心跳续期失败：任务已被其它进程接管，本进程应停止执行"""
+
+
+def _now():
+    # 心跳精确到秒，各数据库存取后比较结果一致
+    return datetime.utcnow().replace(microsecond=0)
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config.get('IMPORT_WORKERS', 1),
+            thread_name_prefix='order-import'
+        )
+    return _executor
+
+
+def save_upload(app, file, file_ext):
+    """保存上传文件供后台任务（及恢复执行时）读取"""
+    folder = app.config['IMPORT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'{uuid.uuid4().hex}.{file_ext}')
+    file.save(path)
+    return path
+
+
+def create_job(app, user_id, file, file_ext, policy):
+    """保存上传文件、创建任务记录并提交执行"""
+    job = ImportJob(
+        user_id=user_id,
+        filename=file.filename,
+        file_path=save_upload(app, file, file_ext),
+        file_ext=file_ext,
+        duplicate_policy=policy,
+        status='pending'
+    )
+    db.session.add(job)
+    db.session.commit()
+    _submit(app, job.id)
+    return job
+
+
+def _submit(app, job_id):
+    with _lock:
+        if job_id in _running:
+            return False
+        _running.add(job_id)
+    _get_executor(app).submit(_run_job, app, job_id)
+    return True
+
+
+def _claim(job, stale_seconds):
+    """以心跳时间做乐观锁接管停滞的任务，避免多个进程同时恢复同一任务"""
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_seconds)
+    if job.status not in ('pending', 'running') or (job.update_time and job.update_time > cutoff):
+        return False
+    claimed = ImportJob.query.filter(
+        ImportJob.id == job.id,
+        ImportJob.update_time == job.update_time
+    ).update({ImportJob.update_time: _now()}, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+
+def _heartbeat(job_id, previous):
+    """
+    以上次写入的心跳时间做乐观锁续期（与 _claim 相同的比较，不提交事务）
+
+    Returns:
+        datetime: 新的心跳时间
+
+    Raises:
+        ImportJobLost: 心跳已被其它进程改写
+    """
+    now = _now()
+    renewed = ImportJob.query.filter(
+        ImportJob.id == job_id,
+        ImportJob.update_time == previous
+    ).update({ImportJob.update_time: now}, synchronize_session=False)
+    if renewed != 1:
+        raise ImportJobLost(job_id)
+    return now
+
+
+def resume_if_stale(app, job):
+    """任务未在本进程执行且心跳已过期时恢复执行"""
+    stale_seconds = app.config.get('IMPORT_STALE_SECONDS', IMPORT_STALE_SECONDS)
+    if job.id in _running or not _claim(job, stale_seconds):
+        return False
+    return _submit(app, job.id)
+
+
+def resume_stale_jobs(app):
+    """恢复所有停滞的任务（进程启动后首次请求时调用一次）"""
+    global _resumed
+    if _resumed:
+        return 0
+    _resumed = True
+    resumed = 0
+    for job in ImportJob.query.filter(ImportJob.status.in_(['pending', 'running'])).all():
+        if resume_if_stale(app, job):
+            resumed += 1
+    return resumed
+
+
+def _remaining_chunks(job):
+    """读取检查点之后的数据块"""
+    checkpoint = job.checkpoint
+    for df in read_import_chunks(job.file_path, job.file_ext):
+        if checkpoint is not None:
+            df = df[df.index > checkpoint]
+        if not df.empty:
+            yield df
+
+
+def _scanned(chunks, beat):
+    """预扫描时每读取一块续期一次心跳并提交"""
+    for df in chunks:
+        beat()
+        db.session.commit()
+        yield df
+
+
+def _fail(job, message, errors=()):
+    job.status = 'failed'
+    job.message = message
+    for index, text in errors:
+        db.session.add(ImportJobError(job_id=job.id, row_index=int(index), message=text))
+    _finish(job)
+
+
+def _finish(job):
+    job.finish_time = job.update_time = datetime.utcnow()
+    db.session.commit()
+    if job.file_path and os.path.exists(job.file_path):
+        os.remove(job.file_path)
+
+
+def _execute(job):
+    # 本进程最后写入的心跳；每次续期都要求数据库中仍是该值，否则说明任务已被接管
+    heartbeat = job.update_time
+
+    def beat():
+        nonlocal heartbeat
+        heartbeat = _heartbeat(job.id, heartbeat)
+
+    resuming = job.checkpoint is not None
+    beat()
+    job.status = 'running'
+    db.session.commit()
+
+    # 预扫描剩余行的订单编码；首次执行时“不导入”策略在这里整体拦截
+    report = scan_duplicates(_scanned(_remaining_chunks(job), beat))
+    beat()
+    if job.duplicate_policy == 'fail' and not resuming and report.has_collisions:
+        duplicates = report.items()
+        _fail(job, f'发现{len(duplicates)}处订单编码重复，未导入任何订单。'
+                   f'可选择“跳过”或“覆盖”重复订单后重新导入', duplicates)
+        return
+    job.rows_total = (job.rows_processed or 0) + report.rows
+    db.session.commit()
+
+    user = db.session.get(User, job.user_id)
+    order_types = {ot.name: ot.id for ot in OrderType.query.all()}
+
+    # 从已持久化的计数继续累计
+    result = ImportResult()
+    for field in PROGRESS_FIELDS:
+        setattr(result, field, getattr(job, field) or 0)
+    result.checkpoint = job.checkpoint
+
+    def progress(result, messages):
+        # 已被接管时抛出 ImportJobLost，本块随之回滚
+        beat()
+        for field in PROGRESS_FIELDS + ('checkpoint',):
+            setattr(job, field, getattr(result, field))
+        db.session.add(job)
+        db.session.add_all(ImportJobError(job_id=job.id, row_index=int(index), message=message)
+                           for index, message in messages)
+        # 错误已入库，不在内存中累积
+        result.errors.clear()
+
+    run_import(
+        _remaining_chunks(job), order_types, job.user_id,
+        policy=job.duplicate_policy, report=report,
+        restrict_owner=not (user and user.can(Permission.VIEW_ALL)),
+        result=result, progress=progress
+    )
+    beat()
+    job.status = 'done'
+    _finish(job)
+
+
+def _run_job(app, job_id):
+    with app.app_context():
+        try:
+            job = db.session.get(ImportJob, job_id)
+            if job is not None and job.status in ('pending', 'running'):
+                _execute(job)
+        except ImportJobLost:
+            # 已由其它进程接管，从最后提交的块继续，这里只放弃本次执行
+            db.session.rollback()
+            app.logger.warning(f"导入任务 {job_id} 已被其它进程接管，停止执行")
+        except Exception as e:
+            app.logger.exception(f"导入任务 {job_id} 失败")
+            db.session.rollback()
+            job = db.session.get(ImportJob, job_id)
+            if job is not None:
+                _fail(job, f'文件处理失败：{str(e)}')
+        finally:
+            with _lock:
+                _running.discard(job_id)
+            db.session.remove()
@@ -0,0 +1,587 @@
+# -*- coding: utf-8 -*-
+"""
+订单导入模块
+按列（向量化）完成校验和类型转换，批量写入订单，逐行错误信息与原逐行导入一致；
+大文件按块流式读取，每块单独提交，失败只影响所在的块；
+写入前预扫描订单编码，按所选策略跳过、覆盖重复的订单或整体不导入
+"""
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy.exc import SQLAlchemyError
+from . import db
+from .models import Order
+from .rollup import RollupDelta, TRACKED_FIELDS
+from .export_jobs import mark_orders_changed
+from .wechat_users import record_order_phones
+
+
+# 每批写入的订单数
+IMPORT_BATCH_SIZE = 1000
+
+# 流式读取时每块的行数（每块一个事务）
+IMPORT_CHUNK_SIZE = 5000
+
+# 按订单编码查询已有订单时，每条 IN 查询的编码数
+LOOKUP_BATCH_SIZE = 500
+
+# 订单编码重复时的处理策略
+DUPLICATE_POLICIES = {
+    'fail': '存在重复时不导入',
+    'skip': '跳过重复的行',
+    'overwrite': '覆盖已有订单',
+}
+
+# 覆盖已有订单时必定更新的字段（必填列），其余字段仅在文件包含对应列时更新
+OVERWRITE_FIELDS = ['wechat_name', 'phone', 'order_info', 'order_type_id', 'completion_time', 'quantity']
+OPTIONAL_OVERWRITE_FIELDS = {'wechat_id': 'wechat_id', 'amount': 'amount', 'notes': 'notes', 'status': 'status'}
+
+# 逻辑字段: 可识别的列名（按优先级，兼容星号在后/在前两种模板）
+COLUMN_ALIASES = {
+    'phone': ('手机号', '*手机号'),
+    'wechat_name': ('微信名*', '*微信名', '微信名'),
+    'order_code': ('订单编码*', '*订单编码', '订单编码'),
+    'order_info': ('订单信息*', '*订单信息', '订单信息'),
+    'order_type': ('订单类型', '*订单类型'),
+    'completion_time': ('完成时间*', '*完成时间', '完成时间'),
+    'quantity': ('数量*', '*数量', '数量'),
+    'wechat_id': ('微信号',),
+    'amount': ('金额',),
+    'notes': ('备注',),
+    'status': ('状态',),
+}
+
+# 必填字段及其显示名称（按校验顺序，每行只报告第一个缺失的字段）
+REQUIRED_FIELDS = [
+    ('phone', '手机号'),
+    ('wechat_name', '微信名'),
+    ('order_code', '订单编码'),
+    ('order_info', '订单信息'),
+    ('order_type', '订单类型'),
+    ('completion_time', '完成时间'),
+    ('quantity', '数量'),
+]
+
+# 模板中的必填列（新格式），旧格式为星号在前
+TEMPLATE_REQUIRED_COLUMNS = ['微信名*', '订单编码*', '订单信息*', '完成时间*', '数量*']
+
+
+def missing_columns(columns):
+    """检查文件缺少的必要列（支持新旧两种格式），返回缺失的列名列表"""
+    columns = set(columns)
+    missing = []
+    for col in TEMPLATE_REQUIRED_COLUMNS:
+        name = col.replace('*', '')
+        if col not in columns and name not in columns and '*' + name not in columns:
+            missing.append(col)
+    # 手机号和订单类型在新格式中不是必填，但列必须存在
+    if '手机号' not in columns and '*手机号' not in columns:
+        missing.append('手机号')
+    if '订单类型' not in columns and '*订单类型' not in columns:
+        missing.append('订单类型')
+    return missing
+
+
+def resolve_columns(columns):
+    """一次性解析逻辑字段对应的实际列名，不存在的字段为 None"""
+    columns = set(columns)
+    resolved = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        resolved[field] = next((alias for alias in aliases if alias in columns), None)
+    return resolved
+
+
+def _column(df, name):
+    if name is None:
+        return pd.Series(np.nan, index=df.index, dtype=object)
+    return df[name]
+
+
+def _blank(series):
+    """空值或去除空白后为空字符串"""
+    return series.isna() | (series.astype(str).str.strip() == '')
+
+
+def _text(series, default=''):
+    """转为去除首尾空白的字符串，空值使用默认值"""
+    text = series.astype(str).str.strip().astype(object)
+    return text.where(series.notna(), default)
+
+
+def _parse_completion_time(series):
+    """
+    解析完成时间：字符串按 %Y-%m-%d 解析，其它类型（Excel日期等）按 pandas 规则转换，
+    无法解析的为 None
+    """
+    parsed = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    if pd.api.types.is_datetime64_any_dtype(series):
+        parsed = series
+    else:
+        is_str = series.map(lambda value: isinstance(value, str), na_action='ignore').fillna(False).astype(bool)
+        if is_str.any():
+            parsed[is_str] = pd.to_datetime(series[is_str], format='%Y-%m-%d', errors='coerce')
+        others = ~is_str & series.notna()
+        if others.any():
+            try:
+                parsed[others] = pd.to_datetime(series[others], errors='coerce')
+            except (TypeError, ValueError):
+                parsed[others] = series[others].map(lambda value: pd.to_datetime(value, errors='coerce'))
+    values = np.asarray(parsed.dt.to_pydatetime(), dtype=object)
+    return pd.Series(values, index=series.index, dtype=object).where(parsed.notna(), None)
+
+
+def _convert(series, func, numeric):
+    """
+    按列转换数值，返回 (转换结果, {行索引: 异常})
+
+    数值列直接向量化转换；其它列逐个调用 func，保留与原逐行转换相同的异常信息。
+    """
+    present = series.notna()
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series) \
+            and np.isfinite(series[present].astype(float)).all():
+        values = dict(zip(series.index[present], numeric(series[present])))
+        failures = {}
+    else:
+        values = {}
+        failures = {}
+        for index, value in series[present].items():
+            try:
+                values[index] = func(value)
+            except Exception as e:
+                failures[index] = e
+    converted = pd.Series(values, index=series.index, dtype=object)
+    return converted.where(converted.notna(), None), failures
+
+
+def prepare_orders(df, order_types, user_id):
+    """
+    校验并转换一批导入行
+
+    Args:
+        df: 导入数据（索引为从0开始的数据行号）
+        order_types: 订单类型名称到ID的映射
+        user_id: 订单归属用户ID
+
+    Returns:
+        tuple: ([(行索引, 订单字典)], [(行索引, 错误信息)])
+    """
+    columns = resolve_columns(df.columns)
+    series = {field: _column(df, name) for field, name in columns.items()}
+
+    errors = []
+    invalid = pd.Series(False, index=df.index)
+    for field, label in REQUIRED_FIELDS:
+        hits = ~invalid & _blank(series[field])
+        for index in df.index[hits]:
+            errors.append((index, f"第{index+2}行：{label}不能为空"))
+        invalid |= hits
+
+    # 类型转换失败的行（与原实现一致，按 数量、金额 的顺序报告第一个错误）
+    quantity, quantity_errors = _convert(
+        series['quantity'], int, lambda s: np.trunc(s.astype(float)).astype('int64').tolist()
+    )
+    amount, amount_errors = _convert(series['amount'], float, lambda s: s.astype(float).tolist())
+    for index in df.index[~invalid]:
+        failure = quantity_errors.get(index) or amount_errors.get(index)
+        if failure is not None:
+            errors.append((index, f"第{index+1}行：{str(failure)}"))
+            invalid[index] = True
+    errors.sort(key=lambda item: item[0])
+
+    valid = ~invalid
+    if not valid.any():
+        return [], errors
+
+    order_type_id = series['order_type'][valid].astype(str).str.strip().map(order_types).astype('Int64')
+    status = _text(series['status'][valid], '未完成')
+    data = pd.DataFrame({
+        'order_code': _text(series['order_code'][valid]),
+        'wechat_name': _text(series['wechat_name'][valid]),
+        'wechat_id': _text(series['wechat_id'][valid]),
+        'phone': _text(series['phone'][valid]),
+        'order_info': _text(series['order_info'][valid]),
+        'completion_time': _parse_completion_time(series['completion_time'][valid]),
+        'quantity': quantity[valid],
+        'amount': amount[valid],
+        'notes': _text(series['notes'][valid]),
+        'order_type_id': order_type_id.astype(object).where(order_type_id.notna(), None),
+        'status': status,
+    }, index=df.index[valid])
+    data['user_id'] = user_id
+
+    return list(zip(data.index, data.to_dict('records'))), errors
+
+
+def insert_orders(records, batch_size=IMPORT_BATCH_SIZE):
+    """
+    批量写入订单（不提交事务）
+
+    批量写入不经过ORM flush，汇总表增量在这里显式写入。
+    空值直接写入 NULL（render_nulls），避免按空值分布拆分成逐行INSERT。
+    """
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        db.session.bulk_insert_mappings(Order, batch, render_nulls=True)
+        delta = RollupDelta()
+        for record in batch:
+            delta.add(record)
+        delta.apply(db.session.connection())
+        record_order_phones(record.get('phone') for record in batch)
+    return len(records)
+
+
+def _lookup_batches(codes, batch_size=LOOKUP_BATCH_SIZE):
+    codes = list(codes)
+    for start in range(0, len(codes), batch_size):
+        yield codes[start:start + batch_size]
+
+
+def existing_orders(codes):
+    """
+    分批 IN 查询（走 order_code 唯一索引）已存在的订单编码
+
+    Returns:
+        dict: 订单编码 -> 所属用户ID
+    """
+    existing = {}
+    for batch in _lookup_batches(codes):
+        existing.update(db.session.query(Order.order_code, Order.user_id).filter(
+            Order.order_code.in_(batch)
+        ))
+    return existing
+
+
+def _current_values(codes):
+    """已有订单影响汇总表的字段值（订单编码 -> 字段字典）"""
+    values = {}
+    columns = [getattr(Order, field) for field in TRACKED_FIELDS]
+    for batch in _lookup_batches(codes):
+        for row in db.session.query(Order.order_code, *columns).filter(Order.order_code.in_(batch)):
+            values[row[0]] = dict(zip(TRACKED_FIELDS, row[1:]))
+    return values
+
+
+def overwrite_fields(columns):
+    """覆盖已有订单时更新的字段（文件中不存在的可选列保留原值，创建人和创建时间不变）"""
+    resolved = resolve_columns(columns)
+    return OVERWRITE_FIELDS + [field for column, field in OPTIONAL_OVERWRITE_FIELDS.items() if resolved[column]]
+
+
+def _upsert_order_rows(connection, rows, fields):
+    table = Order.__table__
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['order_code'],
+            set_={field: stmt.excluded[field] for field in fields}
+        )
+        connection.execute(stmt, rows)
+    elif dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_duplicate_key_update(**{field: stmt.inserted[field] for field in fields})
+        connection.execute(stmt, rows)
+    else:
+        for row in rows:
+            result = connection.execute(table.update().where(
+                table.c.order_code == row['order_code']
+            ).values(**{field: row[field] for field in fields}))
+            if result.rowcount == 0:
+                connection.execute(table.insert().values(**row))
+
+
+def upsert_orders(records, fields, batch_size=IMPORT_BATCH_SIZE):
+    """
+    批量写入订单，订单编码已存在时更新 fields 指定的字段（不提交事务）
+
+    以 INSERT ... ON CONFLICT 批量执行；写入前读取已有订单的值，保证汇总表增量准确。
+    同一批中的重复编码只保留最后一行。
+    """
+    for start in range(0, len(records), batch_size):
+        batch = list({record['order_code']: record for record in records[start:start + batch_size]}.values())
+        previous = _current_values(record['order_code'] for record in batch)
+
+        delta = RollupDelta()
+        for record in batch:
+            old = previous.get(record['order_code'])
+            if old is None:
+                delta.add(record)
+            else:
+                new = dict(old)
+                new.update({field: record[field] for field in fields if field in TRACKED_FIELDS})
+                delta.add(old, sign=-1)
+                delta.add(new)
+
+        # 覆盖手机号时原手机号同样需要刷新微信用户
+        phones = [record.get('phone') for record in batch]
+        if 'phone' in fields:
+            for codes in _lookup_batches(previous):
+                phones.extend(phone for (phone,) in db.session.query(Order.phone).filter(Order.order_code.in_(codes)))
+
+        connection = db.session.connection()
+        _upsert_order_rows(connection, batch, fields)
+        delta.apply(connection)
+        record_order_phones(phones)
+    return len(records)
+
+
+def order_codes(df):
+    """与 prepare_orders 一致的订单编码，空编码为 None"""
+    series = _column(df, resolve_columns(df.columns)['order_code'])
+    return _text(series).where(~_blank(series), None)
+
+
+class DuplicateReport:
+    """导入文件中订单编码的重复情况"""
+
+    def __init__(self):
+        # 编码 -> 在文件中首次出现的行索引
+        self.first_rows = {}
+        # (行索引, 编码, 首次出现的行索引)
+        self.file_duplicates = []
+        # 编码 -> 已有订单的所属用户ID
+        self.existing = {}
+        # 扫描的数据行数
+        self.rows = 0
+
+    @property
+    def has_collisions(self):
+        return bool(self.file_duplicates or self.existing)
+
+    def items(self):
+        """按行号排序的 (行索引, 重复说明)"""
+        items = [(index, f"第{index+2}行：订单编码 {code} 与第{first+2}行重复")
+                 for index, code, first in self.file_duplicates]
+        items.extend((self.first_rows[code], f"第{self.first_rows[code]+2}行：订单编码 {code} 已存在")
+                     for code in self.existing)
+        return sorted(items, key=lambda item: item[0])
+
+    def messages(self):
+        return [message for _, message in self.items()]
+
+
+def scan_duplicates(chunks):
+    """
+    预扫描整个文件的订单编码：文件内的重复行，以及数据库中已存在的编码
+
+    Args:
+        chunks: DataFrame 迭代器（见 read_import_chunks）
+
+    Returns:
+        DuplicateReport
+    """
+    report = DuplicateReport()
+    for df in chunks:
+        report.rows += len(df)
+        for index, code in order_codes(df).dropna().items():
+            first = report.first_rows.get(code)
+            if first is None:
+                report.first_rows[code] = index
+            else:
+                report.file_duplicates.append((index, code, first))
+    report.existing = existing_orders(report.first_rows)
+    return report
+
+
+def _header_names(header):
+    """与 pandas 一致：空列名为 Unnamed: n，重复列名追加 .1、.2"""
+    names = []
+    seen = {}
+    for position, value in enumerate(header):
+        name = f'Unnamed: {position}' if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _read_xlsx_chunks(file, chunksize):
+    """openpyxl 只读模式逐行读取第一个工作表，索引为数据行号（跳过的空行不影响行号）"""
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _header_names(header)
+        width = len(columns)
+
+        batch = []
+        index = []
+        for offset, values in enumerate(rows):
+            if all(value is None for value in values):
+                continue
+            values = tuple(values[:width]) + (None,) * (width - len(values))
+            batch.append(values)
+            index.append(offset)
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch, columns=columns, index=index)
+                batch = []
+                index = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns, index=index)
+    finally:
+        wb.close()
+
+
+def read_import_chunks(file, file_ext, chunksize=IMPORT_CHUNK_SIZE):
+    """
+    按块读取导入文件，各块索引连续（即数据行号，Excel行号 = 索引 + 2）
+
+    Args:
+        file: 文件对象
+        file_ext: 扩展名（csv/xlsx/xls）
+        chunksize: 每块行数
+
+    Yields:
+        DataFrame
+    """
+    if file_ext == 'csv':
+        yield from pd.read_csv(file, encoding='utf-8', chunksize=chunksize)
+    elif file_ext == 'xlsx':
+        yield from _read_xlsx_chunks(file, chunksize)
+    else:
+        # xls 格式 openpyxl 无法读取，整体读入后分块
+        df = pd.read_excel(file)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+
+class ImportResult:
+    """导入进度与结果"""
+
+    def __init__(self):
+        self.rows_processed = 0
+        self.success_count = 0
+        self.error_count = 0
+        self.skipped_count = 0
+        self.errors = []
+        self.chunks_committed = 0
+        self.chunks_failed = 0
+        # 最后一个已处理（已提交或已回滚）块的末行索引
+        self.checkpoint = None
+
+    def to_dict(self):
+        return {
+            'rows_processed': self.rows_processed,
+            'success_count': self.success_count,
+            'error_count': self.error_count,
+            'skipped_count': self.skipped_count,
+            'chunks_committed': self.chunks_committed,
+            'chunks_failed': self.chunks_failed,
+            'checkpoint': self.checkpoint
+        }
+
+
+def _describe(error):
+    return str(getattr(error, 'orig', None) or error)
+
+
+def _apply_policy(records, policy, report, written, user_id, restrict_owner):
+    """
+    按重复策略拆分一块待写入的订单
+
+    Args:
+        written: 本次导入中之前各块已写入的编码
+
+    Returns:
+        tuple: (直接插入的订单, 需覆盖写入的订单, [(行索引, 跳过原因)], 本块写入的编码)
+    """
+    existing = report.existing if report else {}
+    first_rows = report.first_rows if report else {}
+    inserts = []
+    upserts = []
+    skipped = []
+    codes = set()
+    for index, record in records:
+        code = record['order_code']
+        in_database = code in existing
+        in_file = code in written or code in codes
+        if policy == 'skip' and (in_database or in_file):
+            if in_database:
+                skipped.append((index, f"第{index+2}行：订单编码 {code} 已存在，已跳过"))
+            else:
+                skipped.append((index, f"第{index+2}行：订单编码 {code} 与第{first_rows.get(code, index)+2}行重复，已跳过"))
+            continue
+        if policy == 'overwrite' and in_database and restrict_owner and existing[code] != user_id:
+            skipped.append((index, f"第{index+2}行：订单编码 {code} 属于其他用户，无权覆盖"))
+            continue
+        if policy == 'overwrite' and (in_database or in_file):
+            upserts.append(record)
+        else:
+            inserts.append(record)
+        codes.add(code)
+    return inserts, upserts, skipped, codes
+
+
+def run_import(chunks, order_types, user_id, policy='fail', report=None, restrict_owner=False,
+               result=None, progress=None):
+    """
+    逐块校验、写入并提交
+
+    某块写入失败（如订单编码重复）时只回滚该块，错误记为该块所有待写入行，继续处理后续块。
+
+    Args:
+        chunks: DataFrame 迭代器（见 read_import_chunks）
+        order_types: 订单类型名称到ID的映射
+        user_id: 订单归属用户ID
+        policy: 订单编码重复时的处理策略（见 DUPLICATE_POLICIES）
+        report: 预扫描得到的 DuplicateReport
+        restrict_owner: 为 True 时只能覆盖本用户的订单
+        result: 可选，累积进度的 ImportResult（读取中途出错时调用方仍可得知已提交的进度）
+        progress: 可选，每块提交前以 (ImportResult, [(行索引, 错误信息)]) 调用，
+            在其中写入的进度与该块订单在同一事务中提交
+
+    Returns:
+        ImportResult
+    """
+    if result is None:
+        result = ImportResult()
+    written = set()
+    fields = None
+    for df in chunks:
+        if df.empty:
+            continue
+        if fields is None:
+            fields = overwrite_fields(df.columns)
+        records, row_errors = prepare_orders(df, order_types, user_id)
+        inserts, upserts, skipped, codes = _apply_policy(records, policy, report, written, user_id, restrict_owner)
+        messages = sorted(row_errors + skipped, key=lambda item: item[0])
+        try:
+            insert_orders(inserts)
+            upsert_orders(upserts, fields)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            pending = len(inserts) + len(upserts)
+            result.chunks_failed += 1
+            result.error_count += pending
+            first, last = df.index[0], df.index[-1]
+            messages.append((first, f"第{first+2}-{last+2}行：本批{pending}条订单写入失败，已回滚（{_describe(e)}）"))
+            written_codes = set()
+        else:
+            result.chunks_committed += 1
+            result.success_count += len(inserts) + len(upserts)
+            written_codes = codes
+
+        result.error_count += len(row_errors)
+        result.skipped_count += len(skipped)
+        result.errors.extend(message for _, message in messages)
+        result.rows_processed += len(df)
+        result.checkpoint = int(df.index[-1])
+        if progress is not None:
+            progress(result, messages)
+        db.session.commit()
+
+        written |= written_codes
+        if written_codes:
+            mark_orders_changed()
+    return result
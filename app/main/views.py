@@ -1,28 +1,43 @@
 import os
 import uuid
 import shutil
+import csv
 import json
-from datetime import datetime
-from io import BytesIO
+from datetime import datetime, timezone
+from io import BytesIO, StringIO
 import pandas as pd
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils.dataframe import dataframe_to_rows
-from flask import render_template, redirect, url_for, flash, request, current_app, jsonify, abort, send_from_directory, send_file
+from urllib.parse import quote
+from flask import render_template, redirect, url_for, flash, request, current_app, jsonify, abort, send_file, Response, stream_with_context
 from flask_login import login_required, current_user
 from .. import csrf
 from . import main
 from .. import db
-from ..models import Order, OrderImage, Permission, OrderField, OrderType, WechatUser, User
+from ..models import Order, OrderImage, Permission, OrderField, OrderType, WechatUser, User, ImportJob, ImportJobError
 from ..forms import OrderForm
 from ..decorators import admin_required
+from ..pagination import KeysetPagination
+from ..order_stats import OrderFilter, OrderAggregator
+from ..exports import stream_orders_xlsx, stream_orders_csv, stream_orders_ndjson
+from ..export_jobs import EXPORT_FORMATS, EXPORT_MIMETYPES, submit_export, get_job, job_dict
+from ..imports import missing_columns, read_import_chunks, DUPLICATE_POLICIES
+from ..import_jobs import create_job, resume_if_stale, resume_stale_jobs
+from ..order_batch import ORDER_STATUSES, commit_status_update, commit_delete_orders
+from ..file_cleanup import drain_on_start
+from ..blob_store import store_upload, release_files
+from ..image_processing import process_upload
+from ..upload_gc import start_upload_gc, normalize_upload_path
+from ..thumbnails import ensure_thumbnail, thumbnail_mimetype
+from ..uploads import send_upload
 from werkzeug.utils import secure_filename
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
-def save_image(file, subfolder=''):
+def save_image(file):
     if file and allowed_file(file.filename):
         # 检查文件大小
         file.seek(0, 2)  # 移动到文件末尾
@@ -59,22 +74,13 @@ def save_image(file, subfolder=''):
         if not is_valid_image:
             raise ValueError("无效的图片文件格式")
         
-        # 生成唯一文件名，确保包含扩展名
-        unique_filename = f"{uuid.uuid4().hex}.{file_ext}"
+        # 去除EXIF、限制尺寸并重新编码（在进程池中执行），失败时保存原图
+        stream, file_ext, processed = process_upload(current_app, file.stream, file_ext)
         
-        # 创建子目录路径
-        if subfolder:
-            upload_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], subfolder)
-            os.makedirs(upload_dir, exist_ok=True)
-            file_path = os.path.join(upload_dir, unique_filename)
-            file.save(file_path)
-            # 返回相对路径，用于存储在数据库（使用正斜杠以确保Web兼容性）
-            return f"{subfolder}/{unique_filename}"
-        else:
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(file_path)
-            # 返回相对路径，用于存储在数据库（使用正斜杠以确保Web兼容性）
-            return f"{unique_filename}"
+        # 按内容哈希存储，相同图片只保存一份，同时生成缩略图
+        relative_path = store_upload(current_app, stream, file_ext, processed=processed)
+        # 返回相对路径，用于存储在数据库（使用正斜杠以确保Web兼容性）
+        return relative_path
     return None
 
 @main.route('/')
@@ -87,7 +93,6 @@ def index():
 @login_required
 def order_list():
     from datetime import date, timedelta
-    from sqlalchemy import and_, extract
     
     page = request.args.get('page', 1, type=int)
     user_id = request.args.get('user_id', type=int)
@@ -97,17 +102,13 @@ def order_list():
     search_value = request.args.get('search_value', '').strip()
     sort_by = request.args.get('sort_by')  # 排序方式：amount(金额)、count(数量) 或 None(按时间)
     
-    # 构建查询
-    query = Order.query
-    
     # 权限控制
     if current_user.can(Permission.VIEW_ALL):
         # 管理员可以查看所有订单，可以按用户筛选
-        if user_id:
-            query = query.filter(Order.user_id == user_id)
+        filter_user_id = user_id
     else:
         # 普通用户只能查看自己的订单
-        query = query.filter(Order.user_id == current_user.id)
+        filter_user_id = current_user.id
     
     # 日期筛选，默认当前月份
     if not start_date and not end_date:
@@ -121,59 +122,62 @@ def order_list():
             next_month = today.replace(month=today.month + 1, day=1)
         end_date = (next_month - timedelta(days=1)).strftime('%Y-%m-%d')
     
+    start_dt = None
+    end_dt = None
     if start_date:
         try:
             start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Order.completion_time >= start_dt)
         except ValueError:
             flash('开始日期格式错误', 'danger')
     
     if end_date:
         try:
             end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-            query = query.filter(Order.completion_time <= end_dt)
         except ValueError:
             flash('结束日期格式错误', 'danger')
     
-    # 搜索功能
-    if search_value:
-        if search_type == 'wechat_name':
-            query = query.filter(Order.wechat_name.like(f'%{search_value}%'))
-        elif search_type == 'wechat_id':
-            query = query.filter(Order.wechat_id.like(f'%{search_value}%'))
-        elif search_type == 'phone':
-            query = query.filter(Order.phone.like(f'%{search_value}%'))
-        elif search_type == 'order_code':
-            query = query.filter(Order.order_code.like(f'%{search_value}%'))
-    
-    # 排序 - 默认按创建时间降序，新订单在前
-    if sort_by == 'amount':
-        query = query.order_by(Order.amount.desc().nullslast(), Order.create_time.desc())
-    elif sort_by == 'count':
-        query = query.order_by(Order.quantity.desc().nullslast(), Order.create_time.desc())
+    # 构建查询（权限、日期、搜索条件只构建一次）
+    order_filter = OrderFilter(user_id=filter_user_id, start_dt=start_dt, end_dt=end_dt,
+                               search_type=search_type, search_value=search_value)
+    query = order_filter.apply(Order.query)
+    
+    # 计算统计信息（订单数、总金额、平均金额、总数量一次查询完成）
+    stats = OrderAggregator(order_filter).headline()
+    total_orders = stats['total_orders']
+    total_amount = stats['total_amount']
+    avg_amount = stats['avg_amount']
+    total_quantity = stats['total_quantity']
+    
+    # 分页：携带游标或结果集较大时使用游标分页（按 排序列, id 定位，避免深分页的OFFSET扫描）
+    cursor = request.args.get('cursor')
+    cursor_mode = bool(cursor) or total_orders > current_app.config['KEYSET_PAGINATION_THRESHOLD']
+
+    if cursor_mode:
+        sort_column = {'amount': Order.amount, 'count': Order.quantity}.get(sort_by, Order.create_time)
+        pagination = KeysetPagination(query, sort_column, Order.id, sort_by or 'time',
+                                      cursor=cursor, per_page=10, total=total_orders)
     else:
-        # 默认排序：按创建时间降序，确保新订单在最前面
-        query = query.order_by(Order.create_time.desc())
-    
-    # 分页
-    pagination = query.paginate(
-        page=page, per_page=10, error_out=False
-    )
+        # 排序 - 默认按创建时间降序，新订单在前
+        if sort_by == 'amount':
+            query = query.order_by(Order.amount.desc().nullslast(), Order.create_time.desc())
+        elif sort_by == 'count':
+            query = query.order_by(Order.quantity.desc().nullslast(), Order.create_time.desc())
+        else:
+            # 默认排序：按创建时间降序，确保新订单在最前面
+            query = query.order_by(Order.create_time.desc())
+
+        # 总数已由统计查询得到，无需再次COUNT
+        pagination = query.paginate(
+            page=page, per_page=10, error_out=False, count=False
+        )
+        pagination.total = total_orders
     orders = pagination.items
     
     # 获取所有用户（用于筛选）
     users = []
     if current_user.can(Permission.VIEW_ALL):
-        from ..models import User
         users = User.query.all()
     
-    # 计算统计信息
-    from sqlalchemy import func
-    total_orders = pagination.total
-    total_amount = query.with_entities(func.sum(Order.amount)).scalar() or 0
-    avg_amount = query.with_entities(func.avg(Order.amount)).scalar() or 0
-    total_quantity = query.with_entities(func.sum(Order.quantity)).scalar() or 0
-    
     # 计算微信用户数（统计WechatUser表中的实际记录数）
     total_wechat_users = WechatUser.query.count()
     
@@ -190,6 +194,7 @@ def order_list():
     return render_template('main/order_list.html',
                          orders=orders,
                          pagination=pagination,
+                         cursor_mode=cursor_mode,
                          users=users,
                          current_filters=current_filters,
                          total_orders=total_orders,
@@ -197,6 +202,7 @@ def order_list():
                          avg_amount=avg_amount,
                          total_quantity=total_quantity,
                          total_wechat_users=total_wechat_users,
+                         export_job_id=request.args.get('export_job'),
                          now=datetime.now())
 
 @main.route('/order/new', methods=['GET', 'POST'])
@@ -236,7 +242,7 @@ def new_order():
         uploaded_files = request.files.getlist('images')
         for uploaded_file in uploaded_files:
             if uploaded_file and uploaded_file.filename:
-                image_path = save_image(uploaded_file, 'orders')
+                image_path = save_image(uploaded_file)
                 if image_path:
                     order_image = OrderImage(order_id=order.id, image_path=image_path)
                     db.session.add(order_image)
@@ -299,7 +305,7 @@ def edit_order(id):
         uploaded_files = request.files.getlist('images')
         for uploaded_file in uploaded_files:
             if uploaded_file and uploaded_file.filename:
-                image_path = save_image(uploaded_file, 'orders')
+                image_path = save_image(uploaded_file)
                 if image_path:
                     order_image = OrderImage(order_id=order.id, image_path=image_path)
                     db.session.add(order_image)
@@ -314,44 +320,34 @@ def edit_order(id):
 @main.route('/order/delete/<int:id>', methods=['POST'])
 @login_required
 def delete_order(id):
-    order = Order.query.get_or_404(id)
-    
-    # 权限检查
-    if not current_user.can(Permission.VIEW_ALL) and order.user_id != current_user.id:
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return jsonify({'success': False, 'error': '权限不足'})
-        abort(403)
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
     
     try:
-        # 删除相关图片
-        for image in order.images:
-            try:
-                image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], image.image_path.replace('uploads/', ''))
-                if os.path.exists(image_path):
-                    os.remove(image_path)
-            except Exception as e:
-                print(f"删除图片失败: {e}")
-                pass
-            db.session.delete(image)
-        
-        db.session.delete(order)
-        db.session.commit()
-        
-        # 根据请求类型返回不同响应
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return jsonify({'success': True, 'message': '订单删除成功！'})
-        else:
-            flash('订单删除成功！', 'success')
-            return redirect(url_for('main.order_list'))
-            
+        # 无查看全部权限时只能删除自己的订单；图片文件在提交后由后台清理
+        owner_id = None if current_user.can(Permission.VIEW_ALL) else current_user.id
+        result = commit_delete_orders([id], user_id=owner_id)
     except Exception as e:
-        db.session.rollback()
         print(f"删除订单失败: {e}")
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        if is_ajax:
             return jsonify({'success': False, 'error': f'删除失败：{str(e)}'})
         else:
             flash(f'删除失败：{str(e)}', 'error')
             return redirect(url_for('main.order_list'))
+    
+    if not result.deleted:
+        if db.session.query(Order.id).filter_by(id=id).first() is None:
+            abort(404)
+        # 权限检查
+        if is_ajax:
+            return jsonify({'success': False, 'error': '权限不足'})
+        abort(403)
+    
+    # 根据请求类型返回不同响应
+    if is_ajax:
+        return jsonify({'success': True, 'message': '订单删除成功！'})
+    else:
+        flash('订单删除成功！', 'success')
+        return redirect(url_for('main.order_list'))
 
 @main.route('/orders/statistics')
 @login_required
@@ -360,8 +356,7 @@ def order_statistics():
     if not current_user.can(Permission.VIEW_ALL):
         abort(403)
     
-    from datetime import date, timedelta
-    from sqlalchemy import func
+    from datetime import timedelta
     
     # 获取查询参数
     user_id = request.args.get('user_id', type=int)
@@ -377,20 +372,13 @@ def order_statistics():
         # 不设置默认日期范围，显示所有数据
         pass
     
-    # 构建查询
-    query = Order.query
     start_dt = None
     end_dt = None
     
-    # 用户筛选
-    if user_id:
-        query = query.filter(Order.user_id == user_id)
-    
     # 日期筛选
     if start_date:
         try:
             start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Order.create_time >= start_dt)
         except ValueError:
             flash('开始日期格式错误', 'danger')
     
@@ -398,127 +386,28 @@ def order_statistics():
         try:
             end_dt = datetime.strptime(end_date, '%Y-%m-%d')
             # 结束日期包含当天，所以加1天
-            from datetime import timedelta
             end_dt = end_dt + timedelta(days=1)
-            query = query.filter(Order.create_time < end_dt)
         except ValueError:
             flash('结束日期格式错误', 'danger')
     
-    # 搜索筛选
-    if search_value:
-        if search_type == 'wechat_name':
-            query = query.filter(Order.wechat_name.contains(search_value))
-        elif search_type == 'wechat_id':
-            query = query.filter(Order.wechat_id.contains(search_value))
-        elif search_type == 'phone':
-            query = query.filter(Order.phone.contains(search_value))
-    
-    # 统计信息
-    total_orders = query.count()
-    total_amount = query.with_entities(func.sum(Order.amount)).scalar() or 0
-    avg_amount = query.with_entities(func.avg(Order.amount)).scalar() or 0
-    total_quantity = query.with_entities(func.sum(Order.quantity)).scalar() or 0
-    
-    # 按状态统计
-    status_stats_query = db.session.query(
-        Order.status,
-        func.count(Order.id).label('count'),
-        func.sum(Order.amount).label('amount')
-    )
-    
-    # 应用筛选条件
-    if user_id:
-        status_stats_query = status_stats_query.filter(Order.user_id == user_id)
-    if start_dt:
-        status_stats_query = status_stats_query.filter(Order.create_time >= start_dt)
-    if end_dt:
-        status_stats_query = status_stats_query.filter(Order.create_time < end_dt)
-    if search_value:
-        if search_type == 'wechat_name':
-            status_stats_query = status_stats_query.filter(Order.wechat_name.contains(search_value))
-        elif search_type == 'wechat_id':
-            status_stats_query = status_stats_query.filter(Order.wechat_id.contains(search_value))
-        elif search_type == 'phone':
-            status_stats_query = status_stats_query.filter(Order.phone.contains(search_value))
-    
-    status_stats = status_stats_query.group_by(Order.status).all()
-    
-    # 按订单类型统计
-    type_stats_query = db.session.query(
-        OrderType.name,
-        func.count(Order.id).label('order_count'),
-        func.sum(Order.amount).label('total_amount')
-    ).outerjoin(Order, OrderType.id == Order.order_type_id)
-    
-    # 应用筛选条件
-    if user_id:
-        type_stats_query = type_stats_query.filter(Order.user_id == user_id)
-    if start_dt:
-        type_stats_query = type_stats_query.filter(Order.create_time >= start_dt)
-    if end_dt:
-        type_stats_query = type_stats_query.filter(Order.create_time < end_dt)
-    if search_value:
-        if search_type == 'wechat_name':
-            type_stats_query = type_stats_query.filter(Order.wechat_name.contains(search_value))
-        elif search_type == 'wechat_id':
-            type_stats_query = type_stats_query.filter(Order.wechat_id.contains(search_value))
-        elif search_type == 'phone':
-            type_stats_query = type_stats_query.filter(Order.phone.contains(search_value))
-    
-    type_stats = type_stats_query.group_by(OrderType.id, OrderType.name).all()
-    
-    # 按用户统计
-    user_stats_query = db.session.query(
-        User.username,
-        func.count(Order.id).label('order_count'),
-        func.sum(Order.amount).label('total_amount')
-    ).join(Order, User.id == Order.user_id)
-    
-    # 应用筛选条件
-    if user_id:
-        user_stats_query = user_stats_query.filter(Order.user_id == user_id)
-    if start_dt:
-        user_stats_query = user_stats_query.filter(Order.create_time >= start_dt)
-    if end_dt:
-        user_stats_query = user_stats_query.filter(Order.create_time < end_dt)
-    if search_value:
-        if search_type == 'wechat_name':
-            user_stats_query = user_stats_query.filter(Order.wechat_name.contains(search_value))
-        elif search_type == 'wechat_id':
-            user_stats_query = user_stats_query.filter(Order.wechat_id.contains(search_value))
-        elif search_type == 'phone':
-            user_stats_query = user_stats_query.filter(Order.phone.contains(search_value))
-    
-    user_stats = user_stats_query.group_by(User.id, User.username).all()
+    # 筛选条件只构建一次，由统计组件复用
+    order_filter = OrderFilter(user_id=user_id, start_dt=start_dt, end_dt=end_dt,
+                               search_type=search_type, search_value=search_value,
+                               date_column=Order.create_time, end_exclusive=True)
+    aggregator = OrderAggregator(order_filter)
+    
+    # 汇总、按状态、按订单类型、按用户统计：一次分组查询
+    breakdown = aggregator.breakdown()
+    total_orders = breakdown['total_orders']
+    total_amount = breakdown['total_amount']
+    avg_amount = breakdown['avg_amount']
+    total_quantity = breakdown['total_quantity']
+    status_stats = breakdown['status_stats']
+    type_stats = breakdown['type_stats']
+    user_stats = breakdown['user_stats']
     
     # 按微信用户统计（Top 10）
-    wechat_stats_query = db.session.query(
-        Order.wechat_name,
-        func.count(Order.id).label('order_count'),
-        func.sum(Order.amount).label('total_amount')
-    )
-    
-    # 应用筛选条件
-    if user_id:
-        wechat_stats_query = wechat_stats_query.filter(Order.user_id == user_id)
-    if start_dt:
-        wechat_stats_query = wechat_stats_query.filter(Order.create_time >= start_dt)
-    if end_dt:
-        wechat_stats_query = wechat_stats_query.filter(Order.create_time < end_dt)
-    if search_value:
-        if search_type == 'wechat_name':
-            wechat_stats_query = wechat_stats_query.filter(Order.wechat_name.contains(search_value))
-        elif search_type == 'wechat_id':
-            wechat_stats_query = wechat_stats_query.filter(Order.wechat_id.contains(search_value))
-        elif search_type == 'phone':
-            wechat_stats_query = wechat_stats_query.filter(Order.phone.contains(search_value))
-    
-    wechat_stats_query = wechat_stats_query.filter(Order.wechat_name.isnot(None)).group_by(Order.wechat_name)
-    
-    if sort_by == 'count':
-        wechat_stats = wechat_stats_query.order_by(func.count(Order.id).desc()).limit(10).all()
-    else:
-        wechat_stats = wechat_stats_query.order_by(func.sum(Order.amount).desc()).limit(10).all()
+    wechat_stats = aggregator.top_wechat_users(sort_by, limit=10)
     
     # 获取所有用户（用于筛选）
     users = User.query.all()
@@ -786,228 +675,134 @@ def export_orders():
     # 所有登录用户都可以导出订单
     # 普通用户只能导出自己的订单，管理员可以导出所有订单
     
-    import pandas as pd
-    from io import BytesIO
-    
     # 获取查询参数
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     user_id = request.args.get('user_id', type=int)
     
-    # 构建查询
-    query = Order.query
+    order_filter = build_export_filter(start_date, end_date, user_id)
     
-    # 权限控制：普通用户只能导出自己的订单
+    # 汇总指标一次查询得到，同时用于判断是否有数据
+    stats = OrderAggregator(order_filter).headline()
+    if not stats['total_orders']:
+        flash('没有找到符合条件的订单', 'warning')
+        return redirect(url_for('main.order_list'))
+    
+    # xlsx 须整个写完才能封装，无法边写边发送：订单较多时转为后台导出任务，返回列表页轮询进度
+    if stats['total_orders'] > current_app.config.get('EXPORT_SYNC_MAX_ROWS', 5000):
+        job = submit_export(current_app._get_current_object(), current_user.id, order_filter, 'xlsx')
+        flash(f'共{stats["total_orders"]}条订单，已转为后台导出，完成后自动下载', 'info')
+        return redirect(url_for('main.order_list', export_job=job.id, **request.args))
+    
+    # 订单较少时直接生成：只写模式写入临时文件，写完后分块发送，内存占用与订单数量无关
+    query = order_filter.apply(Order.query)
+    download_name = f'订单导出_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+    return Response(
+        stream_with_context(stream_orders_xlsx(query, stats)),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}"}
+    )
+
+# 原始数据导出格式: (生成器, MIME类型)
+RAW_EXPORT_FORMATS = {
+    'csv': (stream_orders_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (stream_orders_ndjson, 'application/x-ndjson; charset=utf-8'),
+}
+
+@main.route('/orders/export/<fmt>')
+@login_required
+def export_orders_raw(fmt):
+    """以CSV/NDJSON格式流式导出订单原始数据（筛选条件和权限与 export_orders 一致）"""
+    if fmt not in RAW_EXPORT_FORMATS:
+        abort(404)
+    
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    user_id = request.args.get('user_id', type=int)
+    
+    order_filter = build_export_filter(start_date, end_date, user_id)
+    
+    # 不预先统计行数，查询开始后逐行输出
+    generate, mimetype = RAW_EXPORT_FORMATS[fmt]
+    query = order_filter.apply(Order.query)
+    download_name = f'订单导出_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{fmt}'
+    return Response(
+        stream_with_context(generate(query)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}"}
+    )
+
+@main.route('/orders/export/jobs', methods=['POST'])
+@login_required
+def create_export_job():
+    """提交后台导出任务，返回任务ID供轮询进度"""
+    fmt = request.values.get('format', 'xlsx')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': '不支持的导出格式'}), 400
+    
+    order_filter = build_export_filter(
+        request.values.get('start_date'),
+        request.values.get('end_date'),
+        request.values.get('user_id', type=int)
+    )
+    job = submit_export(current_app._get_current_object(), current_user.id, order_filter, fmt)
+    return jsonify({
+        'success': True,
+        **job_dict(job),
+        'status_url': url_for('main.export_job_status', job_id=job.id),
+        'download_url': url_for('main.download_export_job', job_id=job.id)
+    })
+
+@main.route('/orders/export/jobs/<job_id>')
+@login_required
+def export_job_status(job_id):
+    """查询导出任务进度"""
+    job = get_job(job_id, current_user.id)
+    if job is None:
+        return jsonify({'success': False, 'error': '导出任务不存在或已过期'}), 404
+    return jsonify({'success': True, **job_dict(job)})
+
+@main.route('/orders/export/jobs/<job_id>/download')
+@login_required
+def download_export_job(job_id):
+    """下载已完成的导出文件"""
+    job = get_job(job_id, current_user.id)
+    if job is None or job.status != 'done' or not os.path.exists(job.path):
+        flash('导出文件不存在或已过期，请重新导出', 'warning')
+        return redirect(url_for('main.order_list'))
+    
+    created = job.create_time.replace(tzinfo=timezone.utc).astimezone().strftime("%Y%m%d_%H%M%S")
+    return send_file(
+        job.path,
+        mimetype=EXPORT_MIMETYPES[job.fmt],
+        as_attachment=True,
+        download_name=f'订单导出_{created}.{job.fmt}'
+    )
+
+def build_export_filter(start_date, end_date, user_id):
+    """构建导出的筛选条件（权限控制：普通用户只能导出自己的订单）"""
     if current_user.can(Permission.VIEW_ALL):
         # 管理员可以按用户筛选
-        if user_id:
-            query = query.filter(Order.user_id == user_id)
+        filter_user_id = user_id
     else:
         # 普通用户只能导出自己的订单
-        query = query.filter(Order.user_id == current_user.id)
+        filter_user_id = current_user.id
     
+    start_dt = None
+    end_dt = None
     if start_date:
         try:
             start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(Order.completion_time >= start_dt)
         except ValueError:
             flash('开始日期格式错误', 'danger')
     
     if end_date:
         try:
             end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-            query = query.filter(Order.completion_time <= end_dt)
         except ValueError:
             flash('结束日期格式错误', 'danger')
     
-    orders = query.order_by(Order.create_time.desc()).all()
-    
-    # 准备导出数据
-    export_data = []
-    for order in orders:
-        # 解析自定义字段
-        custom_fields = {}
-        if order.custom_fields:
-            try:
-                custom_fields = json.loads(order.custom_fields)
-            except:
-                custom_fields = {}
-        
-        row = {
-            '订单编号': order.order_code,
-            '微信名': order.wechat_name,
-            '微信号': order.wechat_id,
-            '手机号': order.phone,
-            '订单信息': order.order_info,
-            '完成时间': order.completion_time.strftime('%Y-%m-%d') if order.completion_time else '',
-            '数量': order.quantity,
-            '金额': order.amount,
-            '备注': order.notes,
-            '订单类型': order.order_type.name if order.order_type else '',
-            '状态': order.status,
-            '创建时间': order.create_time.strftime('%Y-%m-%d %H:%M:%S'),
-            '创建用户': order.creator.username if order.creator else ''
-        }
-        
-        # 添加自定义字段
-        for field_name, field_value in custom_fields.items():
-            row[f'自定义_{field_name}'] = field_value
-        
-        export_data.append(row)
-    
-    if not export_data:
-        flash('没有找到符合条件的订单', 'warning')
-        return redirect(url_for('main.order_list'))
-    
-    df = pd.DataFrame(export_data)
-    
-    # 创建工作簿
-    wb = Workbook()
-    
-    # 创建订单数据sheet
-    ws1 = wb.active
-    ws1.title = "订单数据"
-    
-    # 将数据写入工作表
-    for r in dataframe_to_rows(df, index=False, header=True):
-        ws1.append(r)
-    
-    # 设置丰富的样式
-    header_font = Font(bold=True, color="FFFFFF", size=12, name="微软雅黑")
-    header_fill = PatternFill(start_color="2F5597", end_color="2F5597", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    
-    # 数据行样式
-    data_font = Font(size=10, name="微软雅黑")
-    data_fill_light = PatternFill(start_color="F8F9FA", end_color="F8F9FA", fill_type="solid")
-    data_fill_white = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-    data_alignment = Alignment(horizontal="left", vertical="center")
-    number_alignment = Alignment(horizontal="right", vertical="center")
-    date_alignment = Alignment(horizontal="center", vertical="center")
-    
-    # 设置边框
-    thin_border = Border(
-        left=Side(style='thin', color='CCCCCC'),
-        right=Side(style='thin', color='CCCCCC'),
-        top=Side(style='thin', color='CCCCCC'),
-        bottom=Side(style='thin', color='CCCCCC')
-    )
-    
-    thick_border = Border(
-        left=Side(style='medium', color='2F5597'),
-        right=Side(style='medium', color='2F5597'),
-        top=Side(style='medium', color='2F5597'),
-        bottom=Side(style='medium', color='2F5597')
-    )
-    
-    # 应用标题行样式
-    for cell in ws1[1]:
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = thick_border
-    
-    # 设置列宽
-    column_widths = {
-        'A': 18,  # 订单编号
-        'B': 12,  # 微信名
-        'C': 15,  # 微信号
-        'D': 15,  # 手机号
-        'E': 25,  # 订单信息
-        'F': 12,  # 完成时间
-        'G': 8,   # 数量
-        'H': 12,  # 金额
-        'I': 20,  # 备注
-        'J': 12,  # 订单类型
-        'K': 10,  # 状态
-        'L': 18,  # 创建时间
-        'M': 12   # 创建用户
-    }
-    
-    for col, width in column_widths.items():
-        if col in [chr(65+i) for i in range(ws1.max_column)]:
-            ws1.column_dimensions[col].width = width
-    
-    # 为所有数据单元格添加边框和样式
-    for row_idx, row in enumerate(ws1.iter_rows(min_row=1, max_row=ws1.max_row, min_col=1, max_col=ws1.max_column), 1):
-        for col_idx, cell in enumerate(row, 1):
-            cell.border = thin_border
-            if cell.row > 1:  # 非标题行
-                cell.font = data_font
-                # 交替行颜色
-                if cell.row % 2 == 0:
-                    cell.fill = data_fill_light
-                else:
-                    cell.fill = data_fill_white
-                
-                # 根据列类型设置对齐方式
-                if col_idx in [7, 8]:  # 数量和金额列
-                    cell.alignment = number_alignment
-                elif col_idx in [6, 12]:  # 完成时间和创建时间列
-                    cell.alignment = date_alignment
-                else:
-                    cell.alignment = data_alignment
-    
-    # 创建统计信息sheet
-    ws2 = wb.create_sheet(title="统计信息")
-    
-    # 添加统计信息
-    stats_data = {
-        '统计项': ['总订单数', '总金额', '平均金额', '总数量'],
-        '数值': [
-            len(export_data),
-            sum(row['金额'] for row in export_data if row['金额']),
-            round(sum(row['金额'] for row in export_data if row['金额']) / len(export_data), 2) if export_data else 0,
-            sum(row['数量'] for row in export_data if row['数量'])
-        ]
-    }
-    
-    stats_df = pd.DataFrame(stats_data)
-    
-    # 将统计数据写入工作表
-    for r in dataframe_to_rows(stats_df, index=False, header=True):
-        ws2.append(r)
-    
-    # 应用统计sheet样式
-    for cell in ws2[1]:
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = thick_border
-    
-    # 设置统计sheet列宽
-    ws2.column_dimensions['A'].width = 15
-    ws2.column_dimensions['B'].width = 15
-    
-    # 为统计sheet所有单元格添加边框和样式
-    for row_idx, row in enumerate(ws2.iter_rows(min_row=1, max_row=ws2.max_row, min_col=1, max_col=ws2.max_column), 1):
-        for col_idx, cell in enumerate(row, 1):
-            cell.border = thin_border
-            if cell.row > 1:
-                cell.font = data_font
-                # 交替行颜色
-                if cell.row % 2 == 0:
-                    cell.fill = data_fill_light
-                else:
-                    cell.fill = data_fill_white
-                
-                # 数值列右对齐
-                if col_idx == 2:
-                    cell.alignment = number_alignment
-                else:
-                    cell.alignment = data_alignment
-    
-    # 保存到BytesIO
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=f'订单导出_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-    )
+    return OrderFilter(user_id=filter_user_id, start_dt=start_dt, end_dt=end_dt)
 
 @main.route('/orders/import', methods=['GET', 'POST'])
 @login_required
@@ -1032,149 +827,35 @@ def import_orders():
                 
                 # 检查文件扩展名
                 file_ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
-                
-                # 读取文件
-                if file_ext in ['xlsx', 'xls']:
-                    df = pd.read_excel(file)
-                elif file_ext == 'csv':
-                    df = pd.read_csv(file, encoding='utf-8')
-                else:
+                if file_ext not in ['xlsx', 'xls', 'csv']:
                     flash(f'不支持的文件格式：{file_ext}。请使用Excel(.xlsx/.xls)或CSV(.csv)格式', 'danger')
                     return redirect(request.url)
                 
+                # 订单编码重复时的处理策略
+                policy = request.form.get('duplicate_policy', 'fail')
+                if policy not in DUPLICATE_POLICIES:
+                    policy = 'fail'
+                
+                # 按块流式读取文件，先读第一块做基本检查
+                chunks = read_import_chunks(file, file_ext)
+                first_chunk = next(chunks, None)
+                chunks.close()
+                
                 # 检查文件是否为空
-                if df.empty:
+                if first_chunk is None or first_chunk.empty:
                     flash('文件内容为空，请检查文件是否正确', 'danger')
                     return redirect(request.url)
                 
                 # 检查必要的列是否存在（支持新旧两种格式）
-                required_cols = ['微信名*', '订单编码*', '订单信息*', '完成时间*', '数量*']
-                old_required_cols = ['*微信名', '*手机号', '*订单编码', '*订单信息', '*订单类型', '*完成时间', '*数量']
-                missing_cols = []
-                
-                # 检查新格式（星号在后）
-                for col in required_cols:
-                    if col not in df.columns and col.replace('*', '') not in df.columns:
-                        # 检查旧格式（星号在前）
-                        old_col = '*' + col.replace('*', '')
-                        if old_col not in df.columns:
-                            missing_cols.append(col)
-                
-                # 特殊处理手机号（新格式中不是必填）
-                if '手机号' not in df.columns and '*手机号' not in df.columns:
-                    missing_cols.append('手机号')
-                
-                # 特殊处理订单类型（新格式中不是必填）
-                if '订单类型' not in df.columns and '*订单类型' not in df.columns:
-                    missing_cols.append('订单类型')
-                
+                missing_cols = missing_columns(first_chunk.columns)
                 if missing_cols:
                     flash(f'文件缺少必要的列：{", ".join(missing_cols)}。请检查模板格式', 'danger')
                     return redirect(request.url)
                 
-                success_count = 0
-                error_count = 0
-                errors = []
-                
-                # 获取订单类型映射
-                order_types = {ot.name: ot.id for ot in OrderType.query.all()}
-                
-                for index, row in df.iterrows():
-                    try:
-                        # 检查必填字段（支持新旧两种星号格式）
-                        phone_col = '手机号' if '手机号' in df.columns else '*手机号' if '*手机号' in df.columns else '手机号'
-                        wechat_col = '微信名*' if '微信名*' in df.columns else '*微信名' if '*微信名' in df.columns else '微信名'
-                        order_code_col = '订单编码*' if '订单编码*' in df.columns else '*订单编码' if '*订单编码' in df.columns else '订单编码'
-                        order_info_col = '订单信息*' if '订单信息*' in df.columns else '*订单信息' if '*订单信息' in df.columns else '订单信息'
-                        order_type_col = '订单类型' if '订单类型' in df.columns else '*订单类型' if '*订单类型' in df.columns else '订单类型'
-                        completion_time_col = '完成时间*' if '完成时间*' in df.columns else '*完成时间' if '*完成时间' in df.columns else '完成时间'
-                        quantity_col = '数量*' if '数量*' in df.columns else '*数量' if '*数量' in df.columns else '数量'
-                        
-                        if pd.isna(row.get(phone_col)) or str(row.get(phone_col)).strip() == '':
-                            errors.append(f"第{index+2}行：手机号不能为空")
-                            error_count += 1
-                            continue
-                        
-                        if pd.isna(row.get(wechat_col)) or str(row.get(wechat_col)).strip() == '':
-                            errors.append(f"第{index+2}行：微信名不能为空")
-                            error_count += 1
-                            continue
-                        
-                        if pd.isna(row.get(order_code_col)) or str(row.get(order_code_col)).strip() == '':
-                            errors.append(f"第{index+2}行：订单编码不能为空")
-                            error_count += 1
-                            continue
-                        
-                        if pd.isna(row.get(order_info_col)) or str(row.get(order_info_col)).strip() == '':
-                            errors.append(f"第{index+2}行：订单信息不能为空")
-                            error_count += 1
-                            continue
-                        
-                        if pd.isna(row.get(order_type_col)) or str(row.get(order_type_col)).strip() == '':
-                            errors.append(f"第{index+2}行：订单类型不能为空")
-                            error_count += 1
-                            continue
-                        
-                        if pd.isna(row.get(completion_time_col)) or str(row.get(completion_time_col)).strip() == '':
-                            errors.append(f"第{index+2}行：完成时间不能为空")
-                            error_count += 1
-                            continue
-                        
-                        if pd.isna(row.get(quantity_col)) or str(row.get(quantity_col)).strip() == '':
-                            errors.append(f"第{index+2}行：数量不能为空")
-                            error_count += 1
-                            continue
-                        
-                        # 处理完成时间
-                        completion_time = None
-                        if not pd.isna(row.get(completion_time_col)):
-                            try:
-                                if isinstance(row[completion_time_col], str):
-                                    completion_time = datetime.strptime(row[completion_time_col], '%Y-%m-%d')
-                                else:
-                                    completion_time = pd.to_datetime(row[completion_time_col]).to_pydatetime()
-                            except:
-                                pass
-                        
-                        # 处理订单类型
-                        order_type_id = None
-                        if not pd.isna(row.get(order_type_col)):
-                            order_type_name = str(row[order_type_col]).strip()
-                            order_type_id = order_types.get(order_type_name)
-                        
-                        # 创建订单（使用正确的列名，处理NaN值）
-                        order = Order(
-                            order_code=str(row.get(order_code_col, '')).strip() if not pd.isna(row.get(order_code_col)) else '',
-                            wechat_name=str(row.get(wechat_col, '')).strip() if not pd.isna(row.get(wechat_col)) else '',
-                            wechat_id=str(row.get('微信号', '')).strip() if not pd.isna(row.get('微信号')) else '',
-                            phone=str(row.get(phone_col, '')).strip() if not pd.isna(row.get(phone_col)) else '',
-                            order_info=str(row.get(order_info_col, '')).strip() if not pd.isna(row.get(order_info_col)) else '',
-                            completion_time=completion_time,
-                            quantity=int(row.get(quantity_col, 0)) if not pd.isna(row.get(quantity_col)) else None,
-                            amount=float(row.get('金额', 0)) if not pd.isna(row.get('金额')) else None,
-                            notes=str(row.get('备注', '')).strip() if not pd.isna(row.get('备注')) else '',
-                            user_id=current_user.id,
-                            order_type_id=order_type_id,
-                            status=str(row.get('状态', '未完成')).strip() if not pd.isna(row.get('状态')) else '未完成'
-                        )
-                        
-                        db.session.add(order)
-                        success_count += 1
-                        
-                    except Exception as e:
-                        errors.append(f"第{index+1}行：{str(e)}")
-                        error_count += 1
-                
-                db.session.commit()
-                
-                flash(f'导入完成！成功：{success_count}条，失败：{error_count}条', 'success')
-                
-                if errors:
-                    flash('错误详情：' + '; '.join(errors[:10]), 'warning')
-                    if len(errors) > 10:
-                        flash(f'...还有{len(errors)-10}个错误', 'warning')
-                
-                return redirect(url_for('main.order_list'))
+                # 保存文件并提交后台导入任务，跳转到进度页面
+                file.seek(0)
+                job = create_job(current_app._get_current_object(), current_user.id, file, file_ext, policy)
+                return redirect(url_for('main.import_job', id=job.id))
                 
             except pd.errors.EmptyDataError:
                 flash('文件内容为空或格式不正确，请检查文件', 'danger')
@@ -1206,7 +887,71 @@ def import_orders():
             flash('不支持的文件格式', 'danger')
             return redirect(request.url)
     
-    return render_template('main/import_orders.html')
+    return render_template('main/import_orders.html', duplicate_policies=DUPLICATE_POLICIES)
+
+def get_import_job_or_404(id):
+    """导入任务（仅提交者和管理员可查看）"""
+    job = ImportJob.query.get_or_404(id)
+    if job.user_id != current_user.id and not current_user.is_administrator():
+        abort(403)
+    return job
+
+@main.route('/orders/import/jobs/<int:id>')
+@login_required
+def import_job(id):
+    """导入任务进度页面"""
+    job = get_import_job_or_404(id)
+    resume_if_stale(current_app._get_current_object(), job)
+    recent_errors = job.errors.order_by(ImportJobError.id).limit(10).all()
+    return render_template('main/import_job.html', job=job, recent_errors=recent_errors)
+
+@main.route('/orders/import/jobs/<int:id>/progress')
+@login_required
+def import_job_progress(id):
+    """导入任务进度（轮询）"""
+    job = get_import_job_or_404(id)
+    # 执行任务的进程已退出时在本进程继续
+    resume_if_stale(current_app._get_current_object(), job)
+    data = job.to_dict()
+    data['recent_errors'] = [error.message for error in job.errors.order_by(ImportJobError.id).limit(10)]
+    return jsonify({'success': True, **data})
+
+@main.route('/orders/import/jobs/<int:id>/errors')
+@login_required
+def import_job_errors(id):
+    """下载完整错误报告（CSV）"""
+    job = get_import_job_or_404(id)
+    
+    def generate():
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        # 带BOM，便于Excel直接打开
+        buffer.write('\ufeff')
+        writer.writerow(['行号', '错误信息'])
+        query = job.errors.with_entities(ImportJobError.row_index, ImportJobError.message).order_by(
+            ImportJobError.id
+        ).execution_options(yield_per=1000)
+        for row_index, message in query:
+            writer.writerow([row_index + 2 if row_index is not None else '', message])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    
+    download_name = f'导入错误报告_{job.id}.csv'
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv; charset=utf-8',
+        headers={'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}"}
+    )
+
+@main.before_app_request
+def resume_background_work():
+    """进程启动后的首次请求时恢复停滞的导入任务、清理遗留的待删除文件、启动定时回收"""
+    app = current_app._get_current_object()
+    resume_stale_jobs(app)
+    drain_on_start(app)
+    start_upload_gc(app)
 
 @main.route('/order/image/delete/<int:id>', methods=['POST'])
 @login_required
@@ -1222,11 +967,8 @@ def delete_image(id):
         abort(403)
     
     try:
-        # 删除文件
-        image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], image.image_path.replace('uploads/', ''))
-        if os.path.exists(image_path):
-            os.remove(image_path)
-        
+        # 释放文件引用，不再被引用的文件在提交后由后台清理
+        release_files([image.image_path])
         db.session.delete(image)
         db.session.commit()
         
@@ -1294,31 +1036,44 @@ def quick_add_order():
 @login_required
 def uploaded_file(filename):
     """提供上传文件访问"""
+    # 兼容带 uploads/ 前缀或反斜杠的旧路径
+    filename = normalize_upload_path(filename) or ''
     # 安全检查：防止路径遍历攻击
     if '..' in filename or filename.startswith('/'):
         abort(404)
     
-    # 检查文件是否存在
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    if not os.path.exists(file_path):
+    # 验证文件扩展名
+    if not allowed_file(filename):
+        abort(403)
+    
+    # 文件不存在时返回404；带ETag和长期缓存，支持304和Range请求
+    return send_upload(current_app.config['UPLOAD_FOLDER'], filename,
+                       accel_prefix=current_app.config.get('UPLOAD_ACCEL_PREFIX'))
+
+@main.route('/uploads/thumbs/<path:filename>')
+@login_required
+def uploaded_thumbnail(filename):
+    """提供上传图片的缩略图，缓存中没有时生成；无法生成时返回原图（原图不存在时404）"""
+    filename = normalize_upload_path(filename) or ''
+    if '..' in filename or filename.startswith('/'):
         abort(404)
     
-    # 验证文件扩展名
     if not allowed_file(filename):
         abort(403)
     
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+    thumb = ensure_thumbnail(current_app, filename)
+    if thumb is None:
+        return send_upload(current_app.config['UPLOAD_FOLDER'], filename,
+                           accel_prefix=current_app.config.get('UPLOAD_ACCEL_PREFIX'))
+    folder = current_app.config['THUMBNAIL_FOLDER']
+    return send_upload(folder, os.path.relpath(thumb, folder).replace(os.sep, '/'),
+                       mimetype=thumbnail_mimetype(thumb),
+                       accel_prefix=current_app.config.get('THUMBNAIL_ACCEL_PREFIX'))
 
 @main.route('/order/update_status/<int:order_id>', methods=['POST'])
 @login_required
 def update_order_status(order_id):
     """更新订单状态"""
-    order = Order.query.get_or_404(order_id)
-    
-    # 权限检查
-    if not current_user.can(Permission.VIEW_ALL) and order.user_id != current_user.id:
-        return jsonify({'success': False, 'error': '权限不足'})
-    
     try:
         # 支持JSON和表单数据
         if request.is_json:
@@ -1331,29 +1086,28 @@ def update_order_status(order_id):
             return jsonify({'success': False, 'error': '状态不能为空'})
         
         # 验证状态值
-        valid_statuses = ['未完成', '已完成', '已结算', '未结算']
-        if new_status not in valid_statuses:
+        if new_status not in ORDER_STATUSES:
             return jsonify({'success': False, 'error': '无效的状态值'})
         
-        order.status = new_status
-        
-        # 如果状态改为已完成，自动设置完成时间
-        if new_status == '已完成' and not order.completion_time:
-            order.completion_time = datetime.now()
-        
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'message': '状态更新成功',
-            'new_status': new_status,
-            'completion_time': order.completion_time.strftime('%Y-%m-%d') if order.completion_time else None
-        })
-        
+        # 无查看全部权限时只能修改自己的订单
+        owner_id = None if current_user.can(Permission.VIEW_ALL) else current_user.id
+        result = commit_status_update([order_id], new_status, user_id=owner_id)
+        completion_time = db.session.query(Order.completion_time).filter_by(id=order_id).scalar()
     except Exception as e:
-        db.session.rollback()
         print(f"更新订单状态失败: {e}")
         return jsonify({'success': False, 'error': f'更新失败：{str(e)}'})
+    
+    if not result.matched:
+        if db.session.query(Order.id).filter_by(id=order_id).first() is None:
+            abort(404)
+        return jsonify({'success': False, 'error': '权限不足'})
+    
+    return jsonify({
+        'success': True,
+        'message': '状态更新成功',
+        'new_status': new_status,
+        'completion_time': completion_time.strftime('%Y-%m-%d') if completion_time else None
+    })
 
 @main.route('/batch_update_status', methods=['POST'])
 @login_required
@@ -1379,39 +1133,18 @@ def batch_update_status():
             return jsonify({'success': False, 'error': '状态不能为空'})
         
         # 验证状态值
-        valid_statuses = ['未完成', '已完成', '已结算', '未结算']
-        if new_status not in valid_statuses:
+        if new_status not in ORDER_STATUSES:
             return jsonify({'success': False, 'error': '无效的状态值'})
         
-        success_count = 0
-        error_count = 0
-        
-        for order_id in order_ids:
-            try:
-                order = Order.query.get(int(order_id))
-                if order:
-                    order.status = new_status
-                    
-                    # 如果状态改为已完成，自动设置完成时间
-                    if new_status == '已完成' and not order.completion_time:
-                        order.completion_time = datetime.now()
-                    
-                    success_count += 1
-                else:
-                    error_count += 1
-            except Exception as e:
-                error_count += 1
-                print(f"更新订单 {order_id} 失败: {e}")
-        
-        db.session.commit()
+        result = commit_status_update(order_ids, new_status)
         
         return jsonify({
             'success': True,
-            'message': f'批量更新完成！成功：{success_count}条，失败：{error_count}条'
+            'message': f'批量更新完成！成功：{result.matched}条，失败：{result.missing}条',
+            **result.to_dict()
         })
         
     except Exception as e:
-        db.session.rollback()
         print(f"批量更新状态失败: {e}")
         return jsonify({'success': False, 'error': f'批量更新失败：{str(e)}'})
 
@@ -1433,41 +1166,16 @@ def batch_delete_orders():
         if not order_ids:
             return jsonify({'success': False, 'error': '请选择要删除的订单'})
         
-        success_count = 0
-        error_count = 0
-        
-        for order_id in order_ids:
-            try:
-                order = Order.query.get(int(order_id))
-                if order:
-                    # 删除相关图片
-                    for image in order.images:
-                        try:
-                            image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], image.image_path.replace('uploads/', ''))
-                            if os.path.exists(image_path):
-                                os.remove(image_path)
-                        except Exception as e:
-                            print(f"删除图片失败: {e}")
-                            pass
-                        db.session.delete(image)
-                    
-                    db.session.delete(order)
-                    success_count += 1
-                else:
-                    error_count += 1
-            except Exception as e:
-                error_count += 1
-                print(f"删除订单 {order_id} 失败: {e}")
-        
-        db.session.commit()
+        # 订单和图片记录分块删除，图片文件在提交后由后台清理
+        result = commit_delete_orders(order_ids)
         
         return jsonify({
             'success': True,
-            'message': f'批量删除完成！成功：{success_count}条，失败：{error_count}条'
+            'message': f'批量删除完成！成功：{result.deleted}条，失败：{result.missing}条',
+            **result.to_dict()
         })
         
     except Exception as e:
-        db.session.rollback()
         return jsonify({'success': False, 'message': f'批量删除失败：{str(e)}'})
 
 @main.route('/backup/database', methods=['POST'])
@@ -164,7 +164,7 @@ class OrderImage(db.Model):
     __tablename__ = 'order_images'
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id'))
-    image_path = db.Column(db.String(256))
+    image_path = db.Column(db.String(256), index=True)
     upload_time = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Order(db.Model):
@@ -173,17 +173,21 @@ class Order(db.Model):
     order_code = db.Column(db.String(64), unique=True, index=True)
     wechat_name = db.Column(db.String(64))
     wechat_id = db.Column(db.String(64))
-    phone = db.Column(db.String(20), nullable=False)  # 手机号，必填
+    # active_history：修改手机号时加载旧值，旧手机号的微信用户同样需要同步
+    phone = db.column_property(db.Column(db.String(20), nullable=False, index=True), active_history=True)  # 手机号，必填
     order_info = db.Column(db.Text())
-    completion_time = db.Column(db.DateTime)
-    quantity = db.Column(db.Integer)
-    amount = db.Column(db.Float)
+    # active_history：汇总表（rollup）跟踪的字段修改时加载旧值，保证增量准确
+    completion_time = db.column_property(db.Column(db.DateTime), active_history=True)
+    quantity = db.column_property(db.Column(db.Integer), active_history=True)
+    amount = db.column_property(db.Column(db.Float), active_history=True)
     notes = db.Column(db.Text())  # 备注字段
     create_time = db.Column(db.DateTime, default=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-    order_type_id = db.Column(db.Integer, db.ForeignKey('order_types.id'))
+    user_id = db.column_property(db.Column(db.Integer, db.ForeignKey('users.id')), active_history=True)
+    order_type_id = db.column_property(db.Column(db.Integer, db.ForeignKey('order_types.id')), active_history=True)
+    # 按手机号关联的微信用户，订单写入和微信用户增删改时维护
+    wechat_user_id = db.Column(db.Integer, db.ForeignKey('wechat_users.id', ondelete='SET NULL'), index=True)
     # 订单状态字段
-    status = db.Column(db.String(20), default='未完成')  # 订单状态：未完成、已结算、未结算
+    status = db.column_property(db.Column(db.String(20), default='未完成'), active_history=True)  # 订单状态：未完成、已结算、未结算
     images = db.relationship('OrderImage', backref='order', lazy='dynamic')
     # 存储自定义字段的值
     custom_fields = db.Column(db.Text())
@@ -239,12 +243,141 @@ class Order(db.Model):
     def __repr__(self):
         return f'<Order {self.order_code}>'
 
+class DailyOrderRollup(db.Model):
+    """按完成日期汇总的订单统计（物化表），NULL 维度以 0 / '' 存储"""
+    __tablename__ = 'daily_order_rollup'
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True, default=0)
+    order_type_id = db.Column(db.Integer, primary_key=True, default=0)
+    status = db.Column(db.String(20), primary_key=True, default='')
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Float, nullable=False, default=0)
+    total_quantity = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DailyOrderRollup {self.day} {self.user_id}>'
+
+class ImportJob(db.Model):
+    """后台订单导入任务，进度按块持久化，进程重启后从最后提交的块继续"""
+    __tablename__ = 'import_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    filename = db.Column(db.String(256))
+    file_path = db.Column(db.String(256))  # 上传文件的保存路径，任务结束后删除
+    file_ext = db.Column(db.String(8))
+    duplicate_policy = db.Column(db.String(16), default='fail')
+    status = db.Column(db.String(16), default='pending', index=True)  # pending, running, done, failed
+    message = db.Column(db.Text())  # 任务失败的原因
+    rows_total = db.Column(db.Integer)
+    rows_processed = db.Column(db.Integer, default=0)
+    success_count = db.Column(db.Integer, default=0)
+    error_count = db.Column(db.Integer, default=0)
+    skipped_count = db.Column(db.Integer, default=0)
+    chunks_committed = db.Column(db.Integer, default=0)
+    chunks_failed = db.Column(db.Integer, default=0)
+    checkpoint = db.Column(db.Integer)  # 最后一个已处理块的末行索引
+    create_time = db.Column(db.DateTime, default=datetime.utcnow)
+    update_time = db.Column(db.DateTime, default=datetime.utcnow)  # 执行中作为心跳，每块更新
+    finish_time = db.Column(db.DateTime)
+    errors = db.relationship('ImportJobError', backref='job', lazy='dynamic', cascade='all, delete-orphan')
+
+    @property
+    def progress(self):
+        if self.status == 'done':
+            return 100
+        if not self.rows_total:
+            return 0
+        return min(99, int((self.rows_processed or 0) * 100 / self.rows_total))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'message': self.message,
+            'rows_total': self.rows_total,
+            'rows_processed': self.rows_processed,
+            'success_count': self.success_count,
+            'error_count': self.error_count,
+            'skipped_count': self.skipped_count,
+            'chunks_committed': self.chunks_committed,
+            'chunks_failed': self.chunks_failed,
+            'progress': self.progress
+        }
+
+    def __repr__(self):
+        return f'<ImportJob {self.id} {self.status}>'
+
+class ImportJobError(db.Model):
+    """导入任务的逐行错误（完整错误报告）"""
+    __tablename__ = 'import_job_errors'
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('import_jobs.id'), index=True, nullable=False)
+    row_index = db.Column(db.Integer)  # 数据行索引，Excel行号 = 索引 + 2
+    message = db.Column(db.Text())
+
+class ExportJob(db.Model):
+    """后台导出任务（各工作进程共享），相同筛选条件且数据版本未变时复用已完成任务的文件"""
+    __tablename__ = 'export_jobs'
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    key = db.Column(db.String(40), index=True)  # 筛选条件哈希
+    fmt = db.Column(db.String(8))
+    version = db.Column(db.Integer)  # 提交时的订单数据版本
+    status = db.Column(db.String(16), default='pending', index=True)  # pending, running, done, failed
+    written = db.Column(db.Integer, default=0)  # 完成时写入；执行中的进度保存在执行进程内
+    total = db.Column(db.Integer)
+    path = db.Column(db.String(256))
+    error = db.Column(db.Text())
+    cached = db.Column(db.Boolean, default=False)
+    create_time = db.Column(db.DateTime, default=datetime.utcnow)
+    finish_time = db.Column(db.DateTime, index=True)
+
+    def __repr__(self):
+        return f'<ExportJob {self.id} {self.status}>'
+
+class DataVersion(db.Model):
+    """数据版本号（各工作进程共享）：相关数据提交变更后递增，用于判断缓存是否失效"""
+    __tablename__ = 'data_versions'
+    name = db.Column(db.String(32), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class PendingFileDeletion(db.Model):
+    """待删除的上传文件：与删除记录的事务一同写入，提交后由后台清理线程删除文件"""
+    __tablename__ = 'pending_file_deletions'
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(256), nullable=False)  # 相对上传目录的路径（同 OrderImage.image_path）
+    attempts = db.Column(db.Integer, default=0)  # 删除失败的次数
+    create_time = db.Column(db.DateTime, default=datetime.utcnow)
+
+class OrderPhoneChange(db.Model):
+    """订单新增、删除或微信信息变更涉及的手机号：与订单写入同一事务登记（每个手机号一行），增量刷新微信用户时处理"""
+    __tablename__ = 'order_phone_changes'
+    id = db.Column(db.Integer, primary_key=True)
+    phone = db.Column(db.String(20), unique=True, nullable=False)
+    create_time = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UploadBlob(db.Model):
+    """内容寻址存储的上传文件，相同内容只保存一份；引用计数归零时删除文件"""
+    __tablename__ = 'upload_blobs'
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 十六进制
+    path = db.Column(db.String(256), unique=True, nullable=False)  # 相对上传目录的路径
+    size = db.Column(db.Integer)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Boolean, nullable=False, default=False)  # 是否已压缩（去除EXIF、限制尺寸）
+    create_time = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<UploadBlob {self.digest[:12]} refs={self.ref_count}>'
+
 class WechatUser(db.Model):
     __tablename__ = 'wechat_users'
     id = db.Column(db.Integer, primary_key=True)
     wechat_name = db.Column(db.String(64), nullable=False)
     wechat_id = db.Column(db.String(64), nullable=True, index=True)
-    phone = db.Column(db.String(20), unique=True, nullable=True)
+    # active_history：修改手机号时加载旧值，原手机号的订单需要重新关联
+    phone = db.column_property(db.Column(db.String(20), unique=True, nullable=True), active_history=True)
     email = db.Column(db.String(64))
     address = db.Column(db.String(256))
     avatar = db.Column(db.String(200))
@@ -252,15 +385,23 @@ class WechatUser(db.Model):
     notes = db.Column(db.Text())
     create_time = db.Column(db.DateTime, default=datetime.utcnow)
     update_time = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 订单统计（冗余存储，订单写入时按 wechat_user_id 重算，flask verify-wechat-counters 校验）
+    total_orders = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    amount_orders = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # 填写了金额的订单数（计算平均金额）
+    total_amount = db.Column(db.Float, nullable=False, default=0, server_default='0', index=True)
+    total_quantity = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    first_order_time = db.Column(db.DateTime)
+    last_order_time = db.Column(db.DateTime, index=True)
+    unsettled_amount = db.Column(db.Float, nullable=False, default=0, server_default='0')  # 状态不是“已结算”的订单金额
+    # 删除微信用户时由数据库将订单的 wechat_user_id 置空，不逐条加载订单
+    orders = db.relationship('Order', backref='wechat_user', lazy='dynamic', passive_deletes=True)
     
     def __repr__(self):
         return f'<WechatUser {self.wechat_name}>'
     
     def get_orders(self, start_date=None, end_date=None, order_type_id=None):
-        """获取用户的订单"""
-        from sqlalchemy import and_
-        
-        query = Order.query.filter(Order.wechat_name == self.wechat_name)
+        """获取用户的订单（按 wechat_user_id 索引查询）"""
+        query = self.orders
         
         if start_date:
             query = query.filter(Order.create_time >= start_date)
@@ -272,10 +413,18 @@ class WechatUser(db.Model):
         return query.order_by(Order.create_time.desc()).all()
     
     def get_order_stats(self, start_date=None, end_date=None):
-        """获取用户订单统计"""
+        """获取用户订单统计（不限日期时直接读取冗余的统计字段）"""
         from sqlalchemy import func
         
-        query = Order.query.filter(Order.wechat_name == self.wechat_name)
+        if start_date is None and end_date is None:
+            return {
+                'total_orders': self.total_orders or 0,
+                'total_amount': float(self.total_amount or 0),
+                'avg_amount': float(self.total_amount or 0) / self.amount_orders if self.amount_orders else 0.0,
+                'total_quantity': self.total_quantity or 0
+            }
+        
+        query = self.orders
         
         if start_date:
             query = query.filter(Order.create_time >= start_date)
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+订单批量操作模块
+按ID分块执行集合式 UPDATE / DELETE，不逐条加载ORM对象；
+汇总表增量在同一事务内写入，提交后使导出缓存失效，删除的图片文件在提交后由后台清理
+"""
+
+from datetime import datetime
+from sqlalchemy import update, delete, func
+from . import db
+from .models import Order, OrderImage
+from .rollup import RollupDelta, TRACKED_FIELDS
+from .export_jobs import mark_orders_changed
+from .blob_store import release_files
+from .wechat_users import record_order_phones, update_counters
+
+
+# 订单状态可选值
+ORDER_STATUSES = ['未完成', '已完成', '已结算', '未结算']
+
+# 改为该状态时自动补全完成时间
+COMPLETED_STATUS = '已完成'
+
+# 每条 UPDATE / DELETE 语句 IN 列表中的ID数量
+STATUS_UPDATE_CHUNK_SIZE = 500
+DELETE_CHUNK_SIZE = 500
+
+
+class StatusUpdateResult:
+    """批量修改状态的结果"""
+
+    def __init__(self, requested):
+        self.requested = requested
+        self.matched = 0
+        self.changed = 0
+        self.invalid = []
+
+    @property
+    def missing(self):
+        """不存在、无权限或ID无效的数量"""
+        return self.requested - self.matched
+
+    def to_dict(self):
+        return {
+            'requested': self.requested,
+            'matched': self.matched,
+            'changed': self.changed,
+            'missing': self.missing
+        }
+
+
+class DeleteResult:
+    """批量删除订单的结果"""
+
+    def __init__(self, requested):
+        self.requested = requested
+        self.deleted = 0
+        self.images = 0
+
+    @property
+    def missing(self):
+        """不存在、无权限或ID无效的数量"""
+        return self.requested - self.deleted
+
+    def to_dict(self):
+        return {
+            'requested': self.requested,
+            'deleted': self.deleted,
+            'images': self.images,
+            'missing': self.missing
+        }
+
+
+def parse_order_ids(order_ids):
+    """
+    将请求中的订单ID转换为整数并去重（保持原顺序）
+
+    Returns:
+        tuple: (ID列表, 无效值列表)
+    """
+    ids, invalid, seen = [], [], set()
+    for value in order_ids:
+        try:
+            order_id = int(value)
+        except (TypeError, ValueError):
+            invalid.append(value)
+            continue
+        if order_id not in seen:
+            seen.add(order_id)
+            ids.append(order_id)
+    return ids, invalid
+
+
+def _id_chunks(ids, chunk_size):
+    for start in range(0, len(ids), chunk_size):
+        yield ids[start:start + chunk_size]
+
+
+def update_orders_status(order_ids, new_status, user_id=None, now=None,
+                         chunk_size=STATUS_UPDATE_CHUNK_SIZE):
+    """
+    批量修改订单状态（调用方负责提交事务）
+
+    每块先按主键读取汇总相关的旧值，再执行一条
+    UPDATE orders SET status=..., completion_time=COALESCE(completion_time, now) WHERE id IN (...)；
+    仅改为“已完成”时补全完成时间，其它状态保持原完成时间。
+
+    Args:
+        order_ids: 订单ID列表（可为字符串，重复和无效值会被忽略）
+        new_status: 目标状态，须在 ORDER_STATUSES 中
+        user_id: 指定时只修改该用户的订单
+        now: 补全的完成时间，默认为当前时间
+
+    Returns:
+        StatusUpdateResult
+    """
+    if new_status not in ORDER_STATUSES:
+        raise ValueError('无效的状态值')
+    ids, invalid = parse_order_ids(order_ids)
+    result = StatusUpdateResult(len(ids) + len(invalid))
+    result.invalid = invalid
+    if not ids:
+        return result
+
+    now = now or datetime.now()
+    completes = new_status == COMPLETED_STATUS
+    if completes:
+        completion_time = func.coalesce(Order.completion_time, now)
+    else:
+        completion_time = Order.completion_time
+
+    delta = RollupDelta()
+    wechat_user_ids = set()
+    columns = [getattr(Order, field) for field in TRACKED_FIELDS]
+    for chunk in _id_chunks(ids, chunk_size):
+        conditions = [Order.id.in_(chunk)]
+        if user_id is not None:
+            conditions.append(Order.user_id == user_id)
+
+        for *row, wechat_user_id in db.session.query(*columns, Order.wechat_user_id).filter(*conditions):
+            previous = dict(zip(TRACKED_FIELDS, row))
+            current = dict(previous, status=new_status)
+            if completes and current['completion_time'] is None:
+                current['completion_time'] = now
+            if current != previous:
+                result.changed += 1
+                delta.add(previous, sign=-1)
+                delta.add(current)
+                if previous['status'] != new_status:
+                    wechat_user_ids.add(wechat_user_id)
+
+        result.matched += db.session.execute(
+            update(Order).where(*conditions).values(
+                status=new_status,
+                completion_time=completion_time
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+
+    delta.apply(db.session.connection())
+    # 未结算金额随状态变化
+    update_counters(db.session.connection(), user_ids=wechat_user_ids)
+    return result
+
+
+def commit_status_update(order_ids, new_status, user_id=None):
+    """修改状态并提交，有订单变化时使导出缓存失效"""
+    try:
+        result = update_orders_status(order_ids, new_status, user_id=user_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if result.changed:
+        mark_orders_changed()
+    return result
+
+
+def delete_orders(order_ids, user_id=None, chunk_size=DELETE_CHUNK_SIZE):
+    """
+    批量删除订单及其图片记录（调用方负责提交事务）
+
+    每块读取汇总相关的旧值和图片路径后，依次执行
+    DELETE FROM order_images WHERE order_id IN (...) 与 DELETE FROM orders WHERE id IN (...)；
+    释放图片文件的引用，不再被引用的文件提交后由后台清理线程删除；同步并登记订单手机号对应的微信用户。
+
+    Args:
+        order_ids: 订单ID列表（可为字符串，重复和无效值会被忽略）
+        user_id: 指定时只删除该用户的订单
+
+    Returns:
+        DeleteResult
+    """
+    ids, invalid = parse_order_ids(order_ids)
+    result = DeleteResult(len(ids) + len(invalid))
+    if not ids:
+        return result
+
+    delta = RollupDelta()
+    columns = [getattr(Order, field) for field in TRACKED_FIELDS]
+    for chunk in _id_chunks(ids, chunk_size):
+        conditions = [Order.id.in_(chunk)]
+        if user_id is not None:
+            conditions.append(Order.user_id == user_id)
+
+        matched, phones = [], []
+        for row in db.session.query(Order.id, Order.phone, *columns).filter(*conditions):
+            matched.append(row[0])
+            phones.append(row[1])
+            delta.add(dict(zip(TRACKED_FIELDS, row[2:])), sign=-1)
+        if not matched:
+            continue
+
+        paths = [path for (path,) in db.session.query(OrderImage.image_path).filter(
+            OrderImage.order_id.in_(matched)
+        )]
+        db.session.execute(
+            delete(OrderImage).where(OrderImage.order_id.in_(matched))
+            .execution_options(synchronize_session=False)
+        )
+        result.deleted += db.session.execute(
+            delete(Order).where(Order.id.in_(matched))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        result.images += len(paths)
+        release_files(paths)
+        record_order_phones(phones)
+
+    delta.apply(db.session.connection())
+    return result
+
+
+def commit_delete_orders(order_ids, user_id=None):
+    """删除订单并提交，有订单删除时使导出缓存失效"""
+    try:
+        result = delete_orders(order_ids, user_id=user_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if result.deleted:
+        mark_orders_changed()
+    return result
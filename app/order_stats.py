@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+订单筛选与统计模块
+统一构建订单筛选条件，并以尽量少的表扫描计算汇总指标和分组统计
+"""
+
+from collections import namedtuple
+from sqlalchemy import func
+from . import db
+from .models import Order, OrderType, User
+from .search import search_condition
+
+
+StatusStat = namedtuple('StatusStat', ['status', 'count', 'amount'])
+TypeStat = namedtuple('TypeStat', ['name', 'order_count', 'total_amount'])
+UserStat = namedtuple('UserStat', ['username', 'order_count', 'total_amount'])
+
+
+class OrderFilter:
+    """订单筛选条件（用户、日期范围、搜索）"""
+
+    SEARCH_COLUMNS = ('wechat_name', 'wechat_id', 'phone', 'order_code')
+
+    def __init__(self, user_id=None, start_dt=None, end_dt=None, search_type=None, search_value=None,
+                 date_column=Order.completion_time, end_exclusive=False):
+        """
+        Args:
+            user_id: 创建用户ID
+            start_dt: 开始时间（包含）
+            end_dt: 结束时间
+            search_type: 搜索字段（wechat_name/wechat_id/phone/order_code）
+            search_value: 搜索内容（模糊匹配）
+            date_column: 日期筛选所用的列
+            end_exclusive: 结束时间是否为开区间
+        """
+        self.user_id = user_id
+        self.start_dt = start_dt
+        self.end_dt = end_dt
+        self.search_type = search_type
+        self.search_value = search_value
+        self.date_column = date_column
+        self.end_exclusive = end_exclusive
+
+    def conditions(self):
+        """返回筛选条件列表"""
+        conditions = []
+        if self.user_id:
+            conditions.append(Order.user_id == self.user_id)
+        if self.start_dt:
+            conditions.append(self.date_column >= self.start_dt)
+        if self.end_dt:
+            if self.end_exclusive:
+                conditions.append(self.date_column < self.end_dt)
+            else:
+                conditions.append(self.date_column <= self.end_dt)
+        if self.search_value and self.search_type in self.SEARCH_COLUMNS:
+            conditions.append(search_condition(Order, self.search_value, [self.search_type]))
+        return conditions
+
+    def apply(self, query):
+        """将筛选条件应用到查询上"""
+        return query.filter(*self.conditions())
+
+
+class OrderAggregator:
+    """基于同一组筛选条件计算订单统计"""
+
+    def __init__(self, order_filter):
+        self.order_filter = order_filter
+
+    def headline(self):
+        """
+        一次查询计算汇总指标
+
+        Returns:
+            dict: total_orders, total_amount, avg_amount, total_quantity
+        """
+        row = self.order_filter.apply(db.session.query(
+            func.count(Order.id),
+            func.sum(Order.amount),
+            func.avg(Order.amount),
+            func.sum(Order.quantity)
+        )).one()
+        return {
+            'total_orders': row[0] or 0,
+            'total_amount': row[1] or 0,
+            'avg_amount': row[2] or 0,
+            'total_quantity': row[3] or 0
+        }
+
+    def breakdown(self):
+        """
+        一次分组查询（状态 × 类型 × 用户）同时得到汇总指标和各维度分组统计
+
+        Returns:
+            dict: headline 中的指标，以及 status_stats、type_stats、user_stats
+        """
+        rows = self.order_filter.apply(db.session.query(
+            Order.status,
+            Order.order_type_id,
+            Order.user_id,
+            User.username,
+            func.count(Order.id),
+            func.sum(Order.amount),
+            func.count(Order.amount),
+            func.sum(Order.quantity)
+        ).outerjoin(User, User.id == Order.user_id)).group_by(
+            Order.status, Order.order_type_id, Order.user_id, User.username
+        ).all()
+
+        total_orders = 0
+        total_amount = None
+        amount_count = 0
+        total_quantity = None
+        by_status = {}
+        by_type = {}
+        by_user = {}
+
+        for status, type_id, user_id, username, count, amount, counted, quantity in rows:
+            total_orders += count
+            amount_count += counted
+            total_amount = _add(total_amount, amount)
+            total_quantity = _add(total_quantity, quantity)
+            _merge(by_status, status, count, amount)
+            _merge(by_type, type_id, count, amount)
+            if username is not None:
+                _merge(by_user, (user_id, username), count, amount)
+
+        # 与原外连接语义一致：无筛选条件时列出全部订单类型（含无订单的类型）
+        include_empty_types = not self.order_filter.conditions()
+        type_stats = []
+        for type_id, name in db.session.query(OrderType.id, OrderType.name).order_by(OrderType.id):
+            if type_id in by_type:
+                count, amount = by_type[type_id]
+                type_stats.append(TypeStat(name, count, amount))
+            elif include_empty_types:
+                type_stats.append(TypeStat(name, 0, None))
+
+        return {
+            'total_orders': total_orders,
+            'total_amount': total_amount or 0,
+            'avg_amount': (total_amount or 0) / amount_count if amount_count else 0,
+            'total_quantity': total_quantity or 0,
+            'status_stats': [StatusStat(status, count, amount)
+                             for status, (count, amount) in by_status.items()],
+            'type_stats': type_stats,
+            'user_stats': [UserStat(username, count, amount)
+                           for (_, username), (count, amount) in sorted(by_user.items())]
+        }
+
+    def top_wechat_users(self, sort_by='amount', limit=10):
+        """按微信名分组的排行（订单数或金额）"""
+        query = self.order_filter.apply(db.session.query(
+            Order.wechat_name,
+            func.count(Order.id).label('order_count'),
+            func.sum(Order.amount).label('total_amount')
+        )).filter(Order.wechat_name.isnot(None)).group_by(Order.wechat_name)
+
+        if sort_by == 'count':
+            query = query.order_by(func.count(Order.id).desc())
+        else:
+            query = query.order_by(func.sum(Order.amount).desc())
+        return query.limit(limit).all()
+
+
+def _add(total, value):
+    """与SQL SUM一致：全部为NULL时结果为NULL"""
+    if value is None:
+        return total
+    return value if total is None else total + value
+
+
+def _merge(groups, key, count, amount):
+    current = groups.get(key)
+    if current is None:
+        groups[key] = (count, amount)
+    else:
+        groups[key] = (current[0] + count, _add(current[1], amount))
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+游标分页模块
+基于 (排序列, id) 的键集分页，翻到第N页的开销与第1页相同
+"""
+
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(sort_key, value, row_id, direction):
+    """
+    将游标位置编码为不透明的URL安全字符串
+
+    Args:
+        sort_key: 排序方式标识（用于校验游标与当前排序一致）
+        value: 排序列的值
+        row_id: 行ID（排序值相同时的次序依据）
+        direction: 'next' 或 'prev'
+
+    Returns:
+        str: 游标字符串
+    """
+    payload = {'s': sort_key, 'i': row_id, 'd': direction}
+    if isinstance(value, datetime):
+        payload['t'] = value.isoformat()
+    else:
+        payload['v'] = value
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort_key):
+    """
+    解析游标字符串
+
+    Returns:
+        tuple: (value, row_id, direction)，游标无效或与排序方式不符时返回 None
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+        if payload.get('s') != sort_key or payload.get('d') not in ('next', 'prev'):
+            return None
+        if 't' in payload:
+            value = datetime.fromisoformat(payload['t'])
+        else:
+            value = payload.get('v')
+        return value, int(payload['i']), payload['d']
+    except (ValueError, TypeError, KeyError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPagination:
+    """
+    键集（游标）分页
+
+    按 排序列 DESC NULLS LAST, id DESC 排序，通过 WHERE 条件定位到游标之后的行，
+    不使用 OFFSET，因此深分页与首页开销一致。
+    提供与 Flask-SQLAlchemy Pagination 相近的属性（items、total、has_next、has_prev）。
+    """
+
+    def __init__(self, query, column, id_column, sort_key, cursor=None, per_page=10, total=None):
+        self.column = column
+        self.id_column = id_column
+        self.sort_key = sort_key
+        self.per_page = per_page
+        self.total = total
+
+        position = decode_cursor(cursor, sort_key) if cursor else None
+        direction = position[2] if position else 'next'
+
+        query = query.order_by(None)
+        if position and direction == 'prev':
+            value, row_id, _ = position
+            rows = query.filter(self._before(value, row_id)).order_by(
+                column.asc().nullsfirst(), id_column.asc()
+            ).limit(per_page + 1).all()
+            self.has_prev = len(rows) > per_page
+            self.has_next = True
+            self.items = list(reversed(rows[:per_page]))
+        else:
+            if position:
+                value, row_id, _ = position
+                query = query.filter(self._after(value, row_id))
+            rows = query.order_by(
+                column.desc().nullslast(), id_column.desc()
+            ).limit(per_page + 1).all()
+            self.has_next = len(rows) > per_page
+            self.has_prev = position is not None
+            self.items = rows[:per_page]
+
+    def _after(self, value, row_id):
+        """降序、NULL在最后时，位于游标之后的行"""
+        if value is None:
+            return and_(self.column.is_(None), self.id_column < row_id)
+        return or_(
+            self.column < value,
+            and_(self.column == value, self.id_column < row_id),
+            self.column.is_(None)
+        )
+
+    def _before(self, value, row_id):
+        """降序、NULL在最后时，位于游标之前的行"""
+        if value is None:
+            return or_(
+                self.column.isnot(None),
+                and_(self.column.is_(None), self.id_column > row_id)
+            )
+        return or_(
+            self.column > value,
+            and_(self.column == value, self.id_column > row_id)
+        )
+
+    def _cursor_for(self, item, direction):
+        return encode_cursor(
+            self.sort_key,
+            getattr(item, self.column.key),
+            getattr(item, self.id_column.key),
+            direction
+        )
+
+    @property
+    def next_cursor(self):
+        if not self.has_next or not self.items:
+            return None
+        return self._cursor_for(self.items[-1], 'next')
+
+    @property
+    def prev_cursor(self):
+        if not self.has_prev or not self.items:
+            return None
+        return self._cursor_for(self.items[0], 'prev')
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+每日订单汇总模块
+维护 daily_order_rollup 物化表，统计页面按天读取汇总行而非逐条加载订单；
+订单的增删改在同一事务内以增量方式写入汇总表
+"""
+
+from datetime import datetime, date, timedelta
+from sqlalchemy import event, func, insert, select, delete, inspect
+from . import db
+from .models import Order, DailyOrderRollup, User
+
+
+def _day_bounds(start_date, end_date):
+    """日期范围转换为完成时间的 [开始, 结束) 区间"""
+    start_dt = datetime.combine(start_date, datetime.min.time()) if start_date else None
+    end_dt = datetime.combine(end_date + timedelta(days=1), datetime.min.time()) if end_date else None
+    return start_dt, end_dt
+
+
+def rebuild_rollup(start_date=None, end_date=None, connection=None):
+    """
+    按订单表重建指定日期范围（含首尾）的汇总行，不指定时重建全部
+
+    Args:
+        start_date: 开始日期
+        end_date: 结束日期
+        connection: 可选，在已有连接（事务）上执行
+
+    Returns:
+        int: 写入的汇总行数
+    """
+    start_dt, end_dt = _day_bounds(start_date, end_date)
+
+    clear = delete(DailyOrderRollup)
+    if start_date:
+        clear = clear.where(DailyOrderRollup.day >= start_date)
+    if end_date:
+        clear = clear.where(DailyOrderRollup.day <= end_date)
+
+    day = func.date(Order.completion_time)
+    user_id = func.coalesce(Order.user_id, 0)
+    order_type_id = func.coalesce(Order.order_type_id, 0)
+    status = func.coalesce(Order.status, '')
+    source = select(
+        day, user_id, order_type_id, status,
+        func.count(Order.id),
+        func.coalesce(func.sum(Order.amount), 0),
+        func.coalesce(func.sum(Order.quantity), 0)
+    ).where(Order.completion_time.isnot(None))
+    if start_dt:
+        source = source.where(Order.completion_time >= start_dt)
+    if end_dt:
+        source = source.where(Order.completion_time < end_dt)
+    source = source.group_by(day, user_id, order_type_id, status)
+
+    fill = insert(DailyOrderRollup).from_select(
+        ['day', 'user_id', 'order_type_id', 'status', 'order_count', 'total_amount', 'total_quantity'],
+        source
+    )
+
+    if connection is not None:
+        connection.execute(clear)
+        return connection.execute(fill).rowcount
+    with db.engine.begin() as conn:
+        conn.execute(clear)
+        return conn.execute(fill).rowcount
+
+
+def daily_user_rollup(start_date, end_date):
+    """
+    读取日期范围内按 (日期, 用户) 聚合的汇总行
+
+    Returns:
+        list: (day, user_id, username, order_count, total_amount, total_quantity)
+    """
+    return db.session.query(
+        DailyOrderRollup.day,
+        DailyOrderRollup.user_id,
+        User.username,
+        func.sum(DailyOrderRollup.order_count),
+        func.sum(DailyOrderRollup.total_amount),
+        func.sum(DailyOrderRollup.total_quantity)
+    ).outerjoin(User, User.id == DailyOrderRollup.user_id).filter(
+        DailyOrderRollup.day >= start_date,
+        DailyOrderRollup.day <= end_date
+    ).group_by(
+        DailyOrderRollup.day, DailyOrderRollup.user_id, User.username
+    ).order_by(DailyOrderRollup.day).all()
+
+
+# 影响汇总的订单字段
+TRACKED_FIELDS = ('completion_time', 'user_id', 'order_type_id', 'status', 'amount', 'quantity')
+
+
+def _as_day(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return None
+
+
+class RollupDelta:
+    """
+    汇总表增量：累积订单的增删改，按汇总键合并后一次写入
+
+    批量SQL（绕过ORM flush）的写入路径可直接使用本类，
+    在同一事务中调用 add() 记录变更前/后的订单值，再调用 apply()。
+    """
+
+    def __init__(self):
+        self.changes = {}
+
+    def add(self, values, sign=1):
+        """
+        记录一条订单的贡献
+
+        Args:
+            values: 包含 TRACKED_FIELDS 的字典
+            sign: 1 表示新增/变更后的值，-1 表示删除/变更前的值
+        """
+        day = _as_day(values.get('completion_time'))
+        if day is None:
+            return
+        key = (day, values.get('user_id') or 0, values.get('order_type_id') or 0, values.get('status') or '')
+        count, amount, quantity = self.changes.get(key, (0, 0, 0))
+        self.changes[key] = (
+            count + sign,
+            amount + sign * (values.get('amount') or 0),
+            quantity + sign * (values.get('quantity') or 0)
+        )
+
+    def add_order(self, order, sign=1):
+        self.add({field: getattr(order, field) for field in TRACKED_FIELDS}, sign)
+
+    def apply(self, connection):
+        """在给定连接（当前事务）上累加增量，并清理计数归零的汇总行"""
+        rows = [
+            {'day': day, 'user_id': user_id, 'order_type_id': type_id, 'status': status,
+             'order_count': count, 'total_amount': amount, 'total_quantity': quantity}
+            for (day, user_id, type_id, status), (count, amount, quantity) in self.changes.items()
+            if count or amount or quantity
+        ]
+        self.changes = {}
+        if not rows:
+            return
+
+        _upsert_increments(connection, rows)
+        connection.execute(delete(DailyOrderRollup).where(
+            DailyOrderRollup.order_count <= 0,
+            DailyOrderRollup.day.in_({row['day'] for row in rows})
+        ))
+
+
+def _upsert_increments(connection, rows):
+    table = DailyOrderRollup.__table__
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['day', 'user_id', 'order_type_id', 'status'],
+            set_={
+                'order_count': table.c.order_count + stmt.excluded.order_count,
+                'total_amount': table.c.total_amount + stmt.excluded.total_amount,
+                'total_quantity': table.c.total_quantity + stmt.excluded.total_quantity,
+            }
+        )
+        connection.execute(stmt, rows)
+    elif dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_duplicate_key_update(
+            order_count=table.c.order_count + stmt.inserted.order_count,
+            total_amount=table.c.total_amount + stmt.inserted.total_amount,
+            total_quantity=table.c.total_quantity + stmt.inserted.total_quantity,
+        )
+        connection.execute(stmt, rows)
+    else:
+        for row in rows:
+            result = connection.execute(table.update().where(
+                table.c.day == row['day'],
+                table.c.user_id == row['user_id'],
+                table.c.order_type_id == row['order_type_id'],
+                table.c.status == row['status']
+            ).values(
+                order_count=table.c.order_count + row['order_count'],
+                total_amount=table.c.total_amount + row['total_amount'],
+                total_quantity=table.c.total_quantity + row['total_quantity']
+            ))
+            if result.rowcount == 0:
+                connection.execute(table.insert().values(**row))
+
+
+def _previous_values(order):
+    """订单在本次flush前的字段值（TRACKED_FIELDS 在模型中声明了 active_history，未加载的旧值也能取到）"""
+    state = inspect(order)
+    values = {}
+    for field in TRACKED_FIELDS:
+        history = state.attrs[field].history
+        if history.deleted:
+            values[field] = history.deleted[0]
+        elif history.unchanged:
+            values[field] = history.unchanged[0]
+        else:
+            values[field] = getattr(order, field)
+    return values
+
+
+def _has_tracked_changes(order):
+    state = inspect(order)
+    return any(state.attrs[field].history.has_changes() for field in TRACKED_FIELDS)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _capture_deleted_orders(session, flush_context, instances):
+    """删除前读取订单的字段值（flush后行已不存在，无法再加载）"""
+    deleted = session.info.setdefault('rollup_deleted', [])
+    for obj in session.deleted:
+        if isinstance(obj, Order):
+            deleted.append(_previous_values(obj))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _apply_order_deltas(session, flush_context):
+    """将本次flush中订单的新增、修改、删除以增量形式写入汇总表（同一事务）"""
+    delta = RollupDelta()
+    for obj in session.new:
+        if isinstance(obj, Order):
+            delta.add_order(obj)
+    for obj in session.dirty:
+        if isinstance(obj, Order) and _has_tracked_changes(obj):
+            delta.add(_previous_values(obj), sign=-1)
+            delta.add_order(obj)
+    for values in session.info.pop('rollup_deleted', ()):
+        delta.add(values, sign=-1)
+    delta.apply(session.connection())
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_pending_deltas(session, previous_transaction):
+    session.info.pop('rollup_deleted', None)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+全文搜索索引模块
+基于 SQLite FTS5 trigram 分词的外部内容索引，加速 LIKE '%关键字%' 模糊搜索
+"""
+
+from sqlalchemy import and_, or_, select, table, column, text
+from sqlalchemy.engine import Connection
+from . import db
+
+
+# 索引名: (源表, 索引列)
+SEARCH_INDEXES = {
+    'orders_fts': ('orders', ('wechat_name', 'wechat_id', 'phone', 'order_code', 'order_info')),
+    'wechat_users_fts': ('wechat_users', ('wechat_name', 'wechat_id', 'phone')),
+}
+
+# trigram 分词至少需要3个字符才能命中索引
+MIN_INDEXED_LENGTH = 3
+
+_available_indexes = set()
+
+
+def _index_ddl(fts_name, source, columns):
+    """生成索引表及同步触发器的建表语句"""
+    cols = ', '.join(columns)
+    new_values = ', '.join(f'new.{c}' for c in columns)
+    old_values = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_name} USING fts5("
+        f"{cols}, content='{source}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_name}_ai AFTER INSERT ON {source} BEGIN "
+        f"INSERT INTO {fts_name}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_name}_ad AFTER DELETE ON {source} BEGIN "
+        f"INSERT INTO {fts_name}({fts_name}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); END",
+        # 仅在索引列变化时更新，状态等字段的修改不触发
+        f"CREATE TRIGGER IF NOT EXISTS {fts_name}_au AFTER UPDATE OF {cols} ON {source} BEGIN "
+        f"INSERT INTO {fts_name}({fts_name}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts_name}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+    ]
+
+
+def _drop_ddl(fts_name):
+    return [
+        f"DROP TRIGGER IF EXISTS {fts_name}_ai",
+        f"DROP TRIGGER IF EXISTS {fts_name}_ad",
+        f"DROP TRIGGER IF EXISTS {fts_name}_au",
+        f"DROP TABLE IF EXISTS {fts_name}",
+    ]
+
+
+def _execute_all(bind, statements):
+    """在引擎（新事务）或已有连接（如迁移脚本中）上执行语句"""
+    if isinstance(bind, Connection):
+        for statement in statements:
+            bind.execute(text(statement))
+        return
+    with bind.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
+
+def is_supported(bind=None):
+    """当前数据库是否支持FTS5索引（仅SQLite）"""
+    bind = bind or db.engine
+    return bind.dialect.name == 'sqlite'
+
+
+def create_search_index(bind=None):
+    """
+    创建搜索索引、同步触发器并重建索引内容
+
+    Returns:
+        bool: 是否已创建（非SQLite数据库返回 False）
+    """
+    bind = bind or db.engine
+    if not is_supported(bind):
+        return False
+    statements = []
+    for fts_name, (source, columns) in SEARCH_INDEXES.items():
+        statements.extend(_index_ddl(fts_name, source, columns))
+        statements.append(f"INSERT INTO {fts_name}({fts_name}) VALUES ('rebuild')")
+    _execute_all(bind, statements)
+    _available_indexes.clear()
+    return True
+
+
+def drop_search_index(bind=None):
+    """删除搜索索引及触发器"""
+    bind = bind or db.engine
+    if not is_supported(bind):
+        return
+    _execute_all(bind, [statement for fts_name in SEARCH_INDEXES for statement in _drop_ddl(fts_name)])
+    _available_indexes.clear()
+
+
+def rebuild_search_index(bind=None):
+    """
+    按源表内容重建索引（索引不存在时先创建）
+
+    Returns:
+        dict: 各索引对应源表的行数
+    """
+    bind = bind or db.engine
+    if not create_search_index(bind):
+        return {}
+    counts = {}
+    with bind.connect() as conn:
+        for fts_name, (source, _) in SEARCH_INDEXES.items():
+            counts[fts_name] = conn.execute(text(f"SELECT COUNT(*) FROM {source}")).scalar()
+    return counts
+
+
+def index_available(fts_name):
+    """索引表是否存在（结果按进程缓存）"""
+    if fts_name in _available_indexes:
+        return True
+    if not is_supported():
+        return False
+    exists = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': fts_name}
+    ).first() is not None
+    if exists:
+        _available_indexes.add(fts_name)
+    return exists
+
+
+def _use_index(fts_name, value):
+    # 含通配符或过短的关键字无法通过trigram索引精确定位，直接走原LIKE
+    if len(value) < MIN_INDEXED_LENGTH or '%' in value or '_' in value:
+        return False
+    return index_available(fts_name)
+
+
+def search_condition(model, value, columns):
+    """
+    构建与 column LIKE '%value%' 结果一致的搜索条件（多列时为 OR）
+
+    索引可用时先用FTS索引筛出候选行ID，再在候选行上执行原LIKE，保证结果与原语义完全一致。
+
+    Args:
+        model: Order 或 WechatUser
+        value: 搜索关键字
+        columns: 参与搜索的列名
+    """
+    pattern = f'%{value}%'
+    like = or_(*[getattr(model, c).like(pattern) for c in columns])
+
+    fts_name = f'{model.__tablename__}_fts'
+    if fts_name not in SEARCH_INDEXES or not _use_index(fts_name, value):
+        return like
+
+    fts = table(fts_name, column('rowid'), *[column(c) for c in SEARCH_INDEXES[fts_name][1]])
+    candidates = select(fts.c.rowid).where(or_(*[fts.c[c].like(pattern) for c in columns]))
+    return and_(model.id.in_(candidates), like)
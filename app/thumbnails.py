@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+图片缩略图模块
+上传图片时生成固定尺寸的缩略图，已有图片在首次访问时生成并缓存到磁盘；
+页面显示缩略图，点击后再加载原图
+"""
+
+import os
+import uuid
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# 含透明通道的格式保存为PNG，其余保存为JPEG
+_PNG_SOURCES = ('png', 'gif')
+
+THUMBNAIL_QUALITY = 85
+
+
+def thumbnail_path(app, relative_path):
+    """缩略图的缓存路径（按原图相对路径存放在 THUMBNAIL_FOLDER 下）"""
+    ext = relative_path.rsplit('.', 1)[-1].lower() if '.' in relative_path else ''
+    suffix = 'png' if ext in _PNG_SOURCES else 'jpg'
+    return os.path.join(app.config['THUMBNAIL_FOLDER'], f'{relative_path}.thumb.{suffix}')
+
+
+def thumbnail_mimetype(path):
+    return 'image/png' if path.endswith('.png') else 'image/jpeg'
+
+
+def create_thumbnail(source, dest, size):
+    """
+    生成缩略图：按EXIF方向旋转后等比缩小到 size 以内，先写入临时文件再替换
+
+    Args:
+        source: 原图路径
+        dest: 缩略图路径
+        size: 最长边像素数
+    """
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    partial = f'{dest}.{uuid.uuid4().hex}.part'
+    try:
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((size, size), Image.LANCZOS)
+            if dest.endswith('.png'):
+                if img.mode not in ('RGBA', 'LA', 'L', 'RGB'):
+                    img = img.convert('RGBA')
+                img.save(partial, 'PNG', optimize=True)
+            else:
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+                img.save(partial, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+        os.replace(partial, dest)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def ensure_thumbnail(app, relative_path):
+    """
+    返回缩略图路径，不存在或早于原图时生成
+
+    Returns:
+        str: 缩略图路径；原图不存在或无法解析为图片时返回 None
+    """
+    source = os.path.join(app.config['UPLOAD_FOLDER'], relative_path)
+    dest = thumbnail_path(app, relative_path)
+    try:
+        source_mtime = os.path.getmtime(source)
+    except OSError:
+        return None
+    try:
+        if os.path.getmtime(dest) >= source_mtime:
+            return dest
+    except OSError:
+        pass
+    try:
+        create_thumbnail(source, dest, app.config.get('THUMBNAIL_SIZE', 400))
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as e:
+        app.logger.warning(f"生成缩略图失败 {relative_path}: {e}")
+        return None
+    return dest
+
+
+def remove_thumbnail(app, relative_path):
+    """删除原图对应的缩略图缓存"""
+    path = thumbnail_path(app, relative_path)
+    if os.path.exists(path):
+        os.remove(path)
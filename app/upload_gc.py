@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+上传文件回收模块
+按路径顺序流式遍历上传目录，分批与 order_images / wechat_users 中引用的路径比对，
+报告或删除未被引用的孤立文件以及记录存在但文件缺失的引用；
+遍历可从上次结束的路径继续，内存占用与目录大小无关
+"""
+
+import os
+import threading
+import time
+from sqlalchemy import func, or_
+from . import db
+from .models import OrderImage, WechatUser
+from .thumbnails import remove_thumbnail
+
+
+# 每批比对的文件数
+UPLOAD_GC_BATCH_SIZE = 1000
+
+# 报告中保留的路径样例数
+REPORT_SAMPLE_SIZE = 50
+
+# 引用上传文件的字段
+REFERENCE_COLUMNS = (OrderImage.image_path, WechatUser.avatar, WechatUser.payment_qr_code)
+
+_lock = threading.Lock()
+_scheduler = None
+
+
+def normalize_upload_path(path):
+    """数据库中的路径统一为相对上传目录、以正斜杠分隔的形式"""
+    if not path:
+        return None
+    path = path.replace('\\', '/')
+    if path.startswith('uploads/'):
+        path = path[len('uploads/'):]
+    return path.lstrip('/') or None
+
+
+def _excluded_dirs(app):
+    """位于上传目录内、但不存放上传文件的目录（导出、导入临时文件等）"""
+    root = os.path.abspath(app.config['UPLOAD_FOLDER'])
+    excluded = set()
+    for key in ('EXPORT_FOLDER', 'IMPORT_FOLDER'):
+        folder = app.config.get(key)
+        if folder and os.path.abspath(folder).startswith(root + os.sep):
+            excluded.add(os.path.abspath(folder))
+    return excluded
+
+
+def iter_upload_files(root, start_after=None, excluded=()):
+    """
+    按路径顺序遍历目录下的文件（逐个目录读取，不一次性列出整棵树）
+
+    Args:
+        root: 上传目录
+        start_after: 上次遍历结束的相对路径，只返回排在其后的文件
+        excluded: 跳过的目录（绝对路径）
+
+    Yields:
+        tuple: (相对路径, os.DirEntry)
+    """
+    start = tuple(start_after.split('/')) if start_after else None
+
+    def walk(path, parts):
+        try:
+            entries = sorted(os.scandir(path), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            entry_parts = parts + (entry.name,)
+            if entry.is_dir(follow_symlinks=False):
+                if os.path.abspath(entry.path) in excluded:
+                    continue
+                # 整个目录都排在起始路径之前
+                if start and entry_parts < start[:len(entry_parts)]:
+                    continue
+                yield from walk(entry.path, entry_parts)
+            elif entry.is_file(follow_symlinks=False):
+                if start and entry_parts <= start:
+                    continue
+                yield '/'.join(entry_parts), entry
+
+    yield from walk(root, ())
+
+
+def reference_values(column, paths):
+    """
+    查询引用列中规范化后属于 paths 的原值（含反斜杠、uploads/ 前缀、前导斜杠等写法）
+
+    SQL 中先替换反斜杠并按后缀筛选候选，再在 Python 中按 normalize_upload_path 精确比较。
+
+    Args:
+        column: REFERENCE_COLUMNS 中的列
+        paths: 规范化后的路径集合
+
+    Returns:
+        dict: 存储的原值 -> 规范化后的路径
+    """
+    paths = set(paths)
+    if not paths:
+        return {}
+    replaced = func.replace(column, '\\', '/')
+    query = db.session.query(column).filter(
+        or_(*[replaced.endswith(path, autoescape=True) for path in paths])
+    ).distinct()
+    values = {}
+    for (value,) in query:
+        path = normalize_upload_path(value)
+        if path in paths:
+            values[value] = path
+    return values
+
+
+def referenced_paths(paths):
+    """
+    查询一批路径中被数据库引用的路径
+
+    Args:
+        paths: 相对上传目录的路径集合
+
+    Returns:
+        set: 被引用的路径（已规范化）
+    """
+    referenced = set()
+    for column in REFERENCE_COLUMNS:
+        referenced.update(reference_values(column, paths).values())
+    return referenced
+
+
+def iter_referenced_paths():
+    """流式读取数据库中引用的全部上传路径"""
+    for column in REFERENCE_COLUMNS:
+        query = db.session.query(column).filter(column.isnot(None), column != '').distinct()
+        for (value,) in query.execution_options(yield_per=UPLOAD_GC_BATCH_SIZE):
+            path = normalize_upload_path(value)
+            if path:
+                yield path
+
+
+class UploadScanReport:
+    """一次上传目录扫描的结果"""
+
+    def __init__(self):
+        self.scanned = 0
+        self.orphans = 0
+        self.orphan_bytes = 0
+        self.removed = 0
+        self.skipped_recent = 0
+        self.missing = 0
+        self.orphan_samples = []
+        self.missing_samples = []
+        self.cursor = None  # 最后一个已比对的路径，下次从其后继续
+        self.finished = False  # 是否已遍历到目录末尾
+
+    def add_orphan(self, path, size):
+        self.orphans += 1
+        self.orphan_bytes += size
+        if len(self.orphan_samples) < REPORT_SAMPLE_SIZE:
+            self.orphan_samples.append(path)
+
+    def add_missing(self, path):
+        self.missing += 1
+        if len(self.missing_samples) < REPORT_SAMPLE_SIZE:
+            self.missing_samples.append(path)
+
+
+def _check_batch(app, batch, report, delete, min_age, now):
+    referenced = referenced_paths({path for path, _ in batch})
+    for path, entry in batch:
+        if path in referenced:
+            continue
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+        # 刚上传、记录尚未提交的文件不视为孤立文件
+        if now - stat.st_mtime < min_age:
+            report.skipped_recent += 1
+            continue
+        report.add_orphan(path, stat.st_size)
+        if delete:
+            try:
+                os.remove(entry.path)
+                remove_thumbnail(app, path)
+                report.removed += 1
+            except OSError as e:
+                app.logger.warning(f"删除孤立文件失败 {path}: {e}")
+
+
+def scan_uploads(app, delete=False, start_after=None, limit=None, min_age=None,
+                 check_missing=False, batch_size=UPLOAD_GC_BATCH_SIZE):
+    """
+    比对上传目录与数据库引用
+
+    Args:
+        app: Flask 应用对象
+        delete: 是否删除孤立文件（否则只报告）
+        start_after: 从该相对路径之后继续扫描
+        limit: 本次最多扫描的文件数，不指定时扫描到目录末尾
+        min_age: 修改时间距今不足该秒数的文件跳过，默认取 UPLOAD_GC_MIN_AGE
+        check_missing: 是否检查数据库引用但磁盘上不存在的文件（需遍历全部引用）
+
+    Returns:
+        UploadScanReport
+    """
+    root = app.config['UPLOAD_FOLDER']
+    if min_age is None:
+        min_age = app.config.get('UPLOAD_GC_MIN_AGE', 3600)
+    report = UploadScanReport()
+    now = time.time()
+
+    batch = []
+    files = iter_upload_files(root, start_after, _excluded_dirs(app))
+    for path, entry in files:
+        batch.append((path, entry))
+        report.scanned += 1
+        report.cursor = path
+        if len(batch) >= batch_size:
+            _check_batch(app, batch, report, delete, min_age, now)
+            batch = []
+        if limit and report.scanned >= limit:
+            break
+    else:
+        report.finished = True
+    if batch:
+        _check_batch(app, batch, report, delete, min_age, now)
+
+    if check_missing:
+        for path in iter_referenced_paths():
+            if not os.path.exists(os.path.join(root, path)):
+                report.add_missing(path)
+    return report
+
+
+class UploadGCScheduler:
+    """
+    定时回收孤立文件的后台线程
+
+    每次只扫描 UPLOAD_GC_BATCH_SIZE 个文件并记住结束位置，下次从该位置继续，
+    到达目录末尾后重新开始。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['UPLOAD_GC_INTERVAL']
+        self.cursor = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='upload-gc', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def tick(self):
+        app = self.app
+        with app.app_context():
+            try:
+                report = scan_uploads(
+                    app,
+                    delete=app.config.get('UPLOAD_GC_DELETE', False),
+                    start_after=self.cursor,
+                    limit=app.config.get('UPLOAD_GC_BATCH_SIZE', UPLOAD_GC_BATCH_SIZE)
+                )
+            finally:
+                db.session.remove()
+        self.cursor = None if report.finished else report.cursor
+        if report.orphans:
+            action = '已删除' if report.removed else '发现'
+            app.logger.info(f"上传文件回收：{action} {report.orphans} 个孤立文件，"
+                            f"共 {report.orphan_bytes} 字节，例如 {report.orphan_samples[:5]}")
+        return report
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception:
+                self.app.logger.exception("上传文件回收失败")
+
+
+def start_upload_gc(app):
+    """按 UPLOAD_GC_INTERVAL（秒）启动定时回收，未配置时不启动（每个进程一次）"""
+    global _scheduler
+    if not app.config.get('UPLOAD_GC_INTERVAL'):
+        return None
+    with _lock:
+        if _scheduler is not None:
+            return None
+        _scheduler = UploadGCScheduler(app)
+    _scheduler.start()
+    return _scheduler
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+上传文件访问模块
+上传文件以UUID命名、内容不再变化，响应带强ETag和长期 immutable 缓存，
+支持条件请求（304）和 Range 请求；可配置由前端Web服务器发送文件
+"""
+
+import hashlib
+import mimetypes
+import os
+from urllib.parse import quote
+from flask import current_app, request, abort, Response
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+
+# 上传文件的默认缓存时间（秒）
+UPLOAD_CACHE_MAX_AGE = 365 * 24 * 3600
+
+# 支持的文件发送模式：由 Python 发送、X-Sendfile（Apache/lighttpd）、X-Accel-Redirect（nginx）
+SENDFILE_MODES = (None, 'x-sendfile', 'x-accel')
+
+
+def file_etag(relative_path, stat):
+    """由相对路径、大小和修改时间生成的强ETag（文件名唯一且内容不变）"""
+    raw = f'{relative_path}:{stat.st_size}:{stat.st_mtime_ns}'
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _accel_response(accel_prefix, relative_path, mimetype):
+    """nginx 内部重定向：Python 只返回响应头，文件及 Range 请求由 nginx 处理"""
+    response = Response(mimetype=mimetype)
+    response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{quote(relative_path)}"
+    return response
+
+
+def send_upload(directory, relative_path, mimetype=None, accel_prefix=None):
+    """
+    发送上传目录中的文件
+
+    Args:
+        directory: 文件所在的根目录（上传目录或缩略图目录）
+        relative_path: 相对根目录的路径
+        mimetype: 不指定时按扩展名判断
+        accel_prefix: X-Accel-Redirect 模式下该目录对应的 nginx internal location
+
+    Returns:
+        Response: 200/206/304 响应
+    """
+    app = current_app
+    path = safe_join(directory, relative_path)
+    if path is None:
+        abort(404)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        abort(404)
+
+    mode = app.config.get('UPLOAD_SENDFILE_MODE')
+    max_age = app.config.get('UPLOAD_CACHE_MAX_AGE', UPLOAD_CACHE_MAX_AGE)
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    etag = file_etag(relative_path, stat)
+
+    if mode == 'x-accel' and accel_prefix:
+        response = _accel_response(accel_prefix, relative_path, mimetype)
+        response.set_etag(etag)
+        response.last_modified = int(stat.st_mtime)
+        response = response.make_conditional(request.environ)
+    elif mode == 'x-sendfile':
+        # Range 由前端服务器处理，这里只处理 304
+        response = send_file(path, request.environ, mimetype=mimetype, etag=etag,
+                             conditional=False, use_x_sendfile=True)
+        response = response.make_conditional(request.environ)
+    else:
+        response = send_file(path, request.environ, mimetype=mimetype, etag=etag, conditional=True)
+        response.accept_ranges = 'bytes'
+
+    # 需要登录才能访问，只允许浏览器缓存
+    response.cache_control.public = False
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,550 @@
+# -*- coding: utf-8 -*-
+"""
+微信用户维护模块
+订单写入时在同一事务中按收集规则同步对应手机号的微信用户、按手机号设置订单的 wechat_user_id、
+重算微信用户的订单统计，并登记手机号供增量刷新；
+全量收集用一条分组查询选出每个手机号的微信名、微信号，再用一条 INSERT ... ON CONFLICT(phone) 批量写入；
+刷新时用窗口函数一次取出每个手机号的最新订单，以集合式 UPDATE / DELETE 写回
+"""
+
+from datetime import datetime
+from sqlalchemy import event, select, insert, update, delete, func, case, or_, and_, literal, bindparam, inspect
+from sqlalchemy.orm import aliased
+from . import db
+from .models import Order, WechatUser, OrderPhoneChange
+
+
+# 不支持 upsert 的数据库逐批写入时每批的行数
+COLLECT_CHUNK_SIZE = 500
+
+# 影响微信用户信息的订单字段（变更时登记手机号）
+WECHAT_FIELDS = ('phone', 'wechat_name', 'wechat_id', 'create_time')
+
+# 影响微信用户订单统计的其它字段（变更时只重算统计）
+COUNTER_FIELDS = ('amount', 'quantity', 'status')
+
+# 已结算的订单不计入未结算金额
+SETTLED_STATUS = '已结算'
+
+# 冗余的订单统计字段
+COUNTER_COLUMNS = ('total_orders', 'amount_orders', 'total_amount', 'total_quantity',
+                   'first_order_time', 'last_order_time', 'unsettled_amount')
+
+# 金额比较的容差（浮点累加误差）
+AMOUNT_TOLERANCE = 0.005
+
+
+class CollectResult:
+    """收集微信用户的结果"""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+
+
+def _not_blank(column):
+    return func.coalesce(func.trim(column), '') != ''
+
+
+def _is_blank(column):
+    return func.coalesce(func.trim(column), '') == ''
+
+
+def collect_candidates(now, phones=None):
+    """
+    按手机号分组，取每个手机号最早的订单中第一个非空的微信名和微信号
+
+    微信名和微信号都为空的手机号不返回；没有微信名时微信名为空字符串（wechat_name 不允许为NULL）。
+
+    Args:
+        now: 写入的创建/更新时间
+        phones: 可选，只处理这些手机号
+
+    Returns:
+        Select: (wechat_name, wechat_id, phone, create_time, update_time)
+    """
+    grouped = select(
+        Order.phone.label('phone'),
+        func.min(case((_not_blank(Order.wechat_name), Order.id))).label('name_order_id'),
+        func.min(case((_not_blank(Order.wechat_id), Order.id))).label('id_order_id')
+    ).where(_not_blank(Order.phone))
+    if phones is not None:
+        grouped = grouped.where(Order.phone.in_(phones))
+    grouped = grouped.group_by(Order.phone).subquery()
+    name_order = aliased(Order)
+    id_order = aliased(Order)
+    return select(
+        func.coalesce(func.trim(name_order.wechat_name), '').label('wechat_name'),
+        func.trim(id_order.wechat_id).label('wechat_id'),
+        grouped.c.phone,
+        literal(now, WechatUser.create_time.type).label('create_time'),
+        literal(now, WechatUser.update_time.type).label('update_time')
+    ).select_from(grouped).outerjoin(
+        name_order, name_order.id == grouped.c.name_order_id
+    ).outerjoin(
+        id_order, id_order.id == grouped.c.id_order_id
+    ).where(or_(grouped.c.name_order_id.isnot(None), grouped.c.id_order_id.isnot(None)))
+
+
+def _fill_blank(current, incoming):
+    """已有值为空且新值非空时取新值，否则保留已有值"""
+    return case((and_(_is_blank(current), _not_blank(incoming)), incoming), else_=current)
+
+
+def _needs_fill(table, incoming_name, incoming_id):
+    return or_(
+        and_(_is_blank(table.c.wechat_name), _not_blank(incoming_name)),
+        and_(_is_blank(table.c.wechat_id), _not_blank(incoming_id))
+    )
+
+
+def upsert_candidates(connection, candidates, now):
+    """
+    以 INSERT ... SELECT ... ON CONFLICT(phone) 写入候选微信用户
+
+    新手机号新增；已有的只补全为空的微信名、微信号，update_time 只在确有补全时更新。
+
+    Returns:
+        int: 受影响的行数（MySQL 中被更新的行计为2）
+    """
+    table = WechatUser.__table__
+    columns = ['wechat_name', 'wechat_id', 'phone', 'create_time', 'update_time']
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table).from_select(columns, candidates)
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['phone'],
+            set_={
+                'wechat_name': _fill_blank(table.c.wechat_name, excluded.wechat_name),
+                'wechat_id': _fill_blank(table.c.wechat_id, excluded.wechat_id),
+                'update_time': excluded.update_time
+            },
+            where=_needs_fill(table, excluded.wechat_name, excluded.wechat_id)
+        )
+        return connection.execute(stmt).rowcount
+    elif dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(table).from_select(columns, candidates)
+        inserted = stmt.inserted
+        # MySQL 按顺序赋值，update_time 须在补全之前判断
+        stmt = stmt.on_duplicate_key_update([
+            ('update_time', case(
+                (_needs_fill(table, inserted.wechat_name, inserted.wechat_id), inserted.update_time),
+                else_=table.c.update_time
+            )),
+            ('wechat_name', _fill_blank(table.c.wechat_name, inserted.wechat_name)),
+            ('wechat_id', _fill_blank(table.c.wechat_id, inserted.wechat_id))
+        ])
+        return connection.execute(stmt).rowcount
+    else:
+        result = _collect_in_chunks(connection, candidates, now)
+        return result.created + result.updated
+
+
+def collect_from_orders(now=None):
+    """
+    从全部订单中收集微信用户（调用方提交事务）
+
+    订单写入时已自动同步对应的微信用户，全量收集只用于补齐历史数据。
+
+    Returns:
+        CollectResult
+    """
+    now = now or datetime.utcnow()
+    connection = db.session.connection()
+    candidates = collect_candidates(now)
+    if connection.dialect.name not in ('sqlite', 'postgresql', 'mysql'):
+        result = _collect_in_chunks(connection, candidates, now)
+        link_orders(connection)
+        update_counters(connection)
+        return result
+
+    table = WechatUser.__table__
+    result = CollectResult()
+    before = connection.execute(select(func.count()).select_from(table)).scalar()
+    affected = upsert_candidates(connection, candidates, now)
+    after = connection.execute(select(func.count()).select_from(table)).scalar()
+    link_orders(connection)
+    update_counters(connection)
+
+    result.created = after - before
+    updated = affected - result.created
+    # MySQL 中被更新的行计为2
+    result.updated = updated // 2 if connection.dialect.name == 'mysql' else updated
+    return result
+
+
+def _collect_in_chunks(connection, candidates, now):
+    """不支持 upsert 的数据库：按批先补全已有用户，再插入新手机号"""
+    result = CollectResult()
+    table = WechatUser.__table__
+    rows = connection.execute(candidates).mappings().all()
+    for start in range(0, len(rows), COLLECT_CHUNK_SIZE):
+        chunk = rows[start:start + COLLECT_CHUNK_SIZE]
+        existing = set(connection.execute(
+            select(table.c.phone).where(table.c.phone.in_([row['phone'] for row in chunk]))
+        ).scalars())
+        updates = [
+            {'b_phone': row['phone'], 'b_name': row['wechat_name'], 'b_id': row['wechat_id']}
+            for row in chunk if row['phone'] in existing
+        ]
+        if updates:
+            incoming_name, incoming_id = bindparam('b_name'), bindparam('b_id')
+            result.updated += connection.execute(
+                table.update().where(
+                    table.c.phone == bindparam('b_phone'),
+                    _needs_fill(table, incoming_name, incoming_id)
+                ).values(
+                    wechat_name=_fill_blank(table.c.wechat_name, incoming_name),
+                    wechat_id=_fill_blank(table.c.wechat_id, incoming_id),
+                    update_time=now
+                ),
+                updates
+            ).rowcount
+        inserts = [dict(row) for row in chunk if row['phone'] not in existing]
+        if inserts:
+            connection.execute(table.insert(), inserts)
+            result.created += len(inserts)
+    return result
+
+
+def sync_order_phones(connection, phones, now=None):
+    """
+    订单写入后在同一事务中同步这些手机号的微信用户及其订单统计，并登记以便增量刷新
+
+    按收集规则写入：新手机号新增微信用户，已有的只补全为空的微信名、微信号。
+
+    Args:
+        connection: 当前事务的连接
+        phones: 新增、修改或删除的订单的手机号（可重复，空值忽略）
+
+    Returns:
+        int: 登记的手机号数
+    """
+    phones = sorted({phone for phone in phones if phone and phone.strip()})
+    if not phones:
+        return 0
+    now = now or datetime.utcnow()
+    queue_phones(connection, phones)
+    for start in range(0, len(phones), COLLECT_CHUNK_SIZE):
+        upsert_candidates(connection, collect_candidates(now, phones[start:start + COLLECT_CHUNK_SIZE]), now)
+    link_orders(connection, phones)
+    update_counters(connection, phones=phones)
+    return len(phones)
+
+
+def queue_phones(connection, phones):
+    """
+    登记待增量刷新的手机号；已登记的忽略，队列大小不超过手机号数
+
+    Args:
+        connection: 当前事务的连接
+        phones: 去重后的手机号列表
+    """
+    table = OrderPhoneChange.__table__
+    rows = [{'phone': phone} for phone in phones]
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        connection.execute(dialect_insert(table).on_conflict_do_nothing(index_elements=['phone']), rows)
+    elif dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        connection.execute(stmt.on_duplicate_key_update(phone=table.c.phone), rows)
+    else:
+        for start in range(0, len(rows), COLLECT_CHUNK_SIZE):
+            chunk = phones[start:start + COLLECT_CHUNK_SIZE]
+            queued = set(connection.execute(select(table.c.phone).where(table.c.phone.in_(chunk))).scalars())
+            missing = [{'phone': phone} for phone in chunk if phone not in queued]
+            if missing:
+                connection.execute(insert(table), missing)
+
+
+def link_orders(connection, phones=None):
+    """
+    按手机号设置订单的 wechat_user_id（通过 wechat_users.phone 唯一索引查找）
+
+    Args:
+        connection: 当前事务的连接
+        phones: 只处理这些手机号的订单，不指定时处理全部订单
+
+    Returns:
+        int: wechat_user_id 有变化的订单数
+    """
+    table = Order.__table__
+    user_id = select(WechatUser.id).where(WechatUser.phone == table.c.phone).scalar_subquery()
+    stmt = update(table).where(table.c.wechat_user_id.is_distinct_from(user_id)).values(wechat_user_id=user_id)
+    if phones is None:
+        return connection.execute(stmt).rowcount
+    phones = sorted({phone for phone in phones if phone})
+    linked = 0
+    for start in range(0, len(phones), COLLECT_CHUNK_SIZE):
+        linked += connection.execute(
+            stmt.where(table.c.phone.in_(phones[start:start + COLLECT_CHUNK_SIZE]))
+        ).rowcount
+    return linked
+
+
+def counter_values(user_id):
+    """
+    按 wechat_user_id 聚合订单的统计值（关联子查询，走 ix_orders_wechat_user_id 索引）
+
+    Args:
+        user_id: 微信用户ID列或值
+
+    Returns:
+        dict: 统计字段 -> 标量子查询
+    """
+    def aggregate(expr):
+        return select(expr).where(Order.wechat_user_id == user_id).scalar_subquery()
+
+    unsettled = case((func.coalesce(Order.status, '') != SETTLED_STATUS, Order.amount))
+    return {
+        'total_orders': aggregate(func.count(Order.id)),
+        'amount_orders': aggregate(func.count(Order.amount)),
+        'total_amount': aggregate(func.coalesce(func.sum(Order.amount), 0)),
+        'total_quantity': aggregate(func.coalesce(func.sum(Order.quantity), 0)),
+        'first_order_time': aggregate(func.min(Order.create_time)),
+        'last_order_time': aggregate(func.max(Order.create_time)),
+        'unsettled_amount': aggregate(func.coalesce(func.sum(unsettled), 0)),
+    }
+
+
+def update_counters(connection, phones=None, user_ids=None):
+    """
+    重算微信用户的订单统计（在当前事务中，按用户自己的订单聚合，删除和改状态后依然准确）
+
+    Args:
+        connection: 当前事务的连接
+        phones: 只重算这些手机号的微信用户
+        user_ids: 只重算这些ID的微信用户；两者都不指定时重算全部
+
+    Returns:
+        int: 重算的微信用户数
+    """
+    table = WechatUser.__table__
+    values = counter_values(table.c.id)
+    # 统计变化不算用户资料更新
+    values['update_time'] = table.c.update_time
+    stmt = update(table).values(**values)
+    if phones is None and user_ids is None:
+        return connection.execute(stmt).rowcount
+
+    column, keys = (table.c.phone, phones) if phones is not None else (table.c.id, user_ids)
+    keys = sorted({key for key in keys if key is not None})
+    updated = 0
+    for start in range(0, len(keys), COLLECT_CHUNK_SIZE):
+        updated += connection.execute(stmt.where(column.in_(keys[start:start + COLLECT_CHUNK_SIZE]))).rowcount
+    return updated
+
+
+def _differs(name, stored, actual):
+    if name.endswith('_amount'):
+        return func.abs(func.coalesce(stored, 0) - func.coalesce(actual, 0)) > AMOUNT_TOLERANCE
+    return stored.is_distinct_from(actual)
+
+
+def verify_counters(repair=False, limit=None):
+    """
+    以一次按 wechat_user_id 分组的聚合校验所有微信用户的订单统计
+
+    Args:
+        repair: 是否重算不一致的用户（调用方提交事务）
+        limit: 最多返回的不一致用户数（repair 时仍修复全部）
+
+    Returns:
+        list: 不一致的 (微信用户ID, {字段: (存储值, 实际值)})
+    """
+    table = WechatUser.__table__
+    unsettled = case((func.coalesce(Order.status, '') != SETTLED_STATUS, Order.amount))
+    actual = select(
+        Order.wechat_user_id.label('user_id'),
+        func.count(Order.id).label('total_orders'),
+        func.count(Order.amount).label('amount_orders'),
+        func.coalesce(func.sum(Order.amount), 0).label('total_amount'),
+        func.coalesce(func.sum(Order.quantity), 0).label('total_quantity'),
+        func.min(Order.create_time).label('first_order_time'),
+        func.max(Order.create_time).label('last_order_time'),
+        func.coalesce(func.sum(unsettled), 0).label('unsettled_amount')
+    ).where(Order.wechat_user_id.isnot(None)).group_by(Order.wechat_user_id).subquery()
+
+    # 没有订单的用户实际值为 0 / NULL
+    expected = {
+        name: actual.c[name] if name.endswith('_time') else func.coalesce(actual.c[name], 0)
+        for name in COUNTER_COLUMNS
+    }
+    query = select(table.c.id, *[table.c[name] for name in COUNTER_COLUMNS], *expected.values()).select_from(
+        table.outerjoin(actual, actual.c.user_id == table.c.id)
+    ).where(or_(*[_differs(name, table.c[name], expected[name]) for name in COUNTER_COLUMNS])).order_by(table.c.id)
+
+    mismatches = []
+    for row in db.session.execute(query):
+        stored = row[1:1 + len(COUNTER_COLUMNS)]
+        values = row[1 + len(COUNTER_COLUMNS):]
+        mismatches.append((row[0], {
+            name: (old, new) for name, old, new in zip(COUNTER_COLUMNS, stored, values) if old != new
+        }))
+    if repair and mismatches:
+        update_counters(db.session.connection(), user_ids=[user_id for user_id, _ in mismatches])
+    return mismatches[:limit] if limit else mismatches
+
+
+def record_order_phones(phones):
+    """在当前事务中同步并登记订单有变更的手机号（绕过ORM flush的批量写入需显式调用）"""
+    return sync_order_phones(db.session.connection(), phones)
+
+
+class RefreshResult:
+    """刷新微信用户的结果"""
+
+    def __init__(self):
+        self.updated = 0
+        self.cleaned = 0
+        self.phones = None  # 增量刷新时处理的手机号数
+
+
+def latest_orders(phones=None):
+    """
+    每个手机号创建时间最新的一笔订单（ROW_NUMBER() OVER (PARTITION BY phone ORDER BY create_time DESC)）
+
+    Args:
+        phones: 可选，限定手机号范围的子查询
+
+    Returns:
+        Subquery: (phone, wechat_name, wechat_id)
+    """
+    ranked = select(
+        Order.phone,
+        Order.wechat_name,
+        Order.wechat_id,
+        func.row_number().over(
+            partition_by=Order.phone,
+            order_by=(Order.create_time.desc(), Order.id.desc())
+        ).label('rn')
+    )
+    if phones is not None:
+        ranked = ranked.where(Order.phone.in_(phones))
+    ranked = ranked.subquery()
+    return select(ranked.c.phone, ranked.c.wechat_name, ranked.c.wechat_id).where(ranked.c.rn == 1).subquery()
+
+
+def refresh_from_orders(incremental=False, now=None):
+    """
+    按最新订单刷新微信用户，并清理手机号和微信号都为空的无效用户（调用方提交事务）
+
+    最新订单的微信名与现有不同时覆盖；现有微信号为空时取最新订单的微信号。
+
+    Args:
+        incremental: 只刷新上次刷新后订单有变更的手机号
+        now: 更新时间
+
+    Returns:
+        RefreshResult
+    """
+    now = now or datetime.utcnow()
+    result = RefreshResult()
+    table = WechatUser.__table__
+
+    result.cleaned = db.session.execute(
+        delete(table).where(_is_blank(table.c.phone), _is_blank(table.c.wechat_id))
+    ).rowcount
+
+    # 只处理此刻之前登记的手机号，刷新期间新登记的留到下次
+    last_change = db.session.execute(select(func.max(OrderPhoneChange.id))).scalar()
+    phones = None
+    if incremental:
+        if last_change is None:
+            result.phones = 0
+            return result
+        phones = select(OrderPhoneChange.phone).where(OrderPhoneChange.id <= last_change)
+        result.phones = db.session.execute(select(func.count()).select_from(phones.subquery())).scalar()
+
+    latest = latest_orders(phones)
+    rename = and_(func.coalesce(latest.c.wechat_name, '') != '', latest.c.wechat_name != table.c.wechat_name)
+    fill_id = and_(func.coalesce(latest.c.wechat_id, '') != '', _is_blank(table.c.wechat_id))
+    result.updated = db.session.execute(
+        update(table).where(
+            table.c.phone == latest.c.phone,
+            _not_blank(table.c.phone),
+            or_(rename, fill_id)
+        ).values(
+            wechat_name=case((rename, latest.c.wechat_name), else_=table.c.wechat_name),
+            wechat_id=case((fill_id, latest.c.wechat_id), else_=table.c.wechat_id),
+            update_time=now
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+
+    if last_change is not None:
+        db.session.execute(delete(OrderPhoneChange).where(OrderPhoneChange.id <= last_change))
+    return result
+
+
+def _changed_phones(order):
+    """订单本次flush前后的手机号（微信信息相关字段有变更时）"""
+    state = inspect(order)
+    if not any(state.attrs[field].history.has_changes() for field in WECHAT_FIELDS):
+        return []
+    history = state.attrs.phone.history
+    return list(history.deleted) + [order.phone]
+
+
+def _has_counter_changes(order):
+    state = inspect(order)
+    return any(state.attrs[field].history.has_changes() for field in COUNTER_FIELDS)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _capture_deleted_phones(session, flush_context, instances):
+    phones = session.info.setdefault('deleted_order_phones', [])
+    user_phones = session.info.setdefault('deleted_wechat_user_phones', [])
+    for obj in session.deleted:
+        if isinstance(obj, Order):
+            phones.append(obj.phone)
+        elif isinstance(obj, WechatUser):
+            user_phones.append(obj.phone)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _sync_order_phones(session, flush_context):
+    """
+    本次flush中新增、删除、修改微信信息的订单：同一事务内同步微信用户并登记手机号；
+    新增、删除微信用户或修改其手机号时重新关联对应手机号的订单
+    """
+    phones = session.info.pop('deleted_order_phones', [])
+    user_phones = session.info.pop('deleted_wechat_user_phones', [])
+    for obj in session.new:
+        if isinstance(obj, Order):
+            phones.append(obj.phone)
+        elif isinstance(obj, WechatUser):
+            user_phones.append(obj.phone)
+    counter_phones = []
+    for obj in session.dirty:
+        if isinstance(obj, Order):
+            changed = _changed_phones(obj)
+            phones.extend(changed)
+            if not changed and _has_counter_changes(obj):
+                counter_phones.append(obj.phone)
+        elif isinstance(obj, WechatUser):
+            history = inspect(obj).attrs.phone.history
+            if history.has_changes():
+                user_phones.extend(list(history.deleted) + [obj.phone])
+    connection = session.connection()
+    sync_order_phones(connection, phones)
+    if any(user_phones):
+        link_orders(connection, user_phones)
+    if any(user_phones) or counter_phones:
+        update_counters(connection, phones=user_phones + counter_phones)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_deleted_phones(session, previous_transaction):
+    session.info.pop('deleted_order_phones', None)
+    session.info.pop('deleted_wechat_user_phones', None)
@@ -9,8 +9,34 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join(basedir, 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'xlsx', 'xls', 'csv'}
+    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'xlsx', 'xls', 'csv'}
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
+    KEYSET_PAGINATION_THRESHOLD = 1000  # 订单列表超过该行数时改用游标分页
+    EXPORT_FOLDER = os.path.join(basedir, 'exports')  # 后台导出文件目录
+    EXPORT_WORKERS = 2  # 后台导出工作线程数
+    EXPORT_SYNC_MAX_ROWS = 5000  # 直接下载的xlsx导出最多行数，超过时转为后台导出任务
+    EXPORT_JOB_TTL = 3600  # 导出任务及文件保留时间（秒）
+    IMPORT_FOLDER = os.path.join(basedir, 'imports')  # 后台导入任务的上传文件目录
+    IMPORT_WORKERS = 1  # 后台导入工作线程数
+    IMPORT_STALE_SECONDS = 60  # 导入任务心跳超过该秒数未更新时可由其它进程接管（须大于处理一块数据的时间）
+    THUMBNAIL_FOLDER = os.path.join(basedir, 'thumbnails')  # 图片缩略图缓存目录
+    THUMBNAIL_SIZE = 400  # 缩略图最长边像素数
+    IMAGE_TRANSCODE = True  # 上传图片时去除EXIF、限制尺寸并重新编码
+    IMAGE_MAX_EDGE = 2048  # 图片最长边像素数
+    IMAGE_QUALITY = 82  # JPEG/WEBP 编码质量
+    IMAGE_FORMAT = 'JPEG'  # 重新编码的格式：JPEG（含透明像素时存PNG）或 WEBP
+    IMAGE_WORKERS = 2  # 图片处理进程数
+    IMAGE_TRANSCODE_TIMEOUT = 30  # 等待单张图片压缩的最长秒数，超时保存原图
+    IMAGE_MAX_PIXELS = 80000000  # 允许上传的最大像素数
+    UPLOAD_CACHE_MAX_AGE = 365 * 24 * 3600  # 上传文件的浏览器缓存时间（秒），文件名唯一、内容不变
+    # 上传文件的发送方式：None 由应用发送；'x-sendfile'（Apache/lighttpd）或 'x-accel'（nginx）由Web服务器发送
+    UPLOAD_SENDFILE_MODE = None
+    UPLOAD_ACCEL_PREFIX = '/protected/uploads/'  # x-accel 模式下指向 UPLOAD_FOLDER 的 nginx internal location
+    THUMBNAIL_ACCEL_PREFIX = '/protected/thumbnails/'  # x-accel 模式下指向 THUMBNAIL_FOLDER 的 internal location
+    UPLOAD_GC_INTERVAL = 0  # 定时回收孤立上传文件的间隔（秒），0 表示不启用
+    UPLOAD_GC_DELETE = False  # 定时回收时删除孤立文件，否则只记录日志
+    UPLOAD_GC_BATCH_SIZE = 1000  # 每次定时回收扫描的文件数
+    UPLOAD_GC_MIN_AGE = 3600  # 修改时间不足该秒数的文件不视为孤立文件
     
     @staticmethod
     def init_app(app):
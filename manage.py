@@ -2,7 +2,13 @@
 import os
 import click
 from app import create_app, db
-from app.models import User, Role, OrderField, Order, OrderImage, Permission, OrderType, WechatUser
+from app.models import User, Role, OrderField, Order, OrderImage, Permission, OrderType, WechatUser, DailyOrderRollup, ImportJob, ExportJob, UploadBlob
+from app.search import create_search_index, rebuild_search_index
+from app.rollup import rebuild_rollup
+from app.file_cleanup import purge_pending_files
+from app.upload_gc import scan_uploads
+from app.blob_store import dedupe_uploads, transcode_uploads
+from app.wechat_users import refresh_from_orders, verify_counters
 from flask_migrate import Migrate
 
 app = create_app(os.getenv('FLASK_CONFIG') or 'default')
@@ -11,12 +17,14 @@ migrate = Migrate(app, db)
 @app.shell_context_processor
 def make_shell_context():
     return dict(db=db, User=User, Role=Role, OrderField=OrderField, 
-                Order=Order, OrderImage=OrderImage, Permission=Permission, OrderType=OrderType, WechatUser=WechatUser)
+                Order=Order, OrderImage=OrderImage, Permission=Permission, OrderType=OrderType, WechatUser=WechatUser,
+                DailyOrderRollup=DailyOrderRollup, ImportJob=ImportJob, ExportJob=ExportJob, UploadBlob=UploadBlob)
 
 @app.cli.command()
 def init():
     """初始化应用程序，创建角色和默认管理员账户"""
     db.create_all()
+    create_search_index()
     Role.insert_roles()
     OrderField.insert_default_fields()
     OrderType.insert_default_types()
@@ -38,6 +46,125 @@ def init():
     print('图片存储路径：d:/订单查询系统/图片/')
     print('数据库：MySQL (localhost/d_order_info)')
 
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """重建订单和微信用户的全文搜索索引"""
+    counts = rebuild_search_index()
+    if not counts:
+        print('当前数据库不是SQLite，不支持FTS5搜索索引，搜索将使用LIKE查询')
+        return
+    for fts_name, count in counts.items():
+        print(f'✓ 索引 {fts_name} 已重建：{count} 条记录')
+
+@app.cli.command('rebuild-rollup')
+@click.option('--start', 'start_date', type=click.DateTime(formats=['%Y-%m-%d']), help='开始日期 (YYYY-MM-DD)，不指定则从最早开始')
+@click.option('--end', 'end_date', type=click.DateTime(formats=['%Y-%m-%d']), help='结束日期 (YYYY-MM-DD)，不指定则到最新')
+def rebuild_rollup_command(start_date, end_date):
+    """重建每日订单汇总表"""
+    start_date = start_date.date() if start_date else None
+    end_date = end_date.date() if end_date else None
+    count = rebuild_rollup(start_date, end_date)
+    print(f'✓ 每日汇总已重建：{start_date or "最早"} 至 {end_date or "最新"}，共 {count} 行')
+
+@app.cli.command('purge-deleted-files')
+def purge_deleted_files_command():
+    """删除待删除队列中登记的上传文件（后台清理线程未执行完时手动补充）"""
+    removed, failed = purge_pending_files(app)
+    print(f'✓ 已删除 {removed} 个文件')
+    if failed:
+        print(f'✗ {failed} 个文件删除失败，将在下次清理时重试')
+
+@app.cli.command('gc-uploads')
+@click.option('--delete', is_flag=True, help='删除孤立文件（默认只报告）')
+@click.option('--start-after', default=None, help='从该相对路径之后继续扫描（上次输出的结束位置）')
+@click.option('--limit', type=int, default=None, help='本次最多扫描的文件数')
+@click.option('--min-age', type=int, default=None, help='跳过修改时间不足该秒数的文件，默认取 UPLOAD_GC_MIN_AGE')
+@click.option('--check-missing', is_flag=True, help='同时检查数据库引用但磁盘上不存在的文件')
+def gc_uploads_command(delete, start_after, limit, min_age, check_missing):
+    """比对上传目录与数据库引用，报告或删除孤立文件"""
+    report = scan_uploads(app, delete=delete, start_after=start_after, limit=limit,
+                          min_age=min_age, check_missing=check_missing)
+    print(f'扫描文件 {report.scanned} 个，孤立文件 {report.orphans} 个（{report.orphan_bytes / 1024 / 1024:.1f} MB）')
+    for path in report.orphan_samples:
+        print(f'  孤立: {path}')
+    if report.skipped_recent:
+        print(f'跳过最近修改的文件 {report.skipped_recent} 个')
+    if delete:
+        print(f'✓ 已删除 {report.removed} 个孤立文件')
+    if check_missing:
+        print(f'文件缺失的引用 {report.missing} 个')
+        for path in report.missing_samples:
+            print(f'  缺失: {path}')
+    if not report.finished:
+        print(f'未扫描完，继续执行: flask gc-uploads --start-after "{report.cursor}"')
+
+@app.cli.command('dedupe-uploads')
+@click.option('--batch-size', type=int, default=200, help='每批（每次提交）处理的路径数')
+@click.option('--limit', type=int, default=None, help='本次最多处理的路径数')
+@click.option('--start-after', default=None, help='从该路径之后继续（上次输出的结束位置）')
+def dedupe_uploads_command(batch_size, limit, start_after):
+    """将旧的平铺目录中的上传文件迁移到按哈希分目录的存储并去重（可在服务运行时分批执行，可重复执行）"""
+    report = dedupe_uploads(app, batch_size=batch_size, limit=limit, start_after=start_after)
+    print(f'✓ 检查路径 {report.scanned} 个：迁移文件 {report.migrated} 个，合并重复文件 {report.duplicates} 个，'
+          f'节省 {report.bytes_saved / 1024 / 1024:.1f} MB')
+    if report.missing:
+        print(f'✗ {report.missing} 个引用的文件不存在，已跳过')
+    if report.recounted:
+        print(f'已修正 {report.recounted} 个文件的引用计数')
+    if not report.finished:
+        print(f'未处理完，继续执行: flask dedupe-uploads --start-after "{report.cursor}"')
+    print('原文件将由后台清理删除，也可执行 flask purge-deleted-files')
+
+@app.cli.command('transcode-uploads')
+@click.option('--limit', type=int, default=None, help='本次最多处理的文件数')
+def transcode_uploads_command(limit):
+    """按 IMAGE_* 配置压缩已上传的图片（去除EXIF、限制尺寸、重新编码），报告节省的空间"""
+    report = transcode_uploads(app, limit=limit)
+    print(f'检查图片 {report.scanned} 个：压缩 {report.converted} 个，无需处理 {report.unchanged} 个，失败 {report.failed} 个')
+    if report.converted:
+        print(f'✓ {report.bytes_before / 1024 / 1024:.1f} MB -> {report.bytes_after / 1024 / 1024:.1f} MB，'
+              f'节省 {report.bytes_saved / 1024 / 1024:.1f} MB')
+    print('原文件将由后台清理删除，也可执行 flask purge-deleted-files')
+
+@app.cli.command('refresh-wechat-users')
+@click.option('--incremental', is_flag=True, help='只刷新上次刷新后订单有变更的手机号（适合定时执行）')
+def refresh_wechat_users_command(incremental):
+    """按各手机号的最新订单刷新微信用户信息，并清理无效用户"""
+    result = refresh_from_orders(incremental=incremental)
+    db.session.commit()
+    if incremental:
+        print(f'检查有变更的手机号 {result.phones} 个')
+    print(f'✓ 更新微信用户 {result.updated} 个，清理无效用户 {result.cleaned} 个')
+
+@app.cli.command('verify-wechat-counters')
+@click.option('--repair', is_flag=True, help='按订单重算不一致的微信用户统计')
+@click.option('--show', default=20, help='最多显示的不一致用户数')
+def verify_wechat_counters_command(repair, show):
+    """校验微信用户的冗余订单统计与订单是否一致"""
+    mismatches = verify_counters(repair=repair)
+    for user_id, fields in mismatches[:show]:
+        detail = '，'.join(f'{name}: {stored} -> {actual}' for name, (stored, actual) in fields.items())
+        print(f'微信用户 {user_id}: {detail}')
+    if not mismatches:
+        print('✓ 微信用户订单统计一致')
+    elif repair:
+        db.session.commit()
+        print(f'✓ 已修复 {len(mismatches)} 个微信用户的订单统计')
+    else:
+        print(f'发现 {len(mismatches)} 个微信用户的订单统计不一致，可加 --repair 修复')
+
+@app.cli.command()
+@click.argument('test_names', nargs=-1)
+def test(test_names):
+    """运行单元测试"""
+    import unittest
+    if test_names:
+        tests = unittest.TestLoader().loadTestsFromNames(test_names)
+    else:
+        tests = unittest.TestLoader().discover('tests')
+    result = unittest.TextTestRunner(verbosity=2).run(tests)
+    raise SystemExit(0 if result.wasSuccessful() else 1)
+
 @app.cli.command()
 @click.option('--host', default='127.0.0.1', help='服务器地址')
 @click.option('--port', default=5000, help='端口号')
@@ -0,0 +1,26 @@
+"""add fts5 search index for orders and wechat users
+
+Revision ID: 7c3e9a1f2b64
+Revises: remove_settlement_fields
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e9a1f2b64'
+down_revision = 'remove_settlement_fields'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    from app.search import create_search_index
+    create_search_index(op.get_bind())
+
+
+def downgrade():
+    from app.search import drop_search_index
+    drop_search_index(op.get_bind())
@@ -0,0 +1,36 @@
+"""add daily order rollup table
+
+Revision ID: a41d7e8c5f20
+Revises: 7c3e9a1f2b64
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41d7e8c5f20'
+down_revision = '7c3e9a1f2b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_order_rollup',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('order_type_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.Column('total_amount', sa.Float(), nullable=False),
+    sa.Column('total_quantity', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'user_id', 'order_type_id', 'status')
+    )
+    # 以现有订单填充汇总表
+    from app.rollup import rebuild_rollup
+    rebuild_rollup(connection=op.get_bind())
+
+
+def downgrade():
+    op.drop_table('daily_order_rollup')
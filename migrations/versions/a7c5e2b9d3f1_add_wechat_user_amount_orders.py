@@ -0,0 +1,50 @@
+"""count orders with an amount on wechat users
+
+Revision ID: a7c5e2b9d3f1
+Revises: f6b3d8a1c4e9
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c5e2b9d3f1'
+down_revision = 'f6b3d8a1c4e9'
+branch_labels = None
+depends_on = None
+
+# 回填时每条 UPDATE 处理的微信用户ID范围
+BACKFILL_BATCH_SIZE = 1000
+
+orders = sa.table('orders',
+    sa.column('wechat_user_id', sa.Integer),
+    sa.column('amount', sa.Float)
+)
+wechat_users = sa.table('wechat_users',
+    sa.column('id', sa.Integer),
+    sa.column('amount_orders', sa.Integer)
+)
+
+
+def upgrade():
+    with op.batch_alter_table('wechat_users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('amount_orders', sa.Integer(), nullable=False, server_default='0'))
+
+    # 按微信用户ID分段回填（订单按 ix_orders_wechat_user_id 索引聚合）
+    bind = op.get_bind()
+    max_id = bind.execute(sa.select(sa.func.max(wechat_users.c.id))).scalar() or 0
+    amount_orders = sa.select(sa.func.count(orders.c.amount)).where(
+        orders.c.wechat_user_id == wechat_users.c.id
+    ).scalar_subquery()
+    for start in range(0, max_id, BACKFILL_BATCH_SIZE):
+        bind.execute(wechat_users.update().where(
+            wechat_users.c.id > start,
+            wechat_users.c.id <= start + BACKFILL_BATCH_SIZE
+        ).values(amount_orders=amount_orders))
+
+
+def downgrade():
+    with op.batch_alter_table('wechat_users', schema=None) as batch_op:
+        batch_op.drop_column('amount_orders')
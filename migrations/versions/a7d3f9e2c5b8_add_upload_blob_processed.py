@@ -0,0 +1,26 @@
+"""add processed flag to upload blobs
+
+Revision ID: a7d3f9e2c5b8
+Revises: f2c8a1d6e4b3
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3f9e2c5b8'
+down_revision = 'f2c8a1d6e4b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('upload_blobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('processed', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade():
+    with op.batch_alter_table('upload_blobs', schema=None) as batch_op:
+        batch_op.drop_column('processed')
@@ -0,0 +1,33 @@
+"""add order phone change queue and orders.phone index
+
+Revision ID: b5e1c7d9f3a2
+Revises: a7d3f9e2c5b8
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e1c7d9f3a2'
+down_revision = 'a7d3f9e2c5b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('order_phone_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('phone', sa.String(length=20), nullable=False),
+    sa.Column('create_time', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_orders_phone'), ['phone'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_orders_phone'))
+    op.drop_table('order_phone_changes')
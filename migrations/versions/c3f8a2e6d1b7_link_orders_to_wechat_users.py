@@ -0,0 +1,56 @@
+"""link orders to wechat users by foreign key
+
+Revision ID: c3f8a2e6d1b7
+Revises: b5e1c7d9f3a2
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f8a2e6d1b7'
+down_revision = 'b5e1c7d9f3a2'
+branch_labels = None
+depends_on = None
+
+# 回填时每条 UPDATE 处理的订单ID范围
+BACKFILL_BATCH_SIZE = 5000
+
+orders = sa.table('orders',
+    sa.column('id', sa.Integer),
+    sa.column('phone', sa.String),
+    sa.column('wechat_user_id', sa.Integer)
+)
+wechat_users = sa.table('wechat_users',
+    sa.column('id', sa.Integer),
+    sa.column('phone', sa.String)
+)
+
+
+def upgrade():
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('wechat_user_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_orders_wechat_user_id'), ['wechat_user_id'], unique=False)
+        batch_op.create_foreign_key('fk_orders_wechat_user_id', 'wechat_users',
+                                    ['wechat_user_id'], ['id'], ondelete='SET NULL')
+
+    # 按订单ID分段回填，每段一条 UPDATE（按 wechat_users.phone 唯一索引查找）
+    bind = op.get_bind()
+    max_id = bind.execute(sa.select(sa.func.max(orders.c.id))).scalar() or 0
+    user_id = sa.select(wechat_users.c.id).where(
+        wechat_users.c.phone == orders.c.phone
+    ).scalar_subquery()
+    for start in range(0, max_id, BACKFILL_BATCH_SIZE):
+        bind.execute(orders.update().where(
+            orders.c.id > start,
+            orders.c.id <= start + BACKFILL_BATCH_SIZE
+        ).values(wechat_user_id=user_id))
+
+
+def downgrade():
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_orders_wechat_user_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_orders_wechat_user_id'))
+        batch_op.drop_column('wechat_user_id')
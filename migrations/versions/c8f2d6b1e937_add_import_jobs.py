@@ -0,0 +1,68 @@
+"""add import job tables
+
+Revision ID: c8f2d6b1e937
+Revises: a41d7e8c5f20
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f2d6b1e937'
+down_revision = 'a41d7e8c5f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('import_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('filename', sa.String(length=256), nullable=True),
+    sa.Column('file_path', sa.String(length=256), nullable=True),
+    sa.Column('file_ext', sa.String(length=8), nullable=True),
+    sa.Column('duplicate_policy', sa.String(length=16), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=True),
+    sa.Column('message', sa.Text(), nullable=True),
+    sa.Column('rows_total', sa.Integer(), nullable=True),
+    sa.Column('rows_processed', sa.Integer(), nullable=True),
+    sa.Column('success_count', sa.Integer(), nullable=True),
+    sa.Column('error_count', sa.Integer(), nullable=True),
+    sa.Column('skipped_count', sa.Integer(), nullable=True),
+    sa.Column('chunks_committed', sa.Integer(), nullable=True),
+    sa.Column('chunks_failed', sa.Integer(), nullable=True),
+    sa.Column('checkpoint', sa.Integer(), nullable=True),
+    sa.Column('create_time', sa.DateTime(), nullable=True),
+    sa.Column('update_time', sa.DateTime(), nullable=True),
+    sa.Column('finish_time', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('import_jobs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_import_jobs_status'), ['status'], unique=False)
+        batch_op.create_index(batch_op.f('ix_import_jobs_user_id'), ['user_id'], unique=False)
+
+    op.create_table('import_job_errors',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('job_id', sa.Integer(), nullable=False),
+    sa.Column('row_index', sa.Integer(), nullable=True),
+    sa.Column('message', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['job_id'], ['import_jobs.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('import_job_errors', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_import_job_errors_job_id'), ['job_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('import_job_errors', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_import_job_errors_job_id'))
+
+    op.drop_table('import_job_errors')
+    with op.batch_alter_table('import_jobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_import_jobs_user_id'))
+        batch_op.drop_index(batch_op.f('ix_import_jobs_status'))
+
+    op.drop_table('import_jobs')
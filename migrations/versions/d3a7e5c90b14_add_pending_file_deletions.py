@@ -0,0 +1,30 @@
+"""add pending file deletion queue
+
+Revision ID: d3a7e5c90b14
+Revises: c8f2d6b1e937
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7e5c90b14'
+down_revision = 'c8f2d6b1e937'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('pending_file_deletions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('path', sa.String(length=256), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('create_time', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('pending_file_deletions')
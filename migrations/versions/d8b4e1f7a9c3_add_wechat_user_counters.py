@@ -0,0 +1,85 @@
+"""add denormalized order counters to wechat users
+
+Revision ID: d8b4e1f7a9c3
+Revises: c3f8a2e6d1b7
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8b4e1f7a9c3'
+down_revision = 'c3f8a2e6d1b7'
+branch_labels = None
+depends_on = None
+
+# 回填时每条 UPDATE 处理的微信用户ID范围
+BACKFILL_BATCH_SIZE = 1000
+
+SETTLED_STATUS = '已结算'
+
+orders = sa.table('orders',
+    sa.column('id', sa.Integer),
+    sa.column('wechat_user_id', sa.Integer),
+    sa.column('amount', sa.Float),
+    sa.column('quantity', sa.Integer),
+    sa.column('status', sa.String),
+    sa.column('create_time', sa.DateTime)
+)
+wechat_users = sa.table('wechat_users',
+    sa.column('id', sa.Integer),
+    sa.column('total_orders', sa.Integer),
+    sa.column('total_amount', sa.Float),
+    sa.column('total_quantity', sa.Integer),
+    sa.column('first_order_time', sa.DateTime),
+    sa.column('last_order_time', sa.DateTime),
+    sa.column('unsettled_amount', sa.Float)
+)
+
+
+def _aggregate(expr):
+    return sa.select(expr).where(orders.c.wechat_user_id == wechat_users.c.id).scalar_subquery()
+
+
+def upgrade():
+    with op.batch_alter_table('wechat_users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_orders', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('total_amount', sa.Float(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('total_quantity', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('first_order_time', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('last_order_time', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('unsettled_amount', sa.Float(), nullable=False, server_default='0'))
+        batch_op.create_index(batch_op.f('ix_wechat_users_total_amount'), ['total_amount'], unique=False)
+        batch_op.create_index(batch_op.f('ix_wechat_users_last_order_time'), ['last_order_time'], unique=False)
+
+    # 按微信用户ID分段回填（订单按 ix_orders_wechat_user_id 索引聚合）
+    bind = op.get_bind()
+    max_id = bind.execute(sa.select(sa.func.max(wechat_users.c.id))).scalar() or 0
+    unsettled = sa.case((sa.func.coalesce(orders.c.status, '') != SETTLED_STATUS, orders.c.amount))
+    values = {
+        'total_orders': _aggregate(sa.func.count(orders.c.id)),
+        'total_amount': _aggregate(sa.func.coalesce(sa.func.sum(orders.c.amount), 0)),
+        'total_quantity': _aggregate(sa.func.coalesce(sa.func.sum(orders.c.quantity), 0)),
+        'first_order_time': _aggregate(sa.func.min(orders.c.create_time)),
+        'last_order_time': _aggregate(sa.func.max(orders.c.create_time)),
+        'unsettled_amount': _aggregate(sa.func.coalesce(sa.func.sum(unsettled), 0)),
+    }
+    for start in range(0, max_id, BACKFILL_BATCH_SIZE):
+        bind.execute(wechat_users.update().where(
+            wechat_users.c.id > start,
+            wechat_users.c.id <= start + BACKFILL_BATCH_SIZE
+        ).values(**values))
+
+
+def downgrade():
+    with op.batch_alter_table('wechat_users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_wechat_users_last_order_time'))
+        batch_op.drop_index(batch_op.f('ix_wechat_users_total_amount'))
+        batch_op.drop_column('unsettled_amount')
+        batch_op.drop_column('last_order_time')
+        batch_op.drop_column('first_order_time')
+        batch_op.drop_column('total_quantity')
+        batch_op.drop_column('total_amount')
+        batch_op.drop_column('total_orders')
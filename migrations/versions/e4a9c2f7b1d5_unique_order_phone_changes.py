@@ -0,0 +1,36 @@
+"""keep one order phone change row per phone
+
+Revision ID: e4a9c2f7b1d5
+Revises: d8b4e1f7a9c3
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a9c2f7b1d5'
+down_revision = 'd8b4e1f7a9c3'
+branch_labels = None
+depends_on = None
+
+order_phone_changes = sa.table('order_phone_changes',
+    sa.column('id', sa.Integer),
+    sa.column('phone', sa.String)
+)
+
+
+def upgrade():
+    # 每个手机号只保留最早登记的一行
+    first_ids = sa.select(sa.func.min(order_phone_changes.c.id)).group_by(order_phone_changes.c.phone)
+    op.execute(order_phone_changes.delete().where(
+        order_phone_changes.c.id.notin_(sa.select(first_ids.subquery()))
+    ))
+    with op.batch_alter_table('order_phone_changes', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_order_phone_changes_phone', ['phone'])
+
+
+def downgrade():
+    with op.batch_alter_table('order_phone_changes', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_order_phone_changes_phone', type_='unique')
@@ -0,0 +1,26 @@
+"""index order_images.image_path for upload reconciliation
+
+Revision ID: e91b4c2f7a06
+Revises: d3a7e5c90b14
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e91b4c2f7a06'
+down_revision = 'd3a7e5c90b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order_images', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_order_images_image_path'), ['image_path'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order_images', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_order_images_image_path'))
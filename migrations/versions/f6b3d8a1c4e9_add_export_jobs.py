@@ -0,0 +1,58 @@
+"""persist export jobs and the shared data version
+
+Revision ID: f6b3d8a1c4e9
+Revises: e4a9c2f7b1d5
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6b3d8a1c4e9'
+down_revision = 'e4a9c2f7b1d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('export_jobs',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('key', sa.String(length=40), nullable=True),
+    sa.Column('fmt', sa.String(length=8), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=True),
+    sa.Column('written', sa.Integer(), nullable=True),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('path', sa.String(length=256), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('cached', sa.Boolean(), nullable=True),
+    sa.Column('create_time', sa.DateTime(), nullable=True),
+    sa.Column('finish_time', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('export_jobs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_export_jobs_user_id'), ['user_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_export_jobs_key'), ['key'], unique=False)
+        batch_op.create_index(batch_op.f('ix_export_jobs_status'), ['status'], unique=False)
+        batch_op.create_index(batch_op.f('ix_export_jobs_finish_time'), ['finish_time'], unique=False)
+
+    data_versions = op.create_table('data_versions',
+    sa.Column('name', sa.String(length=32), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(data_versions, [{'name': 'orders', 'version': 0}])
+
+
+def downgrade():
+    op.drop_table('data_versions')
+    with op.batch_alter_table('export_jobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_export_jobs_finish_time'))
+        batch_op.drop_index(batch_op.f('ix_export_jobs_status'))
+        batch_op.drop_index(batch_op.f('ix_export_jobs_key'))
+        batch_op.drop_index(batch_op.f('ix_export_jobs_user_id'))
+    op.drop_table('export_jobs')
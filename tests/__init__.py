@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+import os
+
+# 测试默认使用内存数据库（须在导入配置前设置）
+os.environ.setdefault('TEST_DATABASE_URL', 'sqlite://')
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""测试基类：每个测试使用新建的数据库和临时上传目录"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from app import create_app, db
+from app.models import Role, User, Order, OrderType, OrderField
+
+
+class AppTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.tmp_dir = tempfile.mkdtemp()
+        for key in ('UPLOAD_FOLDER', 'THUMBNAIL_FOLDER', 'EXPORT_FOLDER', 'IMPORT_FOLDER'):
+            self.app.config[key] = os.path.join(self.tmp_dir, key.lower())
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['IMAGE_TRANSCODE'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        OrderType.insert_default_types()
+        OrderField.insert_default_fields()
+        self.user = User(email='admin@example.com', username='admin', password='x')
+        db.session.add(self.user)
+        db.session.commit()
+
+        # 待删除文件由测试显式调用 purge_pending_files 处理，不启动后台清理线程
+        patcher = mock.patch('app.file_cleanup.wake_janitor')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def add_order(self, code, phone='13800000000', commit=True, **fields):
+        values = dict(order_code=code, wechat_name='name', phone=phone, order_info='info',
+                      user_id=self.user.id, order_type_id=1, status='未完成',
+                      completion_time=datetime(2024, 1, 1, 12), create_time=datetime(2024, 1, 1, 12))
+        values.update(fields)
+        order = Order(**values)
+        db.session.add(order)
+        if commit:
+            db.session.commit()
+        return order
+
+    def upload_file(self, relative_path, data=b'data'):
+        """在临时上传目录中写入文件，返回磁盘路径"""
+        path = os.path.join(self.app.config['UPLOAD_FOLDER'], *relative_path.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    @staticmethod
+    def days(n):
+        return timedelta(days=n)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+from app import db
+from app.models import OrderImage, UploadBlob
+from app.blob_store import dedupe_uploads, is_blob_path, release_files, store_upload
+from app.file_cleanup import purge_pending_files
+from tests.base import AppTestCase
+
+
+class DedupeUploadsTestCase(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.order = self.add_order('C1')
+
+    def add_image(self, path):
+        image = OrderImage(order_id=self.order.id, image_path=path)
+        db.session.add(image)
+        db.session.commit()
+        return image
+
+    def dedupe(self):
+        report = dedupe_uploads(self.app, batch_size=2)
+        purge_pending_files(self.app)
+        db.session.expire_all()
+        return report
+
+    def assert_readable(self, image):
+        self.assertTrue(is_blob_path(image.image_path), image.image_path)
+        self.assertTrue(os.path.isfile(os.path.join(self.app.config['UPLOAD_FOLDER'], image.image_path)))
+
+    def test_legacy_path_forms_are_repointed(self):
+        self.upload_file('orders/a.jpg', b'a')
+        self.upload_file('orders/b.jpg', b'b')
+        self.upload_file('orders/c.jpg', b'c')
+        images = [
+            self.add_image('orders\\a.jpg'),
+            self.add_image('uploads/orders/b.jpg'),
+            self.add_image('uploads\\orders\\c.jpg'),
+            self.add_image('orders/c.jpg'),
+        ]
+        report = self.dedupe()
+        self.assertTrue(report.finished)
+        self.assertEqual(report.missing, 0)
+        for image in images:
+            self.assert_readable(image)
+        self.assertEqual(images[2].image_path, images[3].image_path)
+        self.assertFalse(os.path.exists(os.path.join(self.app.config['UPLOAD_FOLDER'], 'orders', 'a.jpg')))
+        counts = {blob.path: blob.ref_count for blob in UploadBlob.query}
+        self.assertEqual(counts[images[2].image_path], 2)
+        self.assertEqual(sorted(counts.values()), [1, 1, 2])
+
+    def test_identical_files_share_one_blob(self):
+        self.upload_file('orders/x.jpg', b'same')
+        self.upload_file('orders/y.jpg', b'same')
+        first, second = self.add_image('orders/x.jpg'), self.add_image('orders\\y.jpg')
+        report = self.dedupe()
+        self.assertEqual((report.migrated, report.duplicates), (1, 1))
+        self.assertEqual(first.image_path, second.image_path)
+        self.assertEqual([blob.ref_count for blob in UploadBlob.query], [2])
+        self.assert_readable(first)
+
+    def test_missing_file_keeps_reference(self):
+        image = self.add_image('orders\\gone.jpg')
+        report = self.dedupe()
+        self.assertEqual(report.missing, 1)
+        self.assertEqual(image.image_path, 'orders\\gone.jpg')
+        self.assertEqual(UploadBlob.query.count(), 0)
+
+
+class BlobRefCountTestCase(AppTestCase):
+
+    def store(self, data):
+        return store_upload(self.app, io.BytesIO(data), 'jpg')
+
+    def test_refcount_follows_references(self):
+        order = self.add_order('C1')
+        # 每次上传登记一次引用，相同内容只保存一份
+        path = self.store(b'content')
+        self.assertEqual(self.store(b'content'), path)
+        db.session.add_all([OrderImage(order_id=order.id, image_path=path) for _ in range(2)])
+        db.session.commit()
+        blob = UploadBlob.query.filter_by(path=path).one()
+        self.assertEqual(blob.ref_count, 2)
+
+        release_files([path])
+        db.session.commit()
+        self.assertEqual(UploadBlob.query.filter_by(path=path).one().ref_count, 1)
+
+        release_files([path])
+        db.session.commit()
+        purge_pending_files(self.app)
+        self.assertEqual(UploadBlob.query.filter_by(path=path).count(), 0)
+        self.assertFalse(os.path.exists(os.path.join(self.app.config['UPLOAD_FOLDER'], path)))
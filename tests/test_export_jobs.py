@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import os
+from unittest import mock
+from app import db
+from app.models import DataVersion, ExportJob
+from app.order_stats import OrderFilter
+from app import export_jobs
+from app.export_jobs import data_version, get_job, submit_export, _run_export
+from tests.base import AppTestCase
+
+
+class ImmediateExecutor:
+    """在调用线程中立即执行任务"""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+class ExportJobTestCase(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(export_jobs, '_get_executor', return_value=ImmediateExecutor())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.add_order('C1', amount=10)
+        self.user_id = self.user.id
+
+    def submit(self):
+        job = submit_export(self.app, self.user_id, OrderFilter(), 'csv')
+        # 任务在另一个会话中执行
+        db.session.expire_all()
+        return db.session.get(ExportJob, job.id)
+
+    def bump_from_another_process(self):
+        # 其它工作进程的写入只改变数据库中的版本号
+        table = DataVersion.__table__
+        db.session.execute(table.update().values(version=table.c.version + 1))
+        db.session.commit()
+
+    def test_cached_result_is_shared_until_version_changes(self):
+        first = self.submit()
+        self.assertEqual((first.status, first.cached, first.written), ('done', False, 1))
+        second = self.submit()
+        self.assertTrue(second.cached)
+        self.assertEqual(second.path, first.path)
+
+        self.bump_from_another_process()
+        third = self.submit()
+        self.assertFalse(third.cached)
+        self.assertNotEqual(third.path, first.path)
+        # 旧文件仍可由之前的任务下载
+        self.assertTrue(os.path.exists(first.path))
+
+    def test_orm_commit_bumps_shared_version(self):
+        version = data_version()
+        self.add_order('C2')
+        self.assertEqual(data_version(), version + 1)
+
+    def test_stale_job_is_not_used_as_cache(self):
+        job = ExportJob(id='stale', user_id=self.user_id, key=export_jobs.filter_key(OrderFilter(), 'csv'),
+                        fmt='csv', version=data_version(), status='pending')
+        db.session.add(job)
+        db.session.commit()
+        self.bump_from_another_process()
+        fresh = self.submit()
+        _run_export(self.app, 'stale', OrderFilter())
+        db.session.expire_all()
+        stale = db.session.get(ExportJob, 'stale')
+        self.assertEqual(stale.status, 'done')
+        self.assertNotEqual(stale.path, fresh.path)
+        self.assertEqual(self.submit().path, fresh.path)
+
+    def test_jobs_are_visible_only_to_their_owner(self):
+        job = self.submit()
+        db.session.remove()
+        self.assertIsNotNone(get_job(job.id, self.user_id))
+        self.assertIsNone(get_job(job.id, self.user_id + 1))
+
+    def test_large_xlsx_download_becomes_background_job(self):
+        client = self.app.test_client()
+        client.post('/auth/login', data={'account': 'admin@example.com', 'password': 'x'})
+        self.app.config['EXPORT_SYNC_MAX_ROWS'] = 1
+        # 未超过行数上限时直接下载
+        response = client.get('/orders/export')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertEqual(ExportJob.query.count(), 0)
+
+        self.add_order('C2', amount=20)
+        response = client.get('/orders/export?start_date=2024-01-01')
+        self.assertEqual(response.status_code, 302)
+        job = ExportJob.query.one()
+        self.assertEqual((job.fmt, job.status), ('xlsx', 'done'))
+        self.assertIn(f'export_job={job.id}', response.location)
+        self.assertIn('start_date=2024-01-01', response.location)
+        page = client.get(response.location)
+        self.assertIn(f'/orders/export/jobs/{job.id}', page.get_data(as_text=True))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import io
+import struct
+import zlib
+from PIL import Image
+from app.image_processing import check_pixels, process_upload
+from tests.base import AppTestCase
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def png_header(width, height):
+    """声明了尺寸、像素数据为空的PNG（打开时只读取文件头）"""
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', ihdr)
+            + _png_chunk(b'IDAT', zlib.compress(b'')) + _png_chunk(b'IEND', b''))
+
+
+def jpeg(width, height):
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), 'red').save(output, 'JPEG')
+    return output.getvalue()
+
+
+class CheckPixelsTestCase(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['IMAGE_MAX_PIXELS'] = 1000 * 1000
+        self.addCleanup(setattr, Image, 'MAX_IMAGE_PIXELS', Image.MAX_IMAGE_PIXELS)
+
+    def test_rejects_images_over_the_cap(self):
+        with self.assertRaises(ValueError):
+            check_pixels(self.app, jpeg(1200, 1000))
+        check_pixels(self.app, jpeg(1000, 1000))
+
+    def test_rejects_decompression_bombs(self):
+        # 远超上限（Pillow 在打开时即抛出 DecompressionBombError）
+        with self.assertRaises(ValueError):
+            check_pixels(self.app, png_header(20000, 10000))
+        self.app.config['IMAGE_MAX_PIXELS'] = 80000000
+        with self.assertRaises(ValueError):
+            process_upload(self.app, io.BytesIO(png_header(20000, 10000)), 'png')
+
+    def test_unrecognized_data_is_left_to_later_checks(self):
+        check_pixels(self.app, b'not an image')
+        stream, ext, processed = process_upload(self.app, io.BytesIO(jpeg(10, 10)), 'jpg')
+        self.assertEqual((ext, processed), ('jpg', False))
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from app.models import Order
+from app.pagination import KeysetPagination, decode_cursor, encode_cursor
+from tests.base import AppTestCase
+
+
+class KeysetPaginationTestCase(AppTestCase):
+    """游标翻页应不重不漏，顺序与 排序列 DESC NULLS LAST, id DESC 一致"""
+
+    AMOUNTS = [5, None, 10, 5, None, 10, 10, 1, 5, None]
+
+    def setUp(self):
+        super().setUp()
+        for i, amount in enumerate(self.AMOUNTS):
+            self.add_order(f'C{i}', amount=amount, completion_time=datetime(2024, 1, 1 + i % 3, 12))
+
+    def page(self, column=Order.amount, cursor=None, per_page=3, sort_key='amount'):
+        return KeysetPagination(Order.query, column, Order.id, sort_key, cursor=cursor, per_page=per_page)
+
+    def expected(self, column=Order.amount):
+        return [order.id for order in Order.query.order_by(column.desc().nullslast(), Order.id.desc())]
+
+    def walk_forward(self, column=Order.amount, per_page=3, sort_key='amount'):
+        pages = [self.page(column, per_page=per_page, sort_key=sort_key)]
+        while pages[-1].next_cursor:
+            pages.append(self.page(column, pages[-1].next_cursor, per_page, sort_key))
+        return pages
+
+    def ids(self, pages):
+        return [[order.id for order in page.items] for page in pages]
+
+    def test_forward_covers_ties_and_nulls_once(self):
+        pages = self.walk_forward()
+        self.assertEqual(sum(self.ids(pages), []), self.expected())
+        self.assertEqual([len(page.items) for page in pages], [3, 3, 3, 1])
+        self.assertEqual([(page.has_prev, page.has_next) for page in (pages[0], pages[-1])],
+                         [(False, True), (True, False)])
+
+    def test_backward_returns_the_same_pages(self):
+        pages = self.walk_forward()
+        back = [pages[-1]]
+        while back[-1].prev_cursor:
+            back.append(self.page(cursor=back[-1].prev_cursor))
+        self.assertEqual(self.ids(reversed(back)), self.ids(pages))
+        # 回到首页时没有上一页
+        self.assertFalse(back[-1].has_prev)
+
+    def test_exact_multiple_has_no_empty_last_page(self):
+        pages = self.walk_forward(per_page=5)
+        self.assertEqual([len(page.items) for page in pages], [5, 5])
+        self.assertIsNone(pages[-1].next_cursor)
+
+    def test_datetime_column(self):
+        pages = self.walk_forward(Order.completion_time, sort_key='time')
+        self.assertEqual(sum(self.ids(pages), []), self.expected(Order.completion_time))
+
+    def test_empty_result(self):
+        page = KeysetPagination(Order.query.filter(Order.id < 0), Order.amount, Order.id, 'amount', per_page=3)
+        self.assertEqual((page.items, page.has_next, page.has_prev), ([], False, False))
+        self.assertIsNone(page.next_cursor)
+        self.assertIsNone(page.prev_cursor)
+
+    def test_invalid_or_foreign_cursor_starts_from_first_page(self):
+        first = self.ids([self.page()])
+        foreign = encode_cursor('time', datetime(2024, 1, 1), 1, 'next')
+        for cursor in ('garbage', foreign):
+            self.assertEqual(self.ids([self.page(cursor=cursor)]), first)
+
+    def test_cursor_round_trip(self):
+        value = datetime(2024, 1, 2, 3, 4, 5)
+        self.assertEqual(decode_cursor(encode_cursor('time', value, 7, 'prev'), 'time'), (value, 7, 'prev'))
+        self.assertEqual(decode_cursor(encode_cursor('amount', None, 3, 'next'), 'amount'), (None, 3, 'next'))
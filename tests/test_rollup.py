@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from app import db
+from app.models import DailyOrderRollup, Order, OrderType, User
+from app.imports import insert_orders, upsert_orders
+from app.order_batch import delete_orders, update_orders_status
+from app.rollup import rebuild_rollup
+from tests.base import AppTestCase
+
+
+class RollupTestCase(AppTestCase):
+    """增量维护的汇总表应与按订单重建的结果一致"""
+
+    def snapshot(self):
+        db.session.expire_all()
+        return sorted(
+            (row.day, row.user_id, row.order_type_id, row.status, row.order_count,
+             round(row.total_amount, 4), row.total_quantity)
+            for row in DailyOrderRollup.query.filter(DailyOrderRollup.order_count != 0)
+        )
+
+    def assert_exact(self):
+        incremental = self.snapshot()
+        rebuild_rollup()
+        db.session.commit()
+        self.assertEqual(incremental, self.snapshot())
+        return incremental
+
+    def setUp(self):
+        super().setUp()
+        self.other = User(email='u@example.com', username='u', password='x')
+        db.session.add(self.other)
+        db.session.commit()
+        for i in range(6):
+            self.add_order(f'C{i}', amount=10 * i or None, quantity=i % 3 + 1,
+                           completion_time=datetime(2024, 1, 1 + i % 3, 12), status=['未完成', '已完成'][i % 2])
+
+    def test_create(self):
+        rows = self.assert_exact()
+        self.assertEqual(sum(row[4] for row in rows), 6)
+
+    def test_edit_unloaded_values(self):
+        order = Order.query.filter_by(order_code='C1').one()
+        order_id = order.id
+        db.session.expire_all()
+        # 旧值未加载时修改，依赖 active_history 取得旧值
+        order = db.session.get(Order, order_id)
+        db.session.expire(order)
+        order.amount = 99
+        order.quantity = 7
+        order.completion_time = datetime(2024, 2, 1)
+        order.user_id = self.other.id
+        order.order_type_id = OrderType.query.order_by(OrderType.id.desc()).first().id
+        order.status = '已结算'
+        db.session.commit()
+        self.assert_exact()
+
+    def test_status_update(self):
+        ids = [order.id for order in Order.query]
+        result = update_orders_status(ids, '已完成')
+        db.session.commit()
+        self.assertEqual(result.changed, 3)
+        self.assert_exact()
+
+    def test_delete(self):
+        ids = [order.id for order in Order.query.limit(4)]
+        delete_orders(ids)
+        db.session.commit()
+        db.session.delete(Order.query.first())
+        db.session.commit()
+        rows = self.assert_exact()
+        self.assertEqual(sum(row[4] for row in rows), 1)
+
+    def test_import(self):
+        record = dict(order_code='IMP1', wechat_name='imp', phone='13900000000', order_info='x',
+                      completion_time=datetime(2024, 1, 5), quantity=2, amount=5.0,
+                      user_id=self.user.id, order_type_id=1, status='未完成', create_time=datetime(2024, 1, 5))
+        insert_orders([record])
+        db.session.commit()
+        self.assert_exact()
+        upsert_orders([dict(record, order_code='C2', amount=50.0, status='已结算')], ['amount', 'status'])
+        db.session.commit()
+        self.assert_exact()
+
+    def test_rollback_discards_delta(self):
+        before = self.snapshot()
+        self.add_order('RB', amount=1, commit=False)
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.snapshot(), before)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from app import db
+from app.models import Order, WechatUser
+from app.imports import insert_orders, upsert_orders
+from app.order_batch import delete_orders, update_orders_status
+from app.wechat_users import verify_counters
+from tests.base import AppTestCase
+
+PHONE = '13800000000'
+OTHER_PHONE = '13900000000'
+
+
+class WechatCounterTestCase(AppTestCase):
+    """微信用户的冗余统计应与按订单聚合的结果一致"""
+
+    def setUp(self):
+        super().setUp()
+        for i in range(4):
+            self.add_order(f'C{i}', amount=10 * i or None, quantity=i + 1,
+                           create_time=datetime(2024, 1, 1 + i), status=['未完成', '已结算'][i % 2])
+
+    def wechat_user(self, phone=PHONE):
+        db.session.expire_all()
+        return WechatUser.query.filter_by(phone=phone).one()
+
+    def assert_exact(self):
+        self.assertEqual(verify_counters(), [])
+
+    def test_create(self):
+        self.assert_exact()
+        user = self.wechat_user()
+        self.assertEqual((user.total_orders, user.amount_orders, user.total_amount, user.total_quantity),
+                         (4, 3, 60, 10))
+        self.assertEqual((user.first_order_time, user.last_order_time),
+                         (datetime(2024, 1, 1), datetime(2024, 1, 4)))
+        # 已结算的 C1、C3 不计入未结算金额
+        self.assertEqual(user.unsettled_amount, 20)
+
+    def test_edit(self):
+        order = Order.query.filter_by(order_code='C0').one()
+        order.amount = 5
+        order.quantity = 9
+        db.session.commit()
+        self.assert_exact()
+        self.assertEqual(self.wechat_user().amount_orders, 4)
+
+        # 改手机号后两个微信用户的统计都要更新
+        order = Order.query.filter_by(order_code='C3').one()
+        order.phone = OTHER_PHONE
+        db.session.commit()
+        self.assert_exact()
+        self.assertEqual(self.wechat_user().total_orders, 3)
+        self.assertEqual(self.wechat_user(OTHER_PHONE).total_amount, 30)
+
+    def test_status_change(self):
+        update_orders_status([order.id for order in Order.query], '已结算')
+        db.session.commit()
+        self.assert_exact()
+        self.assertEqual(self.wechat_user().unsettled_amount, 0)
+
+    def test_delete(self):
+        first, last = Order.query.order_by(Order.create_time).first(), Order.query.order_by(Order.create_time.desc()).first()
+        delete_orders([first.id])
+        db.session.commit()
+        db.session.delete(last)
+        db.session.commit()
+        self.assert_exact()
+        user = self.wechat_user()
+        self.assertEqual((user.total_orders, user.first_order_time, user.last_order_time),
+                         (2, datetime(2024, 1, 2), datetime(2024, 1, 3)))
+
+    def test_import(self):
+        record = dict(order_code='IMP1', wechat_name='imp', phone=OTHER_PHONE, order_info='x',
+                      completion_time=datetime(2024, 1, 5), quantity=2, amount=5.0,
+                      user_id=self.user.id, order_type_id=1, status='未完成', create_time=datetime(2024, 1, 5))
+        insert_orders([record])
+        db.session.commit()
+        self.assert_exact()
+        self.assertEqual(self.wechat_user(OTHER_PHONE).total_orders, 1)
+
+        upsert_orders([dict(record, order_code='C0', phone=PHONE, amount=50.0, status='已结算')],
+                      ['amount', 'status'])
+        db.session.commit()
+        self.assert_exact()
+        self.assertEqual(self.wechat_user().total_amount, 110)
+
+    def test_average_skips_orders_without_amount(self):
+        # 不限日期时读取统计字段，限定日期时查询订单，两者平均金额口径一致（不计未填金额的订单）
+        user = self.wechat_user()
+        stored = user.get_order_stats()
+        queried = user.get_order_stats(start_date=datetime(2024, 1, 1))
+        self.assertEqual(stored, queried)
+        self.assertEqual(stored['avg_amount'], 20)
+
+    def test_verify_repairs_drift(self):
+        table = WechatUser.__table__
+        db.session.execute(table.update().values(total_orders=0, amount_orders=0))
+        db.session.commit()
+        mismatches = verify_counters(repair=True)
+        self.assertEqual(mismatches[0][1]['amount_orders'], (0, 3))
+        db.session.commit()
+        self.assert_exact()